@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# requires Python 3.9+
+
+"""
+Benchmarks DNS_times_parser.py's parse_gen() against the original
+strptime-based parser (kept here as legacy_parse_gen() for reference) and
+checks both produce the same DNS_packet output.
+
+Usage:
+    ./DNS_times_benchmark.py [--input assets/tcpdump_test.out] [--repeat 5000]
+                             [--pcap_input assets/tcpdump_test.pcap]
+                             [--synthetic_requests 20000]
+
+The same traffic read by pcap_gen() from a pcap capture is also timed.
+
+Then each stage of the live display pipeline is measured on its own (lines/s
+and peak memory) using synthetic traffic from DNS_times_generate.py:
+
+               parse_gen - parsing tcpdump lines into DNS_packets
+   correlation and stats - process() matching responses to requests and
+                           updating each DNS server's stats (headless)
+           title updates - ServerTitles.Update() calls while process() runs
+                           with the display
+  ScrollRegion rendering - ScrollRegion AddLine()/SetTitle() calls (the
+                           ones process() made) writing to a null terminal
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import datetime
+import tracemalloc
+from contextlib import redirect_stdout
+import DNS_times_parser
+from DNS_times_parser import parse_gen, process
+from DNS_times_pcap import pcap_gen
+from DNS_times_generate import traffic_gen
+
+
+def time2float(t):
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+
+def legacy_parse_gen(f):
+    """
+    original strptime-based parse_gen() (yields DNS_packet fields up to
+    query_address as a tuple with time as a datetime.time)
+    """
+    for line in f:
+        parts = line.strip().split(" ")
+
+        while len(parts) < 10:
+            parts.append("@")
+
+        if len(parts) > 5:
+            time = parts[0]
+            reqid = parts[5]
+
+            t = datetime.datetime.strptime(time, '%H:%M:%S.%f').time()
+
+            if reqid.endswith('%'):
+                reqid = reqid[:-1]
+
+            if reqid.endswith('+'):
+                reqid = reqid[:-1]
+
+            # response header flags, which the original parser left on the ID
+            # (so flagged responses never matched) and line_parser now strips
+            reqid = reqid.rstrip('*-|$')
+
+            dst_address = parts[4]
+            is_req = dst_address.endswith('.53:')
+
+            src_address = parts[2].rsplit(".", 1)[0]
+            dst_address = dst_address.rsplit(".", 1)[0]
+
+            if is_req:
+                if parts[6][0] == "[":
+                    parts[6] = parts[7]
+                    parts[7] = parts[8]
+                    parts[8] = ""
+
+                yield (t, reqid, is_req, parts[1],
+                       src_address, dst_address, parts[6], parts[7])
+            else:
+                if parts[6].upper() == "NXDOMAIN":
+                    parts[7] = "-"
+                    parts[8] = "NXDomain"
+                elif parts[6].startswith("0/"):
+                    parts[7] = "-"
+                    parts[8] = "NoRecord"
+                elif parts[7].upper() == "TYPE65":
+                    parts[7] = "TYPE65_ENCODED_DATA"
+                    parts[8] = "-"
+
+                yield (t, reqid, is_req, parts[1],
+                       src_address, dst_address, parts[7], parts[8])
+
+
+def check_same_output(lines):
+    """
+    raises ValueError if parse_gen() and legacy_parse_gen() disagree on lines
+    """
+    old_packets = list(legacy_parse_gen(lines))
+    new_packets = list(parse_gen(lines))
+    if len(old_packets) != len(new_packets):
+        raise ValueError(f"parser mismatch: {len(old_packets)} vs "
+                         f"{len(new_packets)} packets")
+
+    for old, new in zip(old_packets, new_packets):
+        if (old[1:] != new[1:len(old)] or
+            abs(time2float(old[0]) - new.time) > 1e-6):
+            raise ValueError(f"parser mismatch:\n  {old}\n  {new}")
+
+
+def lines_per_s(parser, lines):
+    """
+    returns lines/sec parser takes to consume lines
+    """
+    start = time.perf_counter()
+    for _ in parser(lines):
+        pass
+    return len(lines) / (time.perf_counter() - start)
+
+
+class NullTerminal:
+    """
+    sys.stdout stand-in that discards everything written to it
+    """
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class NullRecordWriter:
+    """
+    DNS_times_output.RecordWriter stand-in that discards every record
+    """
+    def Write(self, request, response, dt_s, source, first_dt_s, attempts):
+        pass
+
+
+class RecordingScrollRegion:
+    """
+    ScrollRegion stand-in that only records the titles and lines process()
+    gives it (so they can be replayed into real ScrollRegions)
+    """
+    # (title, scroll_region_height) of each instance created
+    regions = []
+    # (instance number, is title, text) of each SetTitle()/AddLine() call
+    calls = []
+
+    def __init__(self, title = "", scroll_region_height = 8):
+        self.number = len(RecordingScrollRegion.regions)
+        RecordingScrollRegion.regions.append((title, scroll_region_height))
+
+    def SetTitle(self, title):
+        RecordingScrollRegion.calls.append((self.number, True, title))
+
+    def AddLine(self, line, scroll_delay_s = 0):
+        RecordingScrollRegion.calls.append((self.number, False, line))
+
+
+def measure(run):
+    """
+    returns (seconds, peak bytes allocated) of run() - timed and traced in
+    separate runs since tracemalloc slows allocation
+
+    run(timed) returns None to be measured as a whole, or else the seconds
+    and peak bytes it measured for the part of itself being benchmarked
+    (seconds when timed is True)
+    """
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    peak = run(False)
+    if peak is None:
+        peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    seconds = run(True)
+    if seconds is None:
+        seconds = time.perf_counter() - start
+    return seconds, peak
+
+
+def stage_benchmarks(requests, servers):
+    """
+    prints lines/s and peak memory of each live display pipeline stage on
+    synthetic traffic of requests DNS requests to servers DNS servers
+    (lines/s is input lines divided by the time spent in the stage)
+    """
+    lines = list(traffic_gen(requests=requests, servers=servers))
+    packets = list(parse_gen(lines))
+
+    def run_parse(timed):
+        for _ in parse_gen(lines):
+            pass
+
+    def run_correlation(timed):
+        process(iter(packets), False, False,
+                record_writer=NullRecordWriter())
+
+    def run_titles(timed):
+        # time (or trace the allocations of) each ServerTitles.Update() call
+        # process() makes
+        totals = [0, 0]
+        update = DNS_times_parser.ServerTitles.Update
+
+        def measured_update(self, changed_server_names):
+            if timed:
+                start = time.perf_counter()
+                update(self, changed_server_names)
+                totals[0] += time.perf_counter() - start
+            else:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                update(self, changed_server_names)
+                totals[1] = max(totals[1],
+                                tracemalloc.get_traced_memory()[1] - base)
+
+        RecordingScrollRegion.regions = []
+        RecordingScrollRegion.calls = []
+        DNS_times_parser.ServerTitles.Update = measured_update
+        try:
+            process(iter(packets), False, False,
+                    scroll_region_class=RecordingScrollRegion)
+        finally:
+            DNS_times_parser.ServerTitles.Update = update
+        return totals[0] if timed else totals[1]
+
+    results = [("parse_gen", measure(run_parse)),
+               ("correlation and stats", measure(run_correlation)),
+               ("title updates", measure(run_titles))]
+
+    # replay the scroll region calls process() made into real ScrollRegions
+    # (created once - they can't be removed from the display again) writing
+    # to a null terminal of a fixed size
+    os.environ.setdefault("COLUMNS", "160")
+    os.environ.setdefault("LINES", "50")
+    with redirect_stdout(NullTerminal()):
+        from TerminalScrollRegionsDisplay.ScrollRegion import ScrollRegion
+        scroll_regions = [ScrollRegion(title, scroll_region_height)
+                          for title, scroll_region_height
+                          in RecordingScrollRegion.regions]
+
+        def run_rendering(timed):
+            for number, is_title, text in RecordingScrollRegion.calls:
+                if is_title:
+                    scroll_regions[number].SetTitle(text)
+                else:
+                    scroll_regions[number].AddLine(text, 0)
+
+        results.append(("ScrollRegion rendering", measure(run_rendering)))
+
+    print(f"\n{len(lines):,} synthetic lines ({requests:,} requests to "
+          f"{servers} DNS servers)")
+    for name, (seconds, peak) in results:
+        print(f"{name:<24}{len(lines) / seconds:>12,.0f} lines/s"
+              f"{peak / 2**20:>10.2f} MiB peak")
+
+    # the ScrollRegions write their done message to the terminal when
+    # they're garbage collected at exit - discard it too
+    sys.stdout.flush()
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input",
+                        default="assets/tcpdump_test.out",
+                        help="tcpdump text output file to parse")
+    parser.add_argument("--pcap_input",
+                        default="assets/tcpdump_test.pcap",
+                        help="pcap capture of the same traffic as --input")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5000,
+                        help="number of times to repeat input lines")
+    parser.add_argument("--synthetic_requests",
+                        type=int,
+                        default=20000,
+                        help="number of synthetic DNS requests for the "
+                             "pipeline stage benchmarks (0 to skip them)")
+    parser.add_argument("--synthetic_servers",
+                        type=int,
+                        default=4,
+                        help="number of synthetic DNS servers")
+    args = parser.parse_args()
+
+    with open(args.input) as f:
+        lines = f.readlines()
+
+    check_same_output(lines)
+    print(f"parse_gen() output matches legacy parser on {args.input}")
+
+    lines *= args.repeat
+    old = lines_per_s(legacy_parse_gen, lines)
+    new = lines_per_s(parse_gen, lines)
+    print(f"{'legacy_parse_gen':<20}{old:>12,.0f} lines/s")
+    print(f"{'parse_gen':<20}{new:>12,.0f} lines/s  ({new / old:.1f}x)")
+
+    # repeat the pcap's packet records after its file header
+    with open(args.pcap_input, "rb") as f:
+        pcap = f.read()
+    pcap = pcap[:24] + pcap[24:] * args.repeat
+    packet_count = sum(1 for p in pcap_gen(io.BytesIO(pcap)))
+    start = time.perf_counter()
+    for _ in pcap_gen(io.BytesIO(pcap)):
+        pass
+    pcap_rate = packet_count / (time.perf_counter() - start)
+    print(f"{'pcap_gen':<20}{pcap_rate:>12,.0f} packets/s  "
+          f"({pcap_rate / old:.1f}x)")
+
+    if args.synthetic_requests > 0:
+        stage_benchmarks(args.synthetic_requests, args.synthetic_servers)
+
+
+if __name__ == "__main__":
+    main()
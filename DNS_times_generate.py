@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# requires Python 3.6+
+
+"""
+Generates synthetic DNS traffic in tcpdump text output format (the same
+lines tcpdump -l -n port 53 writes) for benchmarks and load tests.
+
+The traffic is deterministic - the same arguments (and --seed) always
+generate the same lines - and can be generated at any scale since lines are
+produced as they're needed. Requests arrive at random (exponential) intervals
+from a set of IPv4 and IPv6 clients, each to a random DNS server. Each DNS
+server answers after a random (lognormal) latency around its own median, so
+responses from several servers interleave with the requests the way they do
+in a real capture, and some responses are lost.
+
+Usage:
+    ./DNS_times_generate.py [--requests 100000] [--servers 4] [--seed 0]
+                            [--latency_ms 10,20,40,80] ... > traffic.out
+    ./DNS_times_generate.py --requests 1000000 | ./DNS_times_parser.py
+"""
+
+import os
+import sys
+import math
+import heapq
+import random
+import itertools
+import argparse
+
+# default request type mix (name, weight)
+DEFAULT_QTYPES = (("A", 60), ("AAAA", 30), ("Type65", 10))
+
+# time of day (seconds) the default clock timestamps start at, and the time
+# -tt epoch timestamps start at
+START_CLOCK_S = 13 * 3600.0
+START_EPOCH_S = 1618259089.0
+
+# seconds between the requests of a hedged request to each DNS server
+HEDGE_INTERVAL_S = 0.0001
+
+
+def parse_weights(arg):
+    """
+    returns ((name, weight), ...) from a "NAME=WEIGHT,NAME=WEIGHT" string
+    """
+    weights = []
+    for item in arg.split(","):
+        name, _, weight = item.partition("=")
+        weights.append((name, float(weight) if weight else 1.0))
+    return tuple(weights)
+
+
+def format_clock(t):
+    """
+    returns tcpdump's default HH:MM:SS.ffffff timestamp for t seconds
+    """
+    us = round(t * 1e6)
+    s, us = divmod(us, 1000000)
+    return f"{s // 3600 % 24:02}:{s // 60 % 60:02}:{s % 60:02}.{us:06}"
+
+
+def format_epoch(t):
+    """
+    returns tcpdump -tt's seconds since the epoch timestamp for t seconds
+    """
+    return f"{t:.6f}"
+
+
+def answer_records(rng, qtype, answer_count):
+    """
+    returns tcpdump's text of answer_count answer records to a qtype request
+    """
+    if qtype == "A":
+        return ", ".join(f"A 203.0.{rng.randrange(256)}.{rng.randrange(256)}"
+                         for _ in range(answer_count))
+    if qtype == "AAAA":
+        return ", ".join(f"AAAA 2001:db8:{rng.randrange(65536):x}::"
+                         f"{rng.randrange(65536):x}"
+                         for _ in range(answer_count))
+    if qtype.upper() == "TYPE65":
+        # tcpdump doesn't decode Type65 (HTTPS) records' data
+        return ", ".join("Type65" for _ in range(answer_count))
+    return ", ".join(f"{qtype} record{rng.randrange(1000)}.example.net."
+                     for _ in range(answer_count))
+
+
+def traffic_gen(requests = 100000,
+                servers = 4,
+                clients = 50,
+                domains = 10000,
+                ipv6_fraction = 0.25,
+                qtypes = DEFAULT_QTYPES,
+                nxdomain_rate = 0.02,
+                norecord_rate = 0.05,
+                edns_rate = 0.5,
+                loss_rate = 0.01,
+                hedge_rate = 0.0,
+                latency_ms = (10, 20, 40, 80),
+                latency_sigma = 0.5,
+                requests_per_s = 500.0,
+                epoch_times = False,
+                seed = 0):
+    """
+    generates tcpdump text output lines (without line endings) of requests
+    DNS requests and their responses, in time order
+
+          requests - number of DNS requests to generate
+           servers - number of DNS servers requests are sent to
+           clients - number of requesting hosts
+           domains - number of distinct domain names looked up (a few are
+                     looked up much more often than the rest - popularity
+                     roughly follows Zipf's law)
+     ipv6_fraction - fraction of clients using IPv6 (IP6 lines)
+            qtypes - (request type, weight) pairs of the request type mix
+                     (e.g. Type65 for HTTPS lookups)
+     nxdomain_rate - fraction of responses with an NXDomain result
+     norecord_rate - fraction of responses with no records (0/x/x answers)
+         edns_rate - fraction of requests with an EDNS OPT record ([1au])
+         loss_rate - fraction of requests that never get a response
+        hedge_rate - fraction of requests sent to every DNS server at once
+                     (same client port and DNS ID, like a stub resolver
+                     racing its upstreams)
+        latency_ms - median response latency of each DNS server (reused in
+                     turn if there are more servers than medians)
+     latency_sigma - spread (lognormal sigma) of response latencies
+    requests_per_s - mean request rate
+       epoch_times - use tcpdump -tt timestamps instead of HH:MM:SS.ffffff
+              seed - random seed (same seed and arguments make same lines)
+    """
+    rng = random.Random(seed)
+    format_time = format_epoch if epoch_times else format_clock
+    t = START_EPOCH_S if epoch_times else START_CLOCK_S
+
+    server_names = [f"dns{n + 1:02}.example.net" for n in range(servers)]
+    server_mu = [math.log(latency_ms[n % len(latency_ms)] / 1000)
+                 for n in range(servers)]
+
+    client_addresses = []
+    for n in range(clients):
+        if rng.random() < ipv6_fraction:
+            client_addresses.append(("IP6", f"2001:db8:{n // 65536:x}::"
+                                            f"{n % 65536 + 1:x}"))
+        else:
+            client_addresses.append(("IP", f"10.{n // 65536 % 256}."
+                                           f"{n // 256 % 256}.{n % 256 + 1}"))
+
+    qtype_names = [name for name, _ in qtypes]
+    qtype_weights = [weight for _, weight in qtypes]
+    qtype_cum_weights = [sum(qtype_weights[:n + 1])
+                         for n in range(len(qtype_weights))]
+
+    # lines waiting to be output - (time, sequence, line) heap
+    pending = []
+    sequence = itertools.count()
+    for _ in range(requests):
+        t += rng.expovariate(requests_per_s)
+        while pending and pending[0][0] <= t:
+            line_t, _, line = heapq.heappop(pending)
+            yield f"{format_time(line_t)} {line}"
+
+        proto, client_address = client_addresses[rng.randrange(clients)]
+        client_port = rng.randrange(1024, 65536)
+        server = rng.randrange(servers)
+        reqid = rng.randrange(65536)
+        qtype = rng.choices(qtype_names, cum_weights=qtype_cum_weights)[0]
+        # log-uniform domain number - lower numbers are more popular
+        domain = int(domains ** rng.random())
+        query_address = f"host{domain}.zone{domain % 97}.example.com."
+        edns = rng.random() < edns_rate
+        flags = "[1au] " if edns else ""
+        additional_count = 1 if edns else 0
+        # DNS servers sent this request (all of them when it's hedged)
+        legs = [server]
+        if hedge_rate and rng.random() < hedge_rate:
+            legs += [n for n in range(servers) if n != server]
+
+        answer = None
+        for n, server in enumerate(legs):
+            leg_t = t + n * HEDGE_INTERVAL_S
+            server_name = server_names[server]
+            request = (f"{proto} {client_address}.{client_port} > "
+                       f"{server_name}.53: {reqid}+ {flags}{qtype}? "
+                       f"{query_address} "
+                       f"({len(query_address) + (22 if edns else 11)})")
+            if n == 0:
+                yield f"{format_time(t)} {request}"
+            else:
+                heapq.heappush(pending, (leg_t, next(sequence), request))
+
+            if rng.random() < loss_rate:
+                continue
+            response_t = leg_t + rng.lognormvariate(server_mu[server],
+                                                    latency_sigma)
+            if answer is None:
+                # (every DNS server gives the same answer)
+                result = rng.random()
+                if result < nxdomain_rate:
+                    answer = f"NXDomain 0/1/{additional_count}"
+                    length = len(query_address) + 80
+                elif result < nxdomain_rate + norecord_rate:
+                    answer = f"0/1/{additional_count}"
+                    length = len(query_address) + 80
+                else:
+                    answer_count = rng.randint(1, 4) if qtype == "A" else 1
+                    answer = (f"{answer_count}/0/{additional_count} "
+                              f"{answer_records(rng, qtype, answer_count)}")
+                    length = len(query_address) + 16 * answer_count + 11
+            response = (f"{proto} {server_name}.53 > "
+                        f"{client_address}.{client_port}: {reqid} {answer} "
+                        f"({length})")
+            heapq.heappush(pending, (response_t, next(sequence), response))
+
+    while pending:
+        line_t, _, line = heapq.heappop(pending)
+        yield f"{format_time(line_t)} {line}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+      description="Write deterministic synthetic tcpdump DNS traffic to "
+                  "stdout")
+    parser.add_argument("--requests",
+                        type=int,
+                        default=100000,
+                        help="number of DNS requests to generate")
+    parser.add_argument("--servers",
+                        type=int,
+                        default=4,
+                        help="number of DNS servers")
+    parser.add_argument("--clients",
+                        type=int,
+                        default=50,
+                        help="number of requesting hosts")
+    parser.add_argument("--domains",
+                        type=int,
+                        default=10000,
+                        help="number of distinct domain names (popularity "
+                             "roughly follows Zipf's law)")
+    parser.add_argument("--ipv6_fraction",
+                        type=float,
+                        default=0.25,
+                        help="fraction of clients using IPv6")
+    parser.add_argument("--qtypes",
+                        default=",".join(f"{name}={weight}"
+                                         for name, weight in DEFAULT_QTYPES),
+                        help="request type mix as TYPE=WEIGHT,... (default "
+                             "%(default)s)")
+    parser.add_argument("--nxdomain_rate",
+                        type=float,
+                        default=0.02,
+                        help="fraction of NXDomain responses")
+    parser.add_argument("--norecord_rate",
+                        type=float,
+                        default=0.05,
+                        help="fraction of responses without records "
+                             "(NoRecord)")
+    parser.add_argument("--edns_rate",
+                        type=float,
+                        default=0.5,
+                        help="fraction of requests with [1au] flags")
+    parser.add_argument("--loss_rate",
+                        type=float,
+                        default=0.01,
+                        help="fraction of requests without a response")
+    parser.add_argument("--hedge_rate",
+                        type=float,
+                        default=0.0,
+                        help="fraction of requests sent to every DNS server "
+                             "at once")
+    parser.add_argument("--latency_ms",
+                        default="10,20,40,80",
+                        help="comma separated median latency of each DNS "
+                             "server (reused in turn for more servers)")
+    parser.add_argument("--latency_sigma",
+                        type=float,
+                        default=0.5,
+                        help="lognormal sigma of response latencies")
+    parser.add_argument("--requests_per_s",
+                        type=float,
+                        default=500.0,
+                        help="mean request rate (packet time)")
+    parser.add_argument("--tt",
+                        action="store_true",
+                        help="write tcpdump -tt epoch timestamps")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="random seed")
+    args = parser.parse_args()
+
+    lines = traffic_gen(requests=args.requests,
+                        servers=args.servers,
+                        clients=args.clients,
+                        domains=args.domains,
+                        ipv6_fraction=args.ipv6_fraction,
+                        qtypes=parse_weights(args.qtypes),
+                        nxdomain_rate=args.nxdomain_rate,
+                        norecord_rate=args.norecord_rate,
+                        edns_rate=args.edns_rate,
+                        loss_rate=args.loss_rate,
+                        hedge_rate=args.hedge_rate,
+                        latency_ms=[float(ms) for ms
+                                    in args.latency_ms.split(",")],
+                        latency_sigma=args.latency_sigma,
+                        requests_per_s=args.requests_per_s,
+                        epoch_times=args.tt,
+                        seed=args.seed)
+    try:
+        while True:
+            chunk = [f"{line}\n" for _, line in zip(range(10000), lines)]
+            if not chunk:
+                break
+            sys.stdout.writelines(chunk)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # reader (e.g. head) stopped reading - don't complain when stdout is
+        # flushed at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# requires Python 3.6+
+
+"""
+Self-instrumentation of the DNS_times_parser.py pipeline - counters and
+timers for each stage (parse_gen() parsing, process() request/response
+matching and stats, title updates and ScrollRegion.AddLine() display) to
+show which one is the bottleneck when the monitor falls behind.
+
+Nothing here is used unless an Instrumentation is given to parse_gen() and
+process() - they then route their work through wrappers that count and time
+it, so the uninstrumented pipeline runs exactly as before. Snapshots can be
+shown in a status region, written as JSON (e.g. on SIGUSR1) and the main
+thread can be run under cProfile for a fixed window (e.g. on SIGUSR2).
+"""
+
+import os
+import time
+import json
+import cProfile
+
+# (snapshot key, status line label) of each timed stage
+STAGES = (("parse", "parse"),
+          ("correlation_stats", "match+stats"),
+          ("titles", "titles"),
+          ("display", "display"))
+
+
+class Instrumentation:
+    """
+    Counts and times the work of each pipeline stage (see Parse(), Watch()
+    and Timed())
+    """
+
+    def __init__(self,
+                 status_interval_s = None,
+                 profile_s = 30.0,
+                 profile_path = "DNS_times.prof",
+                 load_shedder = None):
+        """
+        status_interval_s - seconds between status region updates (None for
+                            no status region)
+                profile_s - length of each StartProfile() window in seconds
+             profile_path - file each profile window's pstats are written to
+                            (view with python -m pstats PATH)
+             load_shedder - DNS_times_shed.LoadShedder to include the
+                            shedding level and counts of
+        """
+        self.status_interval_s = status_interval_s
+        self.profile_s = profile_s
+        self.profile_path = profile_path
+        self.load_shedder = load_shedder
+        self.__start_time = time.perf_counter()
+        # lines (or pcap capture records) read and DNS packets parsed from
+        # them (see Parse() and TimedParse()), and packets (requests and
+        # responses) given to process()
+        self.__counts = {"lines": 0,
+                         "parsed": 0,
+                         "packets": 0,
+                         "responses": 0}
+        # seconds spent in each stage ("process" is all of process()'s time
+        # per packet, including its title updates and display)
+        self.__stage_s = {"parse": 0.0,
+                          "process": 0.0,
+                          "titles": 0.0,
+                          "display": 0.0}
+        # process()'s statistics dicts by DNS server name
+        self.__server_stats = {}
+        self.__status_region = None
+        self.__prev_status = None
+        self.__next_status_time = float("inf")
+        self.__profile = None
+        self.__profile_end_time = float("inf")
+        # earliest time Watch() needs to update the status region or end a
+        # profile window
+        self.__next_check_time = float("inf")
+
+    def Parse(self, f, parse_line):
+        """
+        generates the DNS_packets parse_line() parses from the lines of
+        iterable f, counting lines and packets and timing parse_line()
+        """
+        counts = self.__counts
+        stage_s = self.__stage_s
+        perf_counter = time.perf_counter
+        for line in f:
+            start = perf_counter()
+            p = parse_line(line)
+            stage_s["parse"] += perf_counter() - start
+            counts["lines"] += 1
+            if p is not None:
+                counts["parsed"] += 1
+                yield p
+
+    def TimedParse(self, parse):
+        """
+        returns a wrapper of parse (a function returning the DNS_packet
+        parsed from a line or capture record, or None) that counts lines and
+        packets and times parsing - for parsers that don't read lines
+        through Parse() (--source readers, which call it on their own thread,
+        and pcap_gen())
+        """
+        counts = self.__counts
+        stage_s = self.__stage_s
+        perf_counter = time.perf_counter
+
+        def timed_parse(*args):
+            start = perf_counter()
+            p = parse(*args)
+            stage_s["parse"] += perf_counter() - start
+            counts["lines"] += 1
+            if p is not None:
+                counts["parsed"] += 1
+            return p
+        return timed_parse
+
+    def Watch(self, packets_gen, server_stats, scroll_region_class = None):
+        """
+        generates the (source tag, DNS_packet) items of packets_gen for
+        process(), counting them and timing how long process() takes with
+        each one
+
+               server_stats - process()'s statistics dicts by DNS server name
+                              (matched responses and timeouts are counted
+                              from them)
+        scroll_region_class - ScrollRegion class to show a status region
+                              with (if status_interval_s was given)
+        """
+        self.__server_stats = server_stats
+        if self.status_interval_s and scroll_region_class is not None:
+            self.__status_region = scroll_region_class("pipeline", 4)
+            self.__prev_status = (self.__start_time, self.GetSnapshot())
+            self.__next_status_time = (time.perf_counter() +
+                                       self.status_interval_s)
+            self.__UpdateNextCheckTime()
+
+        counts = self.__counts
+        stage_s = self.__stage_s
+        perf_counter = time.perf_counter
+        for item in packets_gen:
+            start = perf_counter()
+            counts["packets"] += 1
+            if not item[1].is_req:
+                counts["responses"] += 1
+            yield item
+            end = perf_counter()
+            stage_s["process"] += end - start
+            if end >= self.__next_check_time:
+                self.__Check(end)
+
+    def Timed(self, stage, func):
+        """
+        returns a wrapper of func that adds the time each call takes to
+        stage ("titles" or "display")
+        """
+        stage_s = self.__stage_s
+        perf_counter = time.perf_counter
+
+        def timed(*args):
+            start = perf_counter()
+            try:
+                return func(*args)
+            finally:
+                stage_s[stage] += perf_counter() - start
+        return timed
+
+    def GetSnapshot(self):
+        """
+        returns a dict of the current counters and seconds spent in each
+        stage (see STAGES) - and the load_shedder's level and counts
+        """
+        counts = self.__counts
+        stage_s = self.__stage_s
+        matched = timeouts = 0
+        for stats in self.__server_stats.values():
+            matched += stats["total_requests"]
+            timeouts += stats["timeouts"]
+        snapshot = {
+          "uptime_s": time.perf_counter() - self.__start_time,
+          "lines": counts["lines"],
+          "parsed": counts["parsed"],
+          "packets": counts["packets"],
+          "requests": counts["packets"] - counts["responses"],
+          "responses": counts["responses"],
+          "matched": matched,
+          "unmatched": counts["responses"] - matched,
+          "timeouts": timeouts,
+          "stage_s": {
+            "parse": stage_s["parse"],
+            "correlation_stats": (stage_s["process"] - stage_s["titles"] -
+                                  stage_s["display"]),
+            "titles": stage_s["titles"],
+            "display": stage_s["display"]}}
+        if self.load_shedder is not None:
+            snapshot["shedding"] = self.load_shedder.GetSnapshot()
+        return snapshot
+
+    def WriteJSON(self, path):
+        """
+        atomically replace path with a JSON snapshot (see GetSnapshot())
+        """
+        snapshot = self.GetSnapshot()
+        snapshot["time"] = time.time()
+        snapshot["pid"] = os.getpid()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f, indent=2)
+            f.write("\n")
+        os.replace(temp_path, path)
+
+    def StartProfile(self):
+        """
+        run the calling (main) thread under cProfile for the next profile_s
+        seconds and then write the profile to profile_path (the window ends
+        at the first packet after profile_s - or at Close())
+        """
+        if self.__profile is not None:
+            return
+        self.__profile = cProfile.Profile()
+        self.__profile_end_time = time.perf_counter() + self.profile_s
+        self.__UpdateNextCheckTime()
+        self.__profile.enable()
+
+    def __StopProfile(self):
+        """
+        Internal function to end a profile window and write its profile
+        """
+        self.__profile.disable()
+        self.__profile.dump_stats(self.profile_path)
+        self.__profile = None
+        self.__profile_end_time = float("inf")
+        self.__UpdateNextCheckTime()
+
+    def __UpdateNextCheckTime(self):
+        """
+        Internal function to set when Watch() next needs to call __Check()
+        """
+        self.__next_check_time = min(self.__next_status_time,
+                                     self.__profile_end_time)
+
+    def __Check(self, now):
+        """
+        Internal function to update the status region and end a profile
+        window when they're due
+        """
+        if now >= self.__profile_end_time:
+            self.__StopProfile()
+        if now >= self.__next_status_time:
+            self.__UpdateStatus(now)
+            self.__next_status_time = now + self.status_interval_s
+            self.__UpdateNextCheckTime()
+
+    def __UpdateStatus(self, now):
+        """
+        Internal function to show the counters in the status region title and
+        add a line of rates and each stage's share of the time since the last
+        update
+        """
+        prev_time, prev = self.__prev_status
+        snapshot = self.GetSnapshot()
+        self.__prev_status = (now, snapshot)
+        interval_s = (now - prev_time) or 1e-9
+
+        self.__status_region.SetTitle(
+          f"pipeline - lines {snapshot['lines']:,}  "
+          f"packets {snapshot['packets']:,}  "
+          f"matched {snapshot['matched']:,}  "
+          f"unmatched {snapshot['unmatched']:,}  "
+          f"lost {snapshot['timeouts']:,}")
+
+        line = (f"{(snapshot['lines'] - prev['lines']) / interval_s:>9,.0f}"
+                f" lines/s "
+                f"{(snapshot['packets'] - prev['packets']) / interval_s:>9,.0f}"
+                f" packets/s ")
+        busy_s = 0.0
+        for stage, label in STAGES:
+            stage_s = snapshot["stage_s"][stage] - prev["stage_s"][stage]
+            busy_s += stage_s
+            line += f" {label} {100 * stage_s / interval_s:3.0f}%"
+        line += f"  other {100 * max(0.0, 1 - busy_s / interval_s):3.0f}%"
+        if self.load_shedder is not None:
+            shedding = snapshot["shedding"]
+            line += (f"  shedding {shedding['level_name']} "
+                     f"({shedding['behind_s']:.1f}s behind)")
+        self.__status_region.AddLine(line, 0)
+
+    def Close(self):
+        """
+        end any profile window early (writing its profile)
+        """
+        if self.__profile is not None:
+            self.__StopProfile()
@@ -0,0 +1,321 @@
+# requires Python 3.7+
+
+"""
+Prometheus/OpenMetrics text exposition of process()'s per DNS server stats,
+served by a small HTTP server thread and/or written to a node_exporter
+textfile collector file.
+
+process() reads its packets through MetricsExporter.Watch(), which holds a
+lock while each packet is handled. A scrape or textfile write takes the lock
+only to copy every DNS server's counters and latency histogram buckets into
+a snapshot between packets, so it always sees consistent numbers, and the
+snapshot is formatted and sent after the lock is released so the ingest
+loop is never held up for the length of the response.
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from DNS_times_parser import latency_bucket_bounds_ms
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric name, stats dict key, help text) of per DNS server counters
+COUNTERS = (
+  ("dns_times_responses_total", "total_requests",
+   "Requests answered by the DNS server"),
+  ("dns_times_timeouts_total", "timeouts",
+   "Requests that got no response in time (lost)"),
+  ("dns_times_nxdomain_total", "nxdomain",
+   "Responses with a non-existent domain (NXDomain) result"),
+  ("dns_times_norecord_total", "norecord",
+   "Responses with no record of the type requested (NoRecord)"),
+  ("dns_times_id_collisions_total", "id_collisions",
+   "Requests sharing a DNS ID with another client's waiting request"),
+  ("dns_times_overwritten_total", "overwritten",
+   "Requests retransmitted by the client before they were answered"),
+  ("dns_times_unanswered_attempts_total", "unanswered_attempts",
+   "Request attempts given up on (retried or lost) without a response"),
+  ("dns_times_retried_responses_total", "retried",
+   "Requests answered after the client retransmitted them"))
+
+# (metric name, stats dict key prefix, help text) of per DNS server latency
+# histograms
+HISTOGRAMS = (
+  ("dns_times_latency_seconds", "latency",
+   "Time from request (its latest attempt) to response"),
+  ("dns_times_first_attempt_latency_seconds", "first_attempt_latency",
+   "Time from a request's first attempt to its response"))
+
+# (window label, seconds) of recent latency/failure gauges (from each DNS
+# server's rollups)
+ROLLUP_WINDOWS = (("1m", 60), ("5m", 300), ("1h", 3600))
+
+# maximum seconds Close() waits for each textfile thread's final write
+CLOSE_TIMEOUT_S = 5.0
+
+
+def escape_label_value(value):
+    """
+    returns value escaped for use as a Prometheus label value
+    """
+    return (value.replace("\\", "\\\\")
+                 .replace("\"", "\\\"")
+                 .replace("\n", "\\n"))
+
+
+def server_source(dns_server_name):
+    """
+    returns the source tag of process()'s DNS server name ("" if untagged)
+    """
+    return " ".join(dns_server_name.split(" ")[:-2])
+
+
+def server_labels(dns_server_name):
+    """
+    returns Prometheus labels for process()'s DNS server name (of the form
+    "[source ]address (proto)")
+    """
+    parts = dns_server_name.split(" ")
+    proto = parts[-1].strip("()")
+    address = parts[-2] if len(parts) > 1 else ""
+    source = server_source(dns_server_name)
+    return (f'source="{escape_label_value(source)}",'
+            f'server="{escape_label_value(address)}",'
+            f'proto="{escape_label_value(proto)}"')
+
+
+def recent_summary(rollups, window_s, now = None):
+    """
+    returns (mean latency ms, failures) over the last window_s of a DNS
+    server's Rollups up to its source's packet time now (defaults to the
+    time of its latest bucket)
+    """
+    count, total, _, _, failures = rollups.GetSummary(window_s, now)
+    return (total / count if count else 0), failures
+
+
+def format_metrics(snapshot):
+    """
+    returns Prometheus text exposition format for a MetricsExporter snapshot
+    """
+    lines = []
+    for n, (name, _, help_text) in enumerate(COUNTERS):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, counters, _, _ in snapshot:
+            lines.append(f"{name}{{{labels}}} {counters[n]}")
+
+    for name, help_text in (
+      ("dns_times_recent_latency_mean_seconds",
+       "Mean time from request to response over a recent window"),
+      ("dns_times_recent_failures",
+       "Lost requests and failed lookups over a recent window")):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, _, _, recent in snapshot:
+            for (window, _), (mean_ms, failures) in zip(ROLLUP_WINDOWS,
+                                                        recent):
+                value = (f"{mean_ms / 1000:.6f}"
+                         if name.endswith("seconds") else failures)
+                lines.append(f'{name}{{{labels},window="{window}"}} {value}')
+
+    bounds = [f"{bound / 1000:g}" for bound in latency_bucket_bounds_ms]
+    bounds.append("+Inf")
+    for n, (name, _, help_text) in enumerate(HISTOGRAMS):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, _, histograms, _ in snapshot:
+            buckets, sum_ms = histograms[n]
+            cumulative = 0
+            for bound, count in zip(bounds, buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {sum_ms / 1000:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+class MetricsExporter:
+    """
+    Serves process()'s per DNS server stats from an HTTP metrics endpoint
+    (StartServer()) and/or writes them to a textfile collector file
+    (StartTextfile())
+    """
+
+    def __init__(self):
+        # held while process() handles a packet (see Watch())
+        self.__lock = threading.Lock()
+        # process()'s statistics dicts by DNS server name
+        self.__server_stats = {}
+        # labels and source tags by DNS server name
+        self.__labels = {}
+        self.__sources = {}
+        # latest packet time by source tag (so a DNS server that has gone
+        # quiet drops out of the recent windows as its source's time moves
+        # on)
+        self.__source_times = {}
+        self.__closed = threading.Event()
+        self.__textfile_threads = []
+        self.__http_server = None
+        # the generator returned by Watch() (closed by Close())
+        self.__watch_gen = None
+
+    def Watch(self, packets_gen, server_stats):
+        """
+        returns a generator of the items of packets_gen for process(),
+        holding a lock while process() handles each one (server_stats are
+        only read for a snapshot between packets, while process() waits for
+        the next one) - Close() closes it, releasing the lock if process()
+        was stopped by an exception while handling a packet
+
+        server_stats - process()'s statistics dicts by DNS server name
+        """
+        self.__server_stats = server_stats
+        self.__watch_gen = self.__WatchGen(packets_gen)
+        return self.__watch_gen
+
+    def __WatchGen(self, packets_gen):
+        """
+        Internal generator function for Watch()
+        """
+        lock = self.__lock
+        source_times = self.__source_times
+        lock.acquire()
+        try:
+            packets_iter = iter(packets_gen)
+            while True:
+                lock.release()
+                try:
+                    item = next(packets_iter, None)
+                finally:
+                    lock.acquire()
+                if item is None:
+                    break
+                source_times[item[0]] = item[1].time
+                yield item
+        finally:
+            lock.release()
+
+    def GetSnapshot(self):
+        """
+        returns a consistent snapshot of the current stats - a tuple of
+        (labels, counters, histograms, recent) tuples by DNS server, where
+        histograms is a (latency buckets, latency sum ms) pair for each
+        HISTOGRAMS histogram and recent is a (mean latency ms, failures) pair
+        for each ROLLUP_WINDOWS window (process() only waits while the
+        numbers are copied)
+        """
+        with self.__lock:
+            stats_items = [(dns_server_name,
+                            tuple(stats[key] for _, key, _ in COUNTERS),
+                            tuple((tuple(stats[f"{key}_buckets"]),
+                                   stats[f"{key}_sum_ms"])
+                                  for _, key, _ in HISTOGRAMS),
+                            tuple(recent_summary(
+                                    stats["rollups_ms"], window_s,
+                                    self.__source_times.get(
+                                      self.__Source(dns_server_name)))
+                                  for _, window_s in ROLLUP_WINDOWS))
+                           for dns_server_name, stats
+                           in self.__server_stats.items()]
+
+        snapshot = []
+        for dns_server_name, *numbers in sorted(stats_items):
+            labels = self.__labels.get(dns_server_name)
+            if labels is None:
+                labels = self.__labels[dns_server_name] = \
+                  server_labels(dns_server_name)
+            snapshot.append((labels, *numbers))
+        return tuple(snapshot)
+
+    def __Source(self, dns_server_name):
+        """
+        Internal function returning DNS server name's source tag
+        """
+        source = self.__sources.get(dns_server_name)
+        if source is None:
+            source = self.__sources[dns_server_name] = \
+              server_source(dns_server_name)
+        return source
+
+    def GetMetrics(self):
+        """
+        returns current stats in Prometheus text exposition format
+        """
+        return format_metrics(self.GetSnapshot())
+
+    def StartServer(self, port, address = "127.0.0.1"):
+        """
+        serve current stats at http://address:port/metrics from a daemon
+        thread
+        """
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.GetMetrics().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # don't write request logs over the terminal display
+                pass
+
+        self.__http_server = ThreadingHTTPServer((address, port),
+                                                 MetricsHandler)
+        self.__http_server.daemon_threads = True
+        threading.Thread(target=self.__http_server.serve_forever,
+                         daemon=True).start()
+
+    def StartTextfile(self, path, interval_s = 10.0):
+        """
+        (re)write current stats to path (e.g. a node_exporter textfile
+        collector .prom file) every interval_s seconds from a daemon thread -
+        the file is replaced atomically so it's never read half written
+        """
+        def write_loop():
+            while True:
+                closed = self.__closed.wait(interval_s)
+                self.__WriteTextfile(path)
+                if closed:
+                    break
+
+        thread = threading.Thread(target=write_loop, daemon=True)
+        thread.start()
+        self.__textfile_threads.append(thread)
+
+    def __WriteTextfile(self, path):
+        """
+        Internal function to atomically replace path with current stats
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.GetMetrics())
+        os.replace(temp_path, path)
+
+    def Close(self):
+        """
+        stop watching process()'s packets (call once process() has returned
+        or raised), stop the HTTP server and write final stats to any
+        textfile
+        """
+        if self.__watch_gen is not None:
+            # (runs the generator's finally - releasing the lock if it's
+            # still held for a packet process() didn't finish handling)
+            self.__watch_gen.close()
+            self.__watch_gen = None
+        if self.__http_server is not None:
+            self.__http_server.shutdown()
+            self.__http_server.server_close()
+        self.__closed.set()
+        for thread in self.__textfile_threads:
+            thread.join(CLOSE_TIMEOUT_S)
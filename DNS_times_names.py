@@ -0,0 +1,127 @@
+# requires Python 3.6+
+
+"""
+Heavy hitter query names for DNS_times_parser.py's process() - the most
+looked up names and the names with the most total latency, for each DNS
+server and over all DNS servers.
+
+Each has a Space-Saving summary of name counts (with the mean latency of
+each monitored name) and a Count-Min sketch of total latency by name (see
+MovingAverageClasses/HeavyHitters.py), so memory stays fixed however many
+distinct names are looked up and adding a response is O(1).
+"""
+
+import sys
+from MovingAverageClasses.HeavyHitters import SpaceSaving, CountMinTopK
+
+# key of the over all DNS servers summaries
+ALL_SERVERS = ""
+
+
+class TopNames:
+    """
+    Top k query names by count and by total latency for each DNS server and
+    over all DNS servers - optionally shown in two scroll regions
+    """
+
+    def __init__(self, k = 10, region_interval_s = 1.0):
+        """
+                        k - number of top names kept
+        region_interval_s - seconds of packet time between redraws of the
+                            scroll regions (see ShowRegions())
+        """
+        self.k = k
+        self.region_interval_s = region_interval_s
+        # (SpaceSaving, CountMinTopK) by DNS server name (ALL_SERVERS for
+        # the over all DNS servers pair)
+        self.summaries = {ALL_SERVERS: self.__NewSummaries()}
+        self.__count_region = None
+        self.__latency_region = None
+        self.__next_region_time = float("inf")
+
+    def __NewSummaries(self):
+        """
+        Internal function returning a new (SpaceSaving, CountMinTopK) pair
+        """
+        # monitor several times k names so the top k counts are accurate
+        return (SpaceSaving("count", 8 * self.k),
+                CountMinTopK("latency", self.k))
+
+    def Add(self, dns_server_name, query_address, dt_ms, time):
+        """
+        count a response from dns_server_name to a request for query_address
+        that took dt_ms (at packet time)
+        """
+        summaries = self.summaries.get(dns_server_name)
+        if summaries is None:
+            summaries = self.summaries[dns_server_name] = \
+              self.__NewSummaries()
+        summaries[0].Add(query_address, dt_ms)
+        summaries[1].Add(query_address, dt_ms)
+        summaries = self.summaries[ALL_SERVERS]
+        summaries[0].Add(query_address, dt_ms)
+        summaries[1].Add(query_address, dt_ms)
+
+        if time >= self.__next_region_time:
+            self.__next_region_time = time + self.region_interval_s
+            self.__UpdateRegions()
+
+    def GetTop(self, dns_server_name = ALL_SERVERS):
+        """
+        returns ([(name, count, possible overcount, mean latency ms), ...],
+        [(name, total latency ms), ...]) of the top k names by count and by
+        total latency for dns_server_name (default all DNS servers)
+        """
+        summaries = self.summaries.get(dns_server_name)
+        if summaries is None:
+            return [], []
+        return summaries[0].GetTop(self.k), summaries[1].GetTop(self.k)
+
+    def ShowRegions(self, scroll_region_class):
+        """
+        show the top names over all DNS servers in two scroll regions of
+        scroll_region_class (redrawn every region_interval_s of packet time)
+        """
+        # (a title, a blank line and k names)
+        self.__count_region = scroll_region_class(
+          "most looked up names (all servers)", self.k + 2)
+        self.__latency_region = scroll_region_class(
+          "most total latency names (all servers)", self.k + 2)
+        self.__next_region_time = float("-inf")
+
+    def __UpdateRegions(self):
+        """
+        Internal function to redraw the scroll regions (by adding a full
+        region of lines - the blank first line leaves room for
+        BufferedScrollRegion's "skipped lines" line)
+        """
+        by_count, by_latency = self.GetTop()
+        lines = [""]
+        lines += [f"{count:>10,} {mean_ms:>9.1f}ms  {name[:-1]}"
+                  for name, count, _, mean_ms in by_count]
+        lines += [""] * (self.k + 1 - len(lines))
+        for line in lines:
+            self.__count_region.AddLine(line, 0)
+        lines = [""]
+        lines += [f"{total_ms / 1000:>10,.1f}s  {name[:-1]}"
+                  for name, total_ms in by_latency]
+        lines += [""] * (self.k + 1 - len(lines))
+        for line in lines:
+            self.__latency_region.AddLine(line, 0)
+
+    def WriteSummary(self, f = sys.stderr):
+        """
+        write the top names by count and by total latency for each DNS
+        server and over all DNS servers to f
+        """
+        for dns_server_name in sorted(self.summaries):
+            by_count, by_latency = self.GetTop(dns_server_name)
+            f.write(f"\n-- most looked up names: "
+                    f"{dns_server_name or 'all servers'} --\n")
+            for name, count, _, mean_ms in by_count:
+                f.write(f"{count:>10,} {mean_ms:>9.1f}ms  {name[:-1]}\n")
+            f.write(f"-- most total latency names: "
+                    f"{dns_server_name or 'all servers'} --\n")
+            for name, total_ms in by_latency:
+                f.write(f"{total_ms / 1000:>10,.1f}s  {name[:-1]}\n")
+        f.flush()
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# requires Python 3.6+ and NumPy
+
+"""
+Offline batch analysis of a saved tcpdump text capture file.
+
+The file is parsed into columnar NumPy arrays and requests are matched to
+responses with a vectorized sort/merge join (matching the same way process()
+in DNS_times_parser.py does) so per-server stats can be computed with array
+operations instead of one packet at a time.
+
+With --jobs N, the file is instead memory-mapped, split into line-aligned
+byte ranges and parsed/matched in N worker processes. Requests and responses
+split across chunks are matched in a final stitching pass.
+
+Usage:
+    ./DNS_times_offline.py capture.out [--request_timeout_s 5] [--jobs N]
+"""
+
+import os
+import sys
+import mmap
+import argparse
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from DNS_times_parser import DNS_packet, parse_gen, RequestCache, \
+                             request_key, response_key
+
+# status column codes
+STATUS_OK = 0
+STATUS_NXDOMAIN = 1
+STATUS_NORECORD = 2
+
+
+def load_columns(f, tcpdump_ttt = False):
+    """
+    parses tcpdump lines supplied by iterable f into a dict of columnar NumPy
+    arrays (one row per DNS_packet in file order)
+
+    string fields are stored as int codes into the "strings" list
+    """
+    strings = []
+    codes = {}
+    def code(s):
+        c = codes.get(s)
+        if c is None:
+            c = codes[s] = len(strings)
+            strings.append(s)
+        return c
+
+    time, reqid, is_req, proto, src, dst, src_port, dst_port = \
+      [], [], [], [], [], [], [], []
+    qtype, name, status = [], [], []
+    for p in parse_gen(f, tcpdump_ttt):
+        time.append(p.time)
+        reqid.append(int(p.reqid))
+        is_req.append(p.is_req)
+        proto.append(code(p.proto))
+        src.append(code(p.src_address))
+        dst.append(code(p.dst_address))
+        src_port.append(int(p.src_port))
+        dst_port.append(int(p.dst_port))
+        if p.is_req:
+            qtype.append(code(p.type))
+            name.append(code(p.query_address))
+            status.append(STATUS_OK)
+        else:
+            qtype.append(-1)
+            name.append(-1)
+            status.append(STATUS_NXDOMAIN if p.query_address == "NXDomain"
+                          else STATUS_NORECORD if p.query_address == "NoRecord"
+                          else STATUS_OK)
+
+    return {"strings": strings,
+            "time": np.array(time, dtype=np.float64),
+            "reqid": np.array(reqid, dtype=np.int64),
+            "is_req": np.array(is_req, dtype=bool),
+            "proto": np.array(proto, dtype=np.int64),
+            "src": np.array(src, dtype=np.int64),
+            "dst": np.array(dst, dtype=np.int64),
+            "src_port": np.array(src_port, dtype=np.int64),
+            "dst_port": np.array(dst_port, dtype=np.int64),
+            "qtype": np.array(qtype, dtype=np.int64),
+            "name": np.array(name, dtype=np.int64),
+            "status": np.array(status, dtype=np.int8)}
+
+
+def match_requests(columns, request_timeout_s = 5.0):
+    """
+    matches responses to requests with a vectorized sort/merge join
+
+    Like process()'s RequestCache, a response matches the latest request
+    before it with the same (server, proto, reqid, client, client port) key
+    that hasn't already been answered and is no older than
+    request_timeout_s (RequestCache's max_size isn't applied).
+
+    returns (request_rows, response_rows, overwritten_rows) index arrays of
+    matched pairs in response order and of requests overwritten by a later
+    request with the same key
+    """
+    is_req = columns["is_req"]
+    # server is the destination of requests and the source of responses
+    server = np.where(is_req, columns["dst"], columns["src"])
+    client = np.where(is_req, columns["src"], columns["dst"])
+    client_port = np.where(is_req, columns["src_port"], columns["dst_port"])
+
+    # stable sort by key then file order so each key's packets are adjacent
+    # and in arrival order
+    rows = np.lexsort((np.arange(len(is_req)),
+                       client_port, client, columns["reqid"],
+                       columns["proto"], server))
+    if len(rows) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    same_key = ((server[rows[1:]] == server[rows[:-1]]) &
+                (columns["proto"][rows[1:]] == columns["proto"][rows[:-1]]) &
+                (columns["reqid"][rows[1:]] == columns["reqid"][rows[:-1]]) &
+                (client[rows[1:]] == client[rows[:-1]]) &
+                (client_port[rows[1:]] == client_port[rows[:-1]]))
+
+    # a response matches the packet just before it with the same key if that
+    # packet is a request (a request just before it is the latest one since
+    # later requests overwrite earlier ones, and a response just before it
+    # means the latest request was already answered)
+    prev_rows, next_rows = rows[:-1], rows[1:]
+    # (a request older than request_timeout_s has already expired as lost
+    # when the next packet with its key arrives)
+    in_time = (same_key & is_req[prev_rows] &
+               (columns["time"][next_rows] - columns["time"][prev_rows]
+                <= request_timeout_s))
+    matched = in_time & ~is_req[next_rows]
+    request_rows = prev_rows[matched]
+    response_rows = next_rows[matched]
+    overwritten_rows = prev_rows[in_time & is_req[next_rows]]
+
+    order = np.argsort(response_rows, kind="stable")
+    return request_rows[order], response_rows[order], overwritten_rows
+
+
+def server_stats(columns,
+                 request_rows,
+                 response_rows,
+                 overwritten_rows,
+                 request_timeout_s = 5.0):
+    """
+    returns list of per-server stats dicts (ordered by first response, then
+    servers that never answered by name) for the rows returned by
+    match_requests()
+
+    requests that were neither answered nor overwritten are counted as
+    timeouts - like process(), only once the capture goes on for more than
+    request_timeout_s after them (requests still waiting at the end of the
+    capture aren't counted as lost)
+    """
+    strings = columns["strings"]
+    latency_ms = (columns["time"][response_rows]
+                  - columns["time"][request_rows]) * 1000
+    server = columns["src"][response_rows]
+    proto = columns["proto"][response_rows]
+    status = columns["status"][response_rows]
+
+    # unanswered requests per (server, proto)
+    answered = np.zeros(len(columns["is_req"]), dtype=bool)
+    answered[request_rows] = True
+    answered[overwritten_rows] = True
+    lost = columns["is_req"] & ~answered
+    if len(columns["time"]):
+        lost &= (columns["time"] <
+                 columns["time"].max() - request_timeout_s)
+
+    # group matched pairs by (server, proto) code pair
+    group_keys = server * len(strings) + proto
+    keys, first, group, counts = np.unique(group_keys,
+                                           return_index=True,
+                                           return_inverse=True,
+                                           return_counts=True)
+    # count lost requests of servers that had any response
+    lost_keys = (columns["dst"][lost] * len(strings)
+                 + columns["proto"][lost])
+    lost_group = np.searchsorted(keys, lost_keys)
+    lost_group[lost_group == len(keys)] = 0
+    if len(keys):
+        responded = keys[lost_group] == lost_keys
+    else:
+        responded = np.zeros(len(lost_keys), dtype=bool)
+    timeouts = np.bincount(lost_group[responded], minlength=len(keys))
+
+    # sort by group once so each group's rows are a contiguous slice
+    by_group = np.argsort(group, kind="stable")
+    latency_ms = latency_ms[by_group]
+    status = status[by_group]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    stats = []
+    for g in np.argsort(first, kind="stable"):
+        group_rows = slice(starts[g], starts[g] + counts[g])
+        stats.append(latency_stats(f"{strings[keys[g] // len(strings)]} "
+                                   f"({strings[keys[g] % len(strings)]})",
+                                   latency_ms[group_rows],
+                                   status[group_rows],
+                                   int(timeouts[g])))
+
+    # servers that only had lost requests
+    unanswered_keys, unanswered_counts = np.unique(lost_keys[~responded],
+                                                   return_counts=True)
+    unanswered = sorted((f"{strings[key // len(strings)]} "
+                         f"({strings[key % len(strings)]})", int(count))
+                        for key, count in zip(unanswered_keys,
+                                              unanswered_counts))
+    for name, count in unanswered:
+        stats.append(latency_stats(name, np.empty(0), np.empty(0), count))
+    return stats
+
+
+def latency_stats(server, latency_ms, status, timeouts):
+    """
+    returns stats dict for a DNS server from arrays of its matched requests'
+    latencies and response status codes (latency stats are None if it had
+    none)
+    """
+    count = len(latency_ms)
+    if count == 0:
+        return {"server": server,
+                "total_requests": 0,
+                "timeouts": timeouts,
+                "mean_ms": None,
+                "p50_ms": None,
+                "p95_ms": None,
+                "p99_ms": None,
+                "nxdomain": 0,
+                "norecord": 0,
+                "failure_rate": None}
+    p50, p95, p99 = np.percentile(latency_ms, (50, 95, 99))
+    nxdomain = int(np.count_nonzero(status == STATUS_NXDOMAIN))
+    norecord = int(np.count_nonzero(status == STATUS_NORECORD))
+    return {"server": server,
+            "total_requests": count,
+            "timeouts": timeouts,
+            "mean_ms": float(latency_ms.mean()),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "nxdomain": nxdomain,
+            "norecord": norecord,
+            "failure_rate": (nxdomain + norecord) / count}
+
+
+## ----------------------------------------------------------------------------
+#  Parallel parsing of large capture files
+
+def split_line_chunks(path, chunk_count):
+    """
+    returns list of (start, end) byte ranges splitting file at path into
+    about chunk_count chunks on line boundaries
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = []
+            start = 0
+            for i in range(1, chunk_count + 1):
+                end = size if i == chunk_count else size * i // chunk_count
+                if end <= start:
+                    continue
+                if end < size:
+                    # move end to just after the next newline
+                    newline = mm.find(b"\n", end - 1)
+                    end = size if newline == -1 else newline + 1
+                ranges.append((start, end))
+                start = end
+                if start >= size:
+                    break
+    return ranges
+
+
+def response_status(p):
+    """
+    returns status column code for response DNS_packet p
+    """
+    if p.query_address == "NXDomain":
+        return STATUS_NXDOMAIN
+    elif p.query_address == "NoRecord":
+        return STATUS_NORECORD
+    return STATUS_OK
+
+
+def parse_chunk(path, start, end, request_timeout_s):
+    """
+    parses and matches the lines in byte range start:end of file at path
+    (run in a worker process)
+
+    returns dict of:
+         servers - server name -> (response times, latencies ms, status codes)
+                   arrays of requests matched within this chunk
+        timeouts - server name -> count of requests lost within this chunk
+         pending - requests still waiting for a response at end of chunk
+       unmatched - responses with no request in this chunk that could match a
+                   request pending from a previous chunk
+        overlaps - request key -> time of first request with key for requests
+                   early enough in this chunk to overwrite a request pending
+                   from a previous chunk
+      first_time - time of first packet (None if no packets)
+       last_time - time of last packet
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lines = mm[start:end].decode(errors="replace").splitlines()
+
+    request_cache = RequestCache(request_timeout_s, float("inf"))
+    servers = {}
+    timeouts = {}
+    unmatched = []
+    overlaps = {}
+    # keys of requests seen in this chunk so far
+    requested = set()
+    first_time = None
+    last_time = None
+    for p in parse_gen(lines):
+        if first_time is None:
+            first_time = p.time
+        last_time = p.time
+
+        for request in request_cache.Expire(p.time):
+            dns_server_name = f"{request.dst_address} ({request.proto})"
+            timeouts[dns_server_name] = timeouts.get(dns_server_name, 0) + 1
+
+        if p.is_req:
+            key = request_key(p)
+            request_cache.Add(key, p)
+            requested.add(key)
+            if (p.time - first_time <= request_timeout_s and
+                key not in overlaps):
+                overlaps[key] = p.time
+            continue
+
+        key = response_key(p)
+        request = request_cache.Pop(key)
+        if request is None:
+            if (key not in requested and
+                p.time - first_time <= request_timeout_s):
+                unmatched.append(p)
+            continue
+
+        dns_server_name = f"{p.src_address} ({p.proto})"
+        if dns_server_name not in servers:
+            servers[dns_server_name] = ([], [], [])
+        times, latencies_ms, statuses = servers[dns_server_name]
+        times.append(p.time)
+        latencies_ms.append((p.time - request.time) * 1000)
+        statuses.append(response_status(p))
+
+    return {"servers": {name: (np.array(times),
+                               np.array(latencies_ms),
+                               np.array(statuses, dtype=np.int8))
+                        for name, (times, latencies_ms, statuses)
+                        in servers.items()},
+            "timeouts": timeouts,
+            # (DNS_packets are sent back as plain tuples since the
+            # DNS_packet_type namedtuple can't be pickled by name)
+            "pending": [tuple(r) for r in request_cache.Expire(float("inf"))],
+            "unmatched": [tuple(r) for r in unmatched],
+            "overlaps": overlaps,
+            "first_time": first_time,
+            "last_time": last_time}
+
+
+def analyze_parallel(path, jobs, request_timeout_s = 5.0):
+    """
+    parses and matches capture file at path in jobs worker processes, then
+    stitches requests and responses that were split across chunks
+
+    returns list of per-server stats dicts like server_stats()
+    """
+    ranges = split_line_chunks(path, jobs * 4)
+    with ProcessPoolExecutor(jobs) as pool:
+        chunks = list(pool.map(parse_chunk,
+                               [path] * len(ranges),
+                               [start for start, end in ranges],
+                               [end for start, end in ranges],
+                               [request_timeout_s] * len(ranges)))
+
+    # server name -> lists of (response times, latencies ms, status codes)
+    # arrays to merge
+    servers = {}
+    timeouts = {}
+    def count_timeout(request):
+        dns_server_name = f"{request.dst_address} ({request.proto})"
+        timeouts[dns_server_name] = timeouts.get(dns_server_name, 0) + 1
+
+    # requests waiting for a response from previous chunks (in time order)
+    carried = OrderedDict()
+    day_offset = 0.0
+    prev_last_time = None
+    for chunk in chunks:
+        if chunk["first_time"] is None:
+            continue
+
+        # each chunk was parsed without knowing the day, so carry any
+        # midnight wrap between chunks across to this chunk's times
+        if (prev_last_time is not None and
+            chunk["first_time"] + day_offset < prev_last_time - 43200):
+            day_offset += 86400
+        prev_last_time = chunk["last_time"] + day_offset
+
+        for name, (times, latencies_ms, statuses) in chunk["servers"].items():
+            servers.setdefault(name, []).append((times + day_offset,
+                                                 latencies_ms,
+                                                 statuses))
+        for name, count in chunk["timeouts"].items():
+            timeouts[name] = timeouts.get(name, 0) + count
+
+        # ** stitch responses to requests pending from previous chunks **
+        stitched = {}
+        for p in map(DNS_packet._make, chunk["unmatched"]):
+            request = carried.pop(response_key(p), None)
+            if request is None:
+                continue
+            p = p._replace(time = p.time + day_offset)
+            if p.time - request.time > request_timeout_s:
+                # request expired before this response arrived
+                count_timeout(request)
+                continue
+            dns_server_name = f"{p.src_address} ({p.proto})"
+            times, latencies_ms, statuses = \
+              stitched.setdefault(dns_server_name, ([], [], []))
+            times.append(p.time)
+            latencies_ms.append((p.time - request.time) * 1000)
+            statuses.append(response_status(p))
+        for name, (times, latencies_ms, statuses) in stitched.items():
+            servers.setdefault(name, []).append(
+              (np.array(times),
+               np.array(latencies_ms),
+               np.array(statuses, dtype=np.int8)))
+
+        # requests overwritten by a request with the same key in this chunk
+        # (unless they had already expired)
+        for key, time in chunk["overlaps"].items():
+            request = carried.pop(key, None)
+            if (request is not None and
+                time + day_offset - request.time > request_timeout_s):
+                count_timeout(request)
+
+        # requests that expired during this chunk
+        cutoff = prev_last_time - request_timeout_s
+        while carried:
+            request = next(iter(carried.values()))
+            if request.time >= cutoff:
+                break
+            carried.popitem(last=False)
+            count_timeout(request)
+
+        for request in map(DNS_packet._make, chunk["pending"]):
+            request = request._replace(time = request.time + day_offset)
+            carried[request_key(request)] = request
+
+    # (requests still waiting at the end of the capture had less than
+    # request_timeout_s left to be answered, so like process() they aren't
+    # counted as lost)
+
+    # merge each server's chunks in response time order
+    stats = []
+    for name, parts in servers.items():
+        times = np.concatenate([times for times, _, _ in parts])
+        order = np.argsort(times, kind="stable")
+        latency_ms = np.concatenate([l for _, l, _ in parts])[order]
+        status = np.concatenate([st for _, _, st in parts])[order]
+        stats.append((times[order[0]],
+                      latency_stats(name, latency_ms, status,
+                                    timeouts.get(name, 0))))
+    stats = [s for first_time, s in sorted(stats, key = lambda s: s[0])]
+
+    # servers that only had lost requests
+    for name in sorted(set(timeouts) - set(servers)):
+        stats.append(latency_stats(name, np.empty(0), np.empty(0),
+                                   timeouts[name]))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("capture_file",
+                        help="tcpdump text output file to analyze")
+    parser.add_argument("--tcpdump_ttt",
+                        action="store_true",
+                        help="tcpdump was run with -ttt (delta timestamps)")
+    parser.add_argument("--request_timeout_s",
+                        type=float,
+                        default=5.0,
+                        help="seconds to wait for a response before counting a request as lost (default 5)")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="number of worker processes to parse with (default 1)")
+    args = parser.parse_args()
+
+    if args.jobs > 1:
+        if args.tcpdump_ttt:
+            parser.error("--tcpdump_ttt delta timestamps can't be parsed "
+                         "in parallel chunks")
+        stats = analyze_parallel(args.capture_file,
+                                 args.jobs,
+                                 args.request_timeout_s)
+    else:
+        with open(args.capture_file) as f:
+            columns = load_columns(f, args.tcpdump_ttt)
+        stats = server_stats(columns,
+                             *match_requests(columns, args.request_timeout_s),
+                             args.request_timeout_s)
+
+    print(f"{'DNS server':<40}{'reqs':>9}{'lost':>7}{'mean':>9}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'NXDom':>7}{'NoRec':>7}{'fail%':>7}")
+    for s in stats:
+        if s["total_requests"] == 0:
+            # never answered - no latency stats
+            print(f"{s['server']:<40}{s['total_requests']:>9}"
+                  f"{s['timeouts']:>7}{'-':>9}{'-':>9}{'-':>9}{'-':>9}"
+                  f"{s['nxdomain']:>7}{s['norecord']:>7}{'-':>7}")
+            continue
+        print(f"{s['server']:<40}{s['total_requests']:>9}{s['timeouts']:>7}"
+              f"{s['mean_ms']:>9.3f}{s['p50_ms']:>9.3f}{s['p95_ms']:>9.3f}"
+              f"{s['p99_ms']:>9.3f}{s['nxdomain']:>7}{s['norecord']:>7}"
+              f"{s['failure_rate'] * 100:>7.2f}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    sys.exit(0)
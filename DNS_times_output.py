@@ -0,0 +1,150 @@
+# requires Python 3.6+
+
+"""
+Headless output of matched DNS queries as JSON Lines or CSV records (see
+process()'s record_writer) for running under systemd/cron or feeding a log
+pipeline. Nothing here touches the terminal display.
+"""
+
+import csv
+import threading
+from json.encoder import encode_basestring
+
+RECORD_FIELDS = ("request_time", "response_time", "latency_ms", "source",
+                 "server", "proto", "qtype", "name", "rcode", "requester",
+                 "first_latency_ms", "attempts")
+
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+
+def response_rcode(p):
+    """
+    returns rcode record field for response DNS_packet p
+    """
+    if p.query_address == "NXDomain" or p.query_address == "NoRecord":
+        return p.query_address
+    return "OK"
+
+
+class RecordWriter:
+    """
+    Buffers one record per matched query and writes them to a binary file
+    (e.g. sys.stdout.buffer) in large writes - whenever flush_size bytes are
+    buffered, and every flush_interval_s by a background thread (so records
+    aren't held back when traffic is light)
+    """
+
+    def __init__(self,
+                 f,
+                 output_format = "jsonl",
+                 flush_size = 65536,
+                 flush_interval_s = 1.0):
+        """
+                       f - binary file to write records to
+           output_format - "jsonl" (a JSON object per line) or "csv" (with a
+                           header row)
+              flush_size - bytes of records buffered before they're written
+        flush_interval_s - maximum seconds a record stays buffered
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"RecordWriter: unknown output format "
+                             f"'{output_format}'")
+        self.f = f
+        self.output_format = output_format
+        self.flush_size = flush_size
+        self.flush_interval_s = flush_interval_s
+        self.__buffer = []
+        self.__buffer_size = 0
+        self.__lock = threading.Lock()
+        self.__closed = threading.Event()
+        if output_format == "csv":
+            # csv.writer writes each row with a single call of this object's
+            # write()
+            self.__csv_writer = csv.writer(self, lineterminator="\n")
+            self.__csv_writer.writerow(RECORD_FIELDS)
+
+        self.__flusher = threading.Thread(target=self.__FlushLoop,
+                                          daemon=True)
+        self.__flusher.start()
+
+    def write(self, text):
+        """
+        buffer text (a formatted record) for the next write to f
+        """
+        with self.__lock:
+            self.__buffer.append(text)
+            self.__buffer_size += len(text)
+            if self.__buffer_size >= self.flush_size:
+                self.__Flush()
+
+    def Write(self,
+              request,
+              response,
+              dt_s,
+              source = "",
+              first_dt_s = None,
+              attempts = 1):
+        """
+        buffer a record for request DNS_packet (the latest attempt) matched
+        by response DNS_packet dt_s seconds later, from source (tag) - the
+        request was made attempts times, the first first_dt_s seconds before
+        the response (None for the same as dt_s)
+        """
+        server = response.src_address
+        rcode = response_rcode(response)
+        first_dt_s = dt_s if first_dt_s is None else first_dt_s
+        if self.output_format == "csv":
+            self.__csv_writer.writerow((
+              f"{request.time:.6f}", f"{response.time:.6f}",
+              f"{dt_s*1000:.3f}", source, server, response.proto,
+              request.type.rstrip("?"), request.query_address, rcode,
+              request.src_address, f"{first_dt_s*1000:.3f}", attempts))
+        else:
+            self.write(
+              f'{{"request_time":{request.time:.6f},'
+              f'"response_time":{response.time:.6f},'
+              f'"latency_ms":{dt_s*1000:.3f},'
+              f'"source":{encode_basestring(source)},'
+              f'"server":{encode_basestring(server)},'
+              f'"proto":{encode_basestring(response.proto)},'
+              f'"qtype":{encode_basestring(request.type.rstrip("?"))},'
+              f'"name":{encode_basestring(request.query_address)},'
+              f'"rcode":"{rcode}",'
+              f'"requester":{encode_basestring(request.src_address)},'
+              f'"first_latency_ms":{first_dt_s*1000:.3f},'
+              f'"attempts":{attempts}}}\n')
+
+    def __Flush(self):
+        """
+        Internal function to write out buffered records (with __lock held)
+        """
+        if self.__buffer:
+            data = "".join(self.__buffer).encode(errors="replace")
+            self.__buffer.clear()
+            self.__buffer_size = 0
+            self.f.write(data)
+            self.f.flush()
+
+    def __FlushLoop(self):
+        """
+        Internal function run by a daemon thread to write out records that
+        have been buffered for flush_interval_s
+        """
+        while not self.__closed.wait(self.flush_interval_s):
+            with self.__lock:
+                self.__Flush()
+
+    def Flush(self):
+        """
+        write out all buffered records
+        """
+        with self.__lock:
+            self.__Flush()
+
+    def Close(self):
+        """
+        write out all buffered records and stop the flush thread (f is left
+        open)
+        """
+        self.__closed.set()
+        self.Flush()
@@ -1,17 +1,33 @@
 #!/usr/bin/env python3
 # requires Python 3.6+ 
 
+import io
 import sys
+import time
 import argparse
 import datetime
 import itertools
-from collections import namedtuple
-from MovingAverageClasses.MAs import SMA
-from TerminalScrollRegionsDisplay.ScrollRegion import ScrollRegion
+from bisect import bisect_left
+from collections import namedtuple, OrderedDict
+from MovingAverageClasses.MAs import SMA, TimeWindowSMA
+from MovingAverageClasses.Percentiles import WindowedPercentiles
+from MovingAverageClasses.Rollups import Rollups
 
 # size of each scroll region in rows
 scroll_region_size = 11
 
+# length in seconds of the sliding window for latency percentiles
+percentile_window_s = 60
+
+# seconds of packet time between expiries of the other DNS servers' time
+# window smas (see process()'s sma_window_s - at most a tenth of the window)
+sma_expire_interval_s = 1.0
+
+# upper bounds (ms) of the fixed latency histogram buckets (plus a final
+# bucket for anything slower) exported as metrics
+latency_bucket_bounds_ms = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+                            2500, 5000)
+
 ANSI_red_bg ="\x1b[41m"
 ANSI_cyan_bg = "\x1b[46m"
 ANSI_green_bg = "\x1b[42m"
@@ -26,198 +42,910 @@ DNS_packet = namedtuple('DNS_packet_type',['time',
                                            'src_address',
                                            'dst_address',
                                            'type',
-                                           'query_address'])
+                                           'query_address',
+                                           'src_port',
+                                           'dst_port'])
 
 DNS_Server = namedtuple('scroll_region_type',['scroll_region',
                                               'stats'])
 
 
-def time2float(t):
-    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+def float2timestamp(t):
+    """
+    formats a DNS_packet time (float seconds) as a HH:MM:SS time of day string
+    """
+    t = int(t) % 86400
+    return f"{t // 3600:02}:{t // 60 % 60:02}:{t % 60:02}"
 
 
-def parse_gen(f):
+def line_parser(tcpdump_ttt = False):
     """
-    parses tcpdump lines supplied by iterable f into a DNS_packet named tuple
+    returns a parse_line(line) function that parses one tcpdump line into a
+    DNS_packet named tuple (or None for a line that isn't a DNS packet)
+
+    Each returned function keeps its own timestamp decoding state, so lines
+    from separate tcpdump streams must be given to separate parse_line()
+    functions. The DNS_packet time field is decoded straight to float
+    seconds. Only the difference between two packet times is meaningful, but
+    time % 86400 is always the (local) time of day for display (see
+    float2timestamp()). The tcpdump timestamp format is detected from the
+    first line:
+
+           default - HH:MM:SS.ffffff (a day is added at each midnight wrap)
+               -tt - seconds since the epoch (e.g. 1618259089.682256)
+             -tttt - date and time (e.g. 2021-04-12 13:24:49.682256)
+
+    tcpdump_ttt - set True when tcpdump was run with -ttt (delta time since
+                  the previous line) since this looks the same as the default
+                  format - the deltas are summed into a running time
     """
-    for line in f:
+    # field index of the first field after the timestamp - moved up one for
+    # -tttt since its date is a field of its own
+    field_offset = None
+    # decoder for the timestamp field (picked once the format is detected)
+    decode_time = None
+    # running day offset for the default format's midnight wrap (-tttt date
+    # or -tt time zone offset)
+    day_offset = 0.0
+    # previous packet time (running sum of deltas for -ttt)
+    prev_t = 0.0
+    # last -tttt date field seen (day_offset is days since epoch_date)
+    prev_date = ""
+    epoch_date = datetime.date(1970, 1, 1)
+
+
+    def parse_line(line):
+        nonlocal field_offset, decode_time, day_offset, prev_t, prev_date
+
         # tcpdump output can be tricky to parse because the output may or
         # may not have extra fields mixed in (see "check for extra option flags
         # enclosed in square brackets" below). But this parsing method should
         # cover 99% of the request cases.
-        parts = line.strip().split(" ")
-
-        # some DNS responses presented by tcpdump may be missing some fields
-        # or fields moved from normal positions due to being Type65, No answer,
-        # NXDOMAIN, so pad so these so there will not be an index error below
-        while len(parts) < 10:
-            parts.append("@")
-
-        if len(parts) > 5:
-            time = parts[0]
-            reqid = parts[5]
-
-            t = datetime.datetime.strptime(time, '%H:%M:%S.%f').time()
-
-            if reqid.endswith('%'):
-                # strip any "checking disabled" flag
-                reqid = reqid[:-1]
-
-            if reqid.endswith('+'):
-                # strip any "recursion requested" flag
-                reqid = reqid[:-1]
-
-            dst_address = parts[4]
-            is_req = dst_address.endswith('.53:')
-
-            # strip port numbers from source and destination addresses
-            src_address = parts[2].rsplit(".", 1)[0]
-            dst_address = dst_address.rsplit(".", 1)[0]
-
-            # yield makes this a generator function so this will produce results
-            # as long as the piped tcpdump output supplies DNS lookup packets
-            if is_req:
-                # check for extra option flags enclosed in square brackets
-                # (dig does this, regular queries do not)
-                if parts[6][0] == "[":
-                    # -- tcpdump shifted field output special case --
-                    # fix by discarding the flags (e.g. the [1au]) 
-                    parts[6] = parts[7]
-                    parts[7] = parts[8]
-                    parts[8] = ""
-
-                yield DNS_packet(t,
-                                 reqid,
-                                 is_req,
-                                 parts[1],
-                                 src_address,
-                                 dst_address,
-                                 parts[6],
-                                 parts[7])
+        parts = line.split()
+
+        if field_offset is None:
+            if not parts:
+                return None
+            # -- detect timestamp format from the first line --
+            ts = parts[0]
+            if len(ts) == 10 and ts[4] == "-" and ts[7] == "-":
+                # -tttt (date field before time field)
+                field_offset = 1
+                decode_time = "tttt"
+            elif ts[2:3] == ":":
+                field_offset = 0
+                decode_time = "ttt" if tcpdump_ttt else "clock"
             else:
-                if parts[6].upper() == "NXDOMAIN":
-                    # -- tcpdump shifted field output special case --
-                    #(non-existent domain)
-                    parts[7] = "-"
-                    parts[8] = "NXDomain"
-                elif parts[6].startswith("0/"):
-                    # No record for type requested
-                    parts[7] = "-"
-                    parts[8] = "NoRecord"
-                elif parts[7].upper() == "TYPE65":
+                # -tt (seconds since the epoch) - add local time zone offset
+                # so time % 86400 is still the local time of day
+                field_offset = 0
+                decode_time = "tt"
+                day_offset = float(time.localtime(float(ts)).tm_gmtoff)
+
+        if len(parts) < 7 + field_offset:
+            # not a DNS line tcpdump output (or a truncated one)
+            return None
+
+        if field_offset:
+            # fold the -tttt date field into the time so all fields below are
+            # at their default positions
+            date = parts[0]
+            del parts[0]
+
+        ## ---------------------------------------------------------------
+        # decode timestamp straight to float seconds
+        ts = parts[0]
+        if decode_time == "tt":
+            t = float(ts)
+        else:
+            t = int(ts[0:2]) * 3600 + int(ts[3:5]) * 60 + float(ts[6:])
+
+        if decode_time == "clock":
+            if t + day_offset < prev_t - 43200:
+                # time went backwards by more than 12h - midnight wrap
+                day_offset += 86400
+            t += day_offset
+            prev_t = t
+        elif decode_time == "tt":
+            t += day_offset
+        elif decode_time == "tttt":
+            if date != prev_date:
+                # days since the epoch (only recalculated when date changes)
+                prev_date = date
+                day_offset = 86400.0 * (datetime.date(int(date[0:4]),
+                                                      int(date[5:7]),
+                                                      int(date[8:10]))
+                                        - epoch_date).days
+            t += day_offset
+        else:
+            # -ttt delta since previous line
+            prev_t += t
+            t = prev_t
+
+        # strip any header flags tcpdump appends to the ID: "+" recursion
+        # requested and "%" checking disabled on requests, "*" authoritative,
+        # "-" recursion not available, "|" truncated and "$" authenticated
+        # data on responses
+        reqid = parts[5].rstrip("*-|$+%")
+
+        # split port numbers from source and destination addresses (and the
+        # trailing ":" from the destination port)
+        src_address, _, src_port = parts[2].rpartition(".")
+        dst_address, _, dst_port = parts[4][:-1].rpartition(".")
+        is_req = dst_port == "53"
+
+        if is_req:
+            # check for extra option flags enclosed in square brackets
+            # (dig does this, regular queries do not)
+            if parts[6][0] == "[":
+                # -- tcpdump shifted field output special case --
+                # fix by discarding the flags (e.g. the [1au])
+                del parts[6]
+
+            return DNS_packet(t,
+                              reqid,
+                              is_req,
+                              parts[1],
+                              src_address,
+                              dst_address,
+                              parts[6] if len(parts) > 6 else "@",
+                              parts[7] if len(parts) > 7 else "@",
+                              src_port,
+                              dst_port)
+        else:
+            # some DNS responses presented by tcpdump may be missing some
+            # fields or fields moved from normal positions due to being
+            # Type65, No answer, NXDOMAIN
+            field6 = parts[6]
+            if field6.upper() == "NXDOMAIN":
+                # -- tcpdump shifted field output special case --
+                #(non-existent domain)
+                rtype, rdata = "-", "NXDomain"
+            elif field6.startswith("0/"):
+                # No record for type requested
+                rtype, rdata = "-", "NoRecord"
+            else:
+                rtype = parts[7] if len(parts) > 7 else "@"
+                rdata = parts[8] if len(parts) > 8 else "@"
+                if rtype.upper() == "TYPE65":
                     # first record was a Type65 encoded data block
-                    parts[7] = "TYPE65_ENCODED_DATA"
-                    parts[8] = "-"
-
-                yield DNS_packet(t,
-                                 reqid,
-                                 is_req,
-                                 parts[1],
-                                 src_address,
-                                 dst_address,
-                                 parts[7],
-                                 parts[8])
-
-def update_all_titles_with_stats(dns_servers, last_region_to_update = ""):
+                    rtype, rdata = "TYPE65_ENCODED_DATA", "-"
+
+            return DNS_packet(t,
+                              reqid,
+                              is_req,
+                              parts[1],
+                              src_address,
+                              dst_address,
+                              rtype,
+                              rdata,
+                              src_port,
+                              dst_port)
+
+    return parse_line
+
+
+def read_lines_gen(fd, chunk_size = 65536):
     """
-    make all scroll regions' title reflect new relative performance stats
-    and highlights
+    generates the lines (without line endings) read from file descriptor fd
 
-    dns_servers - iterable of DNS_Server tuples to update their titles
-    last_updated_region_name - name of the region to update title last so
-                               terminal window cursor stays there to indicate
-                               the region that last had DNS response rows added
+    fd is read in large binary chunks into one reused buffer and each chunk's
+    complete lines are decoded and split in bulk, which is much cheaper than
+    text mode's line at a time reading. A partial last line is kept until the
+    rest of it arrives. Each read returns as soon as any input is available,
+    so line buffered input (tcpdump -l) isn't delayed when traffic is light.
     """
-    # specify region title update order - doesn't matter except
-    # last_region_to_update must be at end
-    server_names = [dns_server_name for dns_server_name in dns_servers]
-    if last_region_to_update != "":
-        server_names.remove(last_region_to_update)
-        server_names.append(last_region_to_update)
+    f = io.FileIO(fd, closefd=False)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    partial = b""
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        end = buffer.rfind(b"\n", 0, n)
+        if end < 0:
+            # no complete line yet
+            partial += view[:n]
+            continue
+        if partial:
+            text = (partial + view[:end]).decode(errors="replace")
+        else:
+            text = str(view[:end], "utf-8", "replace")
+        partial = bytes(view[end + 1:n])
+        yield from text.split("\n")
 
-    fastest_server_sma_ms = min([dns_server.stats["sma_ms"].GetMA()
-                                 for dns_server in dns_servers.values()])
+    if partial:
+        yield partial.decode(errors="replace")
 
-    # update titles in all scroll regions with SMA highlights
-    for dns_server_name in server_names:
-        dns_server = dns_servers[dns_server_name]
 
-        sma_ms = dns_server.stats["sma_ms"].GetMA()
+def parse_gen(f, tcpdump_ttt = False, instrumentation = None):
+    """
+    parses tcpdump lines supplied by iterable f into a DNS_packet named tuple
+    (see line_parser())
 
-        ## ---------------------------------------------------------------
-        # pick highlight the DNS servers' sma to show relative performance
-        ANSI_SMA_highlight = ""
-        if len(dns_servers) > 1:
-            if sma_ms > 2.00 * fastest_server_sma_ms:
-                ANSI_SMA_highlight = ANSI_red_bg
-            elif sma_ms >= 1.35 * fastest_server_sma_ms:
-                ANSI_SMA_highlight = ANSI_yellow_bg
-            elif sma_ms == fastest_server_sma_ms:
-                ANSI_SMA_highlight = ANSI_green_bg
-
-        # build up a new scroll region title with these stats
-        ## ---------------------------------------------------------------
-        name   = f" {dns_server_name} "
-        reqs   = f"reqs:{dns_server.stats['total_requests']} "
-        sma    = f"{dns_server.stats['sma_ms'].GetLegend()}:"        
-        sma   += f"{dns_server.stats['sma_ms'].GetMA():>.1f}ms "
-        title  = f"{ANSI_cyan_bg}"
-        title += f"{name:<45}{reqs:>20}{ANSI_SMA_highlight}{sma:>16}"
-        title += f"{ANSI_color_reset}"
+    instrumentation - DNS_times_instrument.Instrumentation to count lines and
+                      packets and time parsing with
+    """
+    parse_line = line_parser(tcpdump_ttt)
+    if instrumentation is not None:
+        # (a loop of its own so there's no cost when not instrumented)
+        yield from instrumentation.Parse(f, parse_line)
+        return
+    for line in f:
+        p = parse_line(line)
+        # yield makes this a generator function so this will produce results
+        # as long as the piped tcpdump output supplies DNS lookup packets
+        if p is not None:
+            yield p
+
+
+class RequestCache:
+    """
+    Bounded, time-expiring correlation table of DNS requests waiting for a
+    response.
+
+    Requests are keyed by a (server_address, proto, reqid, client_address,
+    client_port) tuple built once per packet (see request_key() and
+    response_key()), so clients reusing the same DNS ID on a server don't get
+    each other's responses.
 
-        # update the scroll region title with these stats
-        dns_server.scroll_region.SetTitle(title)
+    A client retrying a request (the same key while the earlier attempt is
+    still waiting) adds to that key's chain of attempts rather than replacing
+    it, so the first attempt's time and the number of attempts are kept
+    along with the latest attempt's. A chain keeps at most max_attempts
+    requests - the first and the latest ones (retries in between are only
+    counted).
 
+    Chains are kept in order of their latest attempt so the oldest is always
+    at the front and expiry is O(1) amortized per request (each chain is
+    removed at most once - by Pop() when its response arrives or by Expire()
+    when its latest attempt has waited longer than timeout_s or the table is
+    over max_size).
+    """
+
+    def __init__(self, timeout_s = 5.0, max_size = 10000, max_attempts = 4):
+        """
+           timeout_s - seconds (in packet time) a request waits for a
+                       response before it is expired as lost
+            max_size - maximum number of keys with requests waiting for a
+                       response (the oldest are expired as lost beyond this)
+        max_attempts - maximum number of attempts kept in each key's chain
+        """
+        self.timeout_s = timeout_s
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        # [attempt count, [first request, ..., latest request]] by key
+        self.__requests = OrderedDict()
+        # number of keys waiting under each (server_address, proto, reqid)
+        # to detect DNS ID collisions between clients
+        self.__id_counts = {}
+
+    def __len__(self):
+        return len(self.__requests)
+
+    def __Forget(self, key):
+        """
+        Internal function to remove key's DNS ID from the collision counts
+        """
+        id_key = key[:3]
+        count = self.__id_counts[id_key]
+        if count == 1:
+            del self.__id_counts[id_key]
+        else:
+            self.__id_counts[id_key] = count - 1
 
-def process(packets_gen, print_requester, print_dns_failures):
+    def Add(self, key, request):
+        """
+        add request under key (as the latest attempt of the chain already
+        waiting under key, which is moved to the end)
+
+        return flag strings:
+                  empty string - no other request is waiting with this DNS ID
+                   OVERWRITTEN - a request was already waiting under key (a
+                                 client retransmission)
+                  ID_COLLISION - a request from another client is waiting on
+                                 the same server with the same DNS ID
+        """
+        requests = self.__requests
+        chain = requests.get(key)
+        if chain is not None:
+            requests.move_to_end(key)
+            chain[0] += 1
+            attempts = chain[1]
+            if len(attempts) >= self.max_attempts:
+                # drop the oldest retry (the first attempt is always kept)
+                del attempts[1]
+            attempts.append(request)
+            return "OVERWRITTEN"
+
+        requests[key] = [1, [request]]
+        id_key = key[:3]
+        count = self.__id_counts.get(id_key, 0)
+        self.__id_counts[id_key] = count + 1
+        return "ID_COLLISION" if count else ""
+
+    def Pop(self, key):
+        """
+        remove and return the latest request waiting under key (None if
+        there isn't one)
+        """
+        chain = self.PopAttempts(key)
+        return None if chain is None else chain[1][-1]
+
+    def PopAttempts(self, key):
+        """
+        remove and return (attempt count, [first request, ..., latest
+        request]) of the chain waiting under key (None if there isn't one)
+        """
+        chain = self.__requests.pop(key, None)
+        if chain is not None:
+            self.__Forget(key)
+        return chain
+
+    def Expire(self, now):
+        """
+        remove and return a list of the latest requests of chains that timed
+        out as of packet time now (plus any oldest chains beyond max_size)
+        """
+        return [attempts[-1]
+                for _, attempts in self.ExpireAttempts(now)]
+
+    def ExpireAttempts(self, now):
+        """
+        remove and return a list of (attempt count, [first request, ...,
+        latest request]) of chains that timed out as of packet time now (plus
+        any oldest chains beyond max_size)
+        """
+        requests = self.__requests
+        expired = []
+        cutoff = now - self.timeout_s
+        while requests:
+            oldest = next(iter(requests.values()))
+            if oldest[1][-1].time >= cutoff and len(requests) <= self.max_size:
+                break
+            key, chain = requests.popitem(last=False)
+            self.__Forget(key)
+            expired.append(chain)
+        return expired
+
+
+def request_key(p):
+    """
+    returns RequestCache key for request DNS_packet p
+    """
+    return (p.dst_address, p.proto, p.reqid, p.src_address, p.src_port)
+
+
+def response_key(p):
+    """
+    returns RequestCache key for response DNS_packet p (note address swap so
+    responses match key made with original request's addresses)
+    """
+    return (p.src_address, p.proto, p.reqid, p.dst_address, p.dst_port)
+
+
+def new_server_stats(sma_window_s = None):
+    """
+    returns a statistics dict for a newly seen DNS server
+
+    sma_window_s - seconds of packet time the title's SMA covers (None for
+                   the last scroll region's worth of responses)
+    """
+    if sma_window_s:
+        sma = TimeWindowSMA("", sma_window_s)
+    else:
+        # use the number of rows in the scroll region (less the title row)
+        # for the SMA period
+        sma = SMA("", scroll_region_size - 1)
+    return {"total_requests" : 0,
+            "timeouts" : 0,
+            "id_collisions" : 0,
+            # client retransmissions (a request retried while an earlier
+            # attempt was still waiting), attempts given up on (earlier
+            # attempts of answered requests and all attempts of lost ones)
+            # and requests answered after being retried
+            "overwritten" : 0,
+            "unanswered_attempts" : 0,
+            "retried" : 0,
+            "sma_ms": sma,
+            # latency percentiles over a sliding window of packet time
+            "window_latency_ms": WindowedPercentiles("", percentile_window_s),
+            # lookup failures
+            "nxdomain" : 0,
+            "norecord" : 0,
+            # fixed bucket latency histogram (counts by
+            # latency_bucket_bounds_ms bucket) and sum of all latencies
+            "latency_buckets" : [0] * (len(latency_bucket_bounds_ms) + 1),
+            "latency_sum_ms" : 0.0,
+            # the same from each request's first attempt (the latency the
+            # user saw - the others are from its latest attempt)
+            "first_attempt_latency_buckets" :
+              [0] * (len(latency_bucket_bounds_ms) + 1),
+            "first_attempt_latency_sum_ms" : 0.0,
+            # latency count/sum/min/max and failures (lost requests and
+            # lookup failures) by 1s/1m/1h bucket of packet time
+            "rollups_ms" : Rollups()}
+
+
+def add_response_stats(stats, dt_s, p, first_dt_s = None, attempt_count = 1):
+    """
+    counts response DNS_packet p to a request that took dt_s seconds in a
+    DNS server's statistics dict
+
+       first_dt_s - seconds since the request's first attempt (None if it
+                    wasn't retried)
+    attempt_count - number of attempts made of the request
+    """
+    dt_ms = dt_s*1000
+    if first_dt_s is None:
+        first_dt_ms = dt_ms
+    else:
+        first_dt_ms = first_dt_s*1000
+        stats["unanswered_attempts"] += attempt_count - 1
+        stats["retried"] += 1
+    stats["first_attempt_latency_buckets"][
+      bisect_left(latency_bucket_bounds_ms, first_dt_ms)] += 1
+    stats["first_attempt_latency_sum_ms"] += first_dt_ms
+    stats["total_requests"] += 1
+    stats["sma_ms"].CalculateNextMA(dt_ms, time=p.time)
+    stats["window_latency_ms"].AddValue(dt_ms, p.time)
+    stats["latency_buckets"][bisect_left(latency_bucket_bounds_ms, dt_ms)] += 1
+    stats["latency_sum_ms"] += dt_ms
+    stats["rollups_ms"].AddValue(dt_ms, p.time)
+    if p.query_address == "NXDomain":
+        stats["nxdomain"] += 1
+        stats["rollups_ms"].AddFailure(p.time)
+    elif p.query_address == "NoRecord":
+        stats["norecord"] += 1
+        stats["rollups_ms"].AddFailure(p.time)
+
+
+class IndexedMinHeap:
+    """
+    Binary min heap of (value, key) pairs indexed by key, so a key's value
+    can be updated in O(log n) while the minimum is always available in O(1)
+    """
+
+    def __init__(self):
+        self.__heap = []        # [value, key] pairs
+        self.__positions = {}   # key -> index of its pair in __heap
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def Min(self):
+        """
+        returns (value, key) pair with the minimum value
+        """
+        value, key = self.__heap[0]
+        return value, key
+
+    def Update(self, key, value):
+        """
+        add key with value, or change the value of key if already present
+        """
+        i = self.__positions.get(key)
+        if i is None:
+            i = len(self.__heap)
+            self.__heap.append([value, key])
+            self.__positions[key] = i
+            self.__SiftUp(i)
+        elif value < self.__heap[i][0]:
+            self.__heap[i][0] = value
+            self.__SiftUp(i)
+        else:
+            self.__heap[i][0] = value
+            self.__SiftDown(i)
+
+    def __Swap(self, i, j):
+        heap = self.__heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.__positions[heap[i][1]] = i
+        self.__positions[heap[j][1]] = j
+
+    def __SiftUp(self, i):
+        heap = self.__heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if heap[i][0] >= heap[parent][0]:
+                break
+            self.__Swap(i, parent)
+            i = parent
+
+    def __SiftDown(self, i):
+        heap = self.__heap
+        n = len(heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and heap[child][0] < heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                break
+            self.__Swap(i, smallest)
+            i = smallest
+
+
+def current_sma_ms(stats):
+    """
+    returns a DNS server's current sma from its statistics dict (None if
+    its SMA is a TimeWindowSMA with no responses in its window)
+    """
+    sma = stats["sma_ms"]
+    if type(sma) is TimeWindowSMA and sma.GetCount() == 0:
+        return None
+    return sma.GetMA()
+
+
+def pick_sma_highlight(sma_ms, fastest_server_sma_ms, server_count):
+    """
+    returns the ANSI highlight for a DNS server's sma to show its relative
+    performance against the fastest DNS server's sma
+    """
+    if sma_ms is None:
+        # no recent responses to compare
+        return ""
+    if server_count > 1:
+        if sma_ms > 2.00 * fastest_server_sma_ms:
+            return ANSI_red_bg
+        elif sma_ms >= 1.35 * fastest_server_sma_ms:
+            return ANSI_yellow_bg
+        elif sma_ms == fastest_server_sma_ms:
+            return ANSI_green_bg
+    return ""
+
+
+def format_title(dns_server_name, dns_server, ANSI_SMA_highlight):
+    """
+    returns scroll region title for dns_server with its current stats
+    """
+    name   = f" {dns_server_name} "
+    reqs   = f"reqs:{dns_server.stats['total_requests']} "
+    lost   = f"lost:{dns_server.stats['timeouts']} "
+    coll   = f"coll:{dns_server.stats['id_collisions']} "
+    ovr    = f"ovr:{dns_server.stats['overwritten']} "
+    sma_ms = current_sma_ms(dns_server.stats)
+    sma    = f"{dns_server.stats['sma_ms'].GetLegend()}:"
+    sma   += "- " if sma_ms is None else f"{sma_ms:>.1f}ms "
+    p95    = dns_server.stats['window_latency_ms'].GetPercentile(95)
+    pcts   = f" p95:{p95:.1f}ms "
+    title  = f"{ANSI_cyan_bg}"
+    title += f"{name:<32}{reqs:>12}{lost:>9}{coll:>8}{ovr:>8}"
+    title += f"{ANSI_SMA_highlight}{sma:>16}{ANSI_cyan_bg}{pcts:<14}"
+    title += f"{ANSI_color_reset}"
+    return title
+
+
+class ServerTitles:
+    """
+    Keeps all DNS server scroll region titles up to date with their stats
+    and relative performance highlights, redrawing a title only when its
+    text or highlight actually changes.
+
+    The fastest server's sma is tracked in an IndexedMinHeap, so a stats
+    change on one server costs O(log servers) - other servers' highlights
+    are only rechecked when the fastest sma (or the number of servers)
+    changes. (A server with an empty TimeWindowSMA window is never the
+    fastest and isn't highlighted.)
+    """
+
+    def __init__(self, dns_servers):
+        """
+        dns_servers - dict of DNS_Server tuples by name (shared with the
+                      caller, which adds new DNS servers to it)
+        """
+        self.dns_servers = dns_servers
+        self.__sma_heap = IndexedMinHeap()
+        self.__fastest_server_sma_ms = None
+        self.__server_count = 0
+        # last drawn title text and highlight by DNS server name
+        self.__titles = {}
+        self.__highlights = {}
+
+    def __Redraw(self, dns_server_name, ANSI_SMA_highlight):
+        """
+        Internal function to redraw a title if its text changed
+        """
+        dns_server = self.dns_servers[dns_server_name]
+        self.__highlights[dns_server_name] = ANSI_SMA_highlight
+        title = format_title(dns_server_name, dns_server, ANSI_SMA_highlight)
+        if title != self.__titles.get(dns_server_name):
+            self.__titles[dns_server_name] = title
+            dns_server.scroll_region.SetTitle(title)
+
+    def Update(self, changed_server_names):
+        """
+        make scroll region titles reflect new relative performance stats
+        and highlights
+
+        changed_server_names - names of DNS servers whose stats changed (the
+                               last one is redrawn last so terminal window
+                               cursor stays there to indicate the region that
+                               last had DNS response rows added)
+        """
+        for dns_server_name in changed_server_names:
+            sma_ms = current_sma_ms(self.dns_servers[dns_server_name].stats)
+            self.__sma_heap.Update(
+              dns_server_name,
+              float("inf") if sma_ms is None else sma_ms)
+
+        fastest_server_sma_ms = self.__sma_heap.Min()[0]
+        server_count = len(self.dns_servers)
+
+        if (fastest_server_sma_ms != self.__fastest_server_sma_ms or
+            server_count != self.__server_count):
+            # relative performance changed - recheck highlights of servers
+            # whose stats didn't change
+            self.__fastest_server_sma_ms = fastest_server_sma_ms
+            self.__server_count = server_count
+            for dns_server_name, dns_server in self.dns_servers.items():
+                if dns_server_name in changed_server_names:
+                    continue
+                ANSI_SMA_highlight = \
+                  pick_sma_highlight(current_sma_ms(dns_server.stats),
+                                     fastest_server_sma_ms,
+                                     server_count)
+                if ANSI_SMA_highlight != self.__highlights[dns_server_name]:
+                    self.__Redraw(dns_server_name, ANSI_SMA_highlight)
+
+        for dns_server_name in changed_server_names:
+            self.__Redraw(
+              dns_server_name,
+              pick_sma_highlight(
+                current_sma_ms(self.dns_servers[dns_server_name].stats),
+                fastest_server_sma_ms,
+                server_count))
+
+
+def process(packets_gen,
+            print_requester,
+            print_dns_failures,
+            request_timeout_s = 5.0,
+            max_pending_requests = 10000,
+            scroll_region_class = None,
+            source_tagged = False,
+            record_writer = None,
+            metrics_exporter = None,
+            sma_window_s = None,
+            instrumentation = None,
+            load_shedder = None,
+            top_names = None,
+            requester_stats = None,
+            race_tracker = None):
     """
     processes the packet generator stream packets_gen from tcpdump produced by
     parse_gen
+
+       request_timeout_s - seconds a request waits for its response before it
+                           is counted as lost on its DNS server
+    max_pending_requests - maximum number of requests waiting for a response
+                           per source (oldest are counted as lost beyond
+                           this)
+     scroll_region_class - ScrollRegion (the default) to display each
+                           response as it's processed or BufferedScrollRegion
+                           to only buffer them for its frame-rate-limited
+                           render thread
+           source_tagged - packets_gen yields (source tag, DNS_packet) pairs
+                           (e.g. from DNS_times_sources.sources_gen()) - each
+                           source's requests are matched and timed out on
+                           their own and DNS server names are prefixed with
+                           their source tag
+           record_writer - DNS_times_output.RecordWriter to write a record
+                           for each response instead of displaying it
+                           (headless - the terminal display isn't used)
+        metrics_exporter - DNS_times_metrics.MetricsExporter to serve the
+                           DNS servers' stats from
+            sma_window_s - seconds of packet time each DNS server's title sma
+                           covers (a TimeWindowSMA - so all servers are
+                           compared over the same time window) instead of
+                           the last scroll region's worth of responses
+         instrumentation - DNS_times_instrument.Instrumentation to count
+                           packets and time matching/stats, title updates
+                           and display with (and to show its status region)
+            load_shedder - DNS_times_shed.LoadShedder to cut display and
+                           output record work with when process() falls
+                           behind the live traffic (stats stay exact)
+               top_names - DNS_times_names.TopNames to count each
+                           response's query name in (its scroll regions are
+                           shown above the DNS servers' unless headless)
+         requester_stats - DNS_times_requesters.RequesterStats to count
+                           each request, response and lost request in by
+                           requester (its scroll region is shown above the
+                           DNS servers' unless headless)
+            race_tracker - DNS_times_races.RaceTracker to group requests
+                           fanned out to several DNS servers into races and
+                           score them (its scroll region is shown above the
+                           DNS servers' unless headless)
     """
+    if scroll_region_class is None and record_writer is None:
+        from TerminalScrollRegionsDisplay.ScrollRegion import ScrollRegion
+        scroll_region_class = ScrollRegion
+
     dns_servers = {}
-    request_cache = {}
-    for p in packets_gen:
+    # statistics dicts for all DNS servers seen (a DNS server only gets a
+    # scroll region once its first response arrives)
+    server_stats = {}
+    # request caches by source tag (each source's packet times come from its
+    # own clock)
+    request_caches = {}
+    server_titles = ServerTitles(dns_servers)
+    if not source_tagged:
+        packets_gen = zip(itertools.repeat(""), packets_gen)
+    if metrics_exporter is not None:
+        # let metrics snapshots be taken between packets
+        packets_gen = metrics_exporter.Watch(packets_gen, server_stats)
+    if instrumentation is not None:
+        # count packets and time process()'s work on each one (and the
+        # title updates and scroll region lines within that)
+        packets_gen = instrumentation.Watch(packets_gen, server_stats,
+                                            scroll_region_class)
+        server_titles.Update = instrumentation.Timed("titles",
+                                                     server_titles.Update)
+    if top_names is not None and scroll_region_class is not None:
+        top_names.ShowRegions(scroll_region_class)
+    if requester_stats is not None and scroll_region_class is not None:
+        requester_stats.ShowRegion(scroll_region_class)
+    if race_tracker is not None and scroll_region_class is not None:
+        race_tracker.ShowRegion(scroll_region_class)
+    # load shedding level (see DNS_times_shed.py - always 0 without a
+    # load_shedder)
+    shed_level = 0
+    # displayed DNS servers whose counts changed since their title was last
+    # redrawn (by responses not displayed while shedding load, or by ID
+    # collisions and retransmissions) - redrawn with the next displayed
+    # response (the dict is an insertion ordered set)
+    stale_server_names = {}
+    # names of the DNS servers with scroll regions and the packet time their
+    # time window smas are next expired at - by source tag
+    source_server_names = {}
+    next_sma_expire_times = {}
+    if sma_window_s:
+        expire_interval_s = min(sma_expire_interval_s, sma_window_s / 10)
+    for source, p in packets_gen:
+        if load_shedder is not None:
+            shed_level = load_shedder.Check(source, p.time)
+        request_cache = request_caches.get(source)
+        if request_cache is None:
+            request_cache = request_caches[source] = \
+              RequestCache(request_timeout_s, max_pending_requests)
+        # DNS server name prefix
+        source_prefix = f"{source} " if source else ""
+
+        # ** expire requests that never got a response **
+        expired_chains = request_cache.ExpireAttempts(p.time)
+        if expired_chains:
+            expired_server_names = []
+            for attempt_count, attempts in expired_chains:
+                request = attempts[-1]
+                dns_server_name = \
+                  f"{source_prefix}{request.dst_address} ({request.proto})"
+                if dns_server_name not in server_stats:
+                    server_stats[dns_server_name] = new_server_stats(sma_window_s)
+                server_stats[dns_server_name]["timeouts"] += 1
+                server_stats[dns_server_name]["unanswered_attempts"] += \
+                  attempt_count
+                server_stats[dns_server_name]["rollups_ms"].AddFailure(p.time)
+                if requester_stats is not None:
+                    requester_stats.AddLost(
+                      source, f"{source_prefix}{request.src_address}", p.time)
+                if (dns_server_name in dns_servers and
+                    dns_server_name not in expired_server_names):
+                    expired_server_names.append(dns_server_name)
+            if expired_server_names:
+                server_titles.Update(expired_server_names)
+        if race_tracker is not None:
+            race_tracker.Expire(source, p.time)
+
         if p.is_req:
             # ** new DNS request **
             # make note of new DNS request
-            request_cache[p.dst_address+'-'+p.proto+'-'+p.reqid] = p
-        elif p.src_address+'-'+p.proto+'-'+p.reqid in request_cache:
-            #   ^^^^^ note address swap in key so responses match key
-            #         made with original request's dst_address
-            # ** DNS response **
-            # calculate time this request took
-            request = request_cache[p.src_address+'-'+p.proto+'-'+p.reqid]
-            del request_cache[p.src_address+'-'+p.proto+'-'+p.reqid]
-
-            # add DNS response data to its scroll region for display
-            dns_server_name = f"{p.src_address+' ('+p.proto+')'}"
-            # calculate time request took in seconds
-            dt_s = time2float(p.time) - time2float(request.time)
-
-            if dns_server_name not in dns_servers:
-                # create scroll region and statistics dict for this DNS server
-                dns_server = \
-                   DNS_Server(ScrollRegion(dns_server_name, scroll_region_size),
-                             {"total_requests" : 0,
-                              "sma_ms": SMA("", scroll_region_size - 1)})
-                # use the number of rows in the scroll region (less the title
-                # row) for the SMA period
-
-                dns_servers[dns_server_name] = dns_server
-            else:
-                # find previously created scroll region and statistics dict
-                dns_server = dns_servers[dns_server_name]
+            add_flag = request_cache.Add(request_key(p), p)
+            if requester_stats is not None:
+                requester_stats.AddRequest(source,
+                                           f"{source_prefix}{p.src_address}",
+                                           p.time)
+            if race_tracker is not None:
+                race_tracker.AddRequest(
+                  (source, p.reqid, p.query_address, p.type),
+                  f"{source_prefix}{p.dst_address} ({p.proto})", p.time)
+            if add_flag != "":
+                # count mismatch risk on this request's DNS server
+                dns_server_name = \
+                  f"{source_prefix}{p.dst_address} ({p.proto})"
+                if dns_server_name not in server_stats:
+                    server_stats[dns_server_name] = new_server_stats(sma_window_s)
+                if add_flag == "OVERWRITTEN":
+                    server_stats[dns_server_name]["overwritten"] += 1
+                else:
+                    server_stats[dns_server_name]["id_collisions"] += 1
+                if dns_server_name in dns_servers:
+                    stale_server_names[dns_server_name] = None
+            continue
+
+        chain = request_cache.PopAttempts(response_key(p))
+        if chain is None:
+            # ** DNS response without a matching request in request_cache **
+            # ignore this response - no matching request in request_cache
+            continue
+
+        # ** DNS response **
+        dns_server_name = f"{source_prefix}{p.src_address} ({p.proto})"
+        attempt_count, attempts = chain
+        request = attempts[-1]
+        # calculate time request took in seconds (from its latest attempt,
+        # and from its first attempt if the client retried it)
+        dt_s = p.time - request.time
+        first_dt_s = p.time - attempts[0].time if attempt_count > 1 else None
+        if top_names is not None:
+            top_names.Add(dns_server_name, request.query_address,
+                          dt_s * 1000, p.time)
+        if requester_stats is not None:
+            requester_stats.AddResponse(
+              source, f"{source_prefix}{request.src_address}", dt_s * 1000,
+              p.query_address == "NXDomain" or p.query_address == "NoRecord",
+              p.time)
+        if race_tracker is not None:
+            race_tracker.AddResponse(
+              (source, request.reqid, request.query_address, request.type),
+              dns_server_name, p.time)
+
+        if record_writer is not None:
+            # headless - write a record for this response and count it in
+            # its DNS server's stats (there are no scroll regions)
+            stats = server_stats.get(dns_server_name)
+            if stats is None:
+                stats = server_stats[dns_server_name] = new_server_stats(sma_window_s)
+            if not shed_level or load_shedder.KeepRecord():
+                record_writer.Write(request, p, dt_s, source, first_dt_s,
+                                    attempt_count)
+            add_response_stats(stats, dt_s, p, first_dt_s, attempt_count)
+            continue
+
+        if shed_level >= 2 and not load_shedder.KeepLine():
+            # shedding load - only count this response in its DNS server's
+            # stats (its title is redrawn with the next displayed response)
+            stats = server_stats.get(dns_server_name)
+            if stats is None:
+                stats = server_stats[dns_server_name] = new_server_stats(sma_window_s)
+            add_response_stats(stats, dt_s, p, first_dt_s, attempt_count)
+            if dns_server_name in dns_servers:
+                stale_server_names[dns_server_name] = None
+            continue
 
-            # add this DNS request/response datum to its ScrollRegion
-            # instance for display - request datum columns:
-            # | Request Duration ms (and time of response) | DNS Request Type | Address Looked Up | [Requester Address]
-            timestamp = str(p.time).rsplit(".", 1)[0]
+        # add DNS response data to its scroll region for display
+        if dns_server_name not in dns_servers:
+            # create scroll region and statistics dict for this DNS server
+            if dns_server_name not in server_stats:
+                server_stats[dns_server_name] = new_server_stats(sma_window_s)
+            scroll_region = scroll_region_class(dns_server_name,
+                                                scroll_region_size)
+            if instrumentation is not None:
+                scroll_region.AddLine = \
+                  instrumentation.Timed("display", scroll_region.AddLine)
+            dns_server = DNS_Server(scroll_region,
+                                    server_stats[dns_server_name])
+
+            dns_servers[dns_server_name] = dns_server
+            source_server_names.setdefault(source, []).append(dns_server_name)
+        else:
+            # find previously created scroll region and statistics dict
+            dns_server = dns_servers[dns_server_name]
+
+        # add this DNS request/response datum to its ScrollRegion
+        # instance for display - request datum columns:
+        # | Request Duration ms (and time of response) | DNS Request Type | Address Looked Up | [Requester Address]
+        if shed_level and load_shedder.PlainLine():
+            # shedding load - just the request duration and address
+            line = f"{dt_s*1000:>7.3f}ms {request.query_address[:-1]}"
+        else:
+            timestamp = float2timestamp(p.time)
             line  = f"{dt_s*1000:>7.3f}ms " # request duration
             line += f"({timestamp}) "       # time of response
             line += f"{request.type:^8} "
             line += f"{request.query_address[:-1]}" # (the [:-1] trims the
-                                                    # trailing period from the
-                                                    # address looked up)
+                                                    # trailing period from
+                                                    # the address looked up)
             if print_dns_failures:
                 if (p.query_address == "NXDomain" or 
                     p.query_address == "NoRecord"):
@@ -229,19 +957,43 @@ def process(packets_gen, print_requester, print_dns_failures):
                 # requester address is desired in output also
                 line += f" [from {request.src_address}]"
 
-            dns_server.scroll_region.AddLine(line)
+            if first_dt_s is not None:
+                # retried - show the latency from the first attempt
+                line += (f" (first of {attempt_count} attempts "
+                         f"{first_dt_s*1000:.3f}ms)")
 
-            # update this scroll region's stats
-            dns_server.stats["total_requests"] += 1
-            dns_server.stats["sma_ms"].CalculateNextMA(dt_s*1000)
+        dns_server.scroll_region.AddLine(line)
 
-            # make all scroll regions' title reflect new relative
-            # performance stats and highlights
-            update_all_titles_with_stats(dns_servers, dns_server_name)
-        else:
-            # ** DNS response without a matching request in request_cache **
-            # ignore this response - no matching request in request_cache
-            pass
+        # update this scroll region's stats
+        add_response_stats(dns_server.stats, dt_s, p, first_dt_s,
+                           attempt_count)
+
+        changed_server_names = []
+        if (sma_window_s and
+            p.time >= next_sma_expire_times.get(source, float("-inf"))):
+            # drop responses older than the window from this source's other
+            # DNS servers' smas so all are compared over the same time window
+            # (each response's DNS server expires its own - the others only
+            # every expire_interval_s, so this isn't O(servers) per response)
+            next_sma_expire_times[source] = p.time + expire_interval_s
+            for other_server_name in source_server_names[source]:
+                if (other_server_name != dns_server_name and
+                    dns_servers[other_server_name].stats["sma_ms"].Expire(
+                      p.time)):
+                    changed_server_names.append(other_server_name)
+        if stale_server_names:
+            # catch up titles (and the fastest sma) with counts that changed
+            # without a redraw
+            stale_server_names.pop(dns_server_name, None)
+            for changed_server_name in changed_server_names:
+                stale_server_names.pop(changed_server_name, None)
+            changed_server_names.extend(stale_server_names)
+            stale_server_names.clear()
+        changed_server_names.append(dns_server_name)
+
+        # make all scroll regions' title reflect new relative
+        # performance stats and highlights
+        server_titles.Update(changed_server_names)
 
 
 def main():
@@ -252,11 +1004,226 @@ def main():
     parser.add_argument("--print_dns_failures",
                         action="store_true",
                         help="prints a tag for lookups that result in NoRecord and NXDomain")
+    parser.add_argument("--tcpdump_ttt",
+                        action="store_true",
+                        help="tcpdump was run with -ttt (delta timestamps)")
+    parser.add_argument("--pcap",
+                        action="store_true",
+                        help="stdin is a pcap/pcapng capture (e.g. from tcpdump -U -w -) instead of tcpdump text output")
+    parser.add_argument("--source",
+                        action="append",
+                        default=[],
+                        metavar="TAG=COMMAND",
+                        help="read tcpdump output from a shell command (e.g. r7800=\"ssh r7800 'tcpdump -K -l -i eth0.2 udp port 53'\") instead of stdin - can be repeated, DNS servers are tagged with TAG")
+    parser.add_argument("--source_file",
+                        action="append",
+                        default=[],
+                        metavar="TAG=PATH",
+                        help="read tcpdump output from a file or FIFO instead of stdin - can be repeated, DNS servers are tagged with TAG")
+    parser.add_argument("--output",
+                        choices=("jsonl", "csv"),
+                        help="headless - write a JSON Lines or CSV record for each response instead of displaying scroll regions")
+    parser.add_argument("--output_file",
+                        metavar="PATH",
+                        help="file to append --output records to (default stdout)")
+    parser.add_argument("--metrics_port",
+                        type=int,
+                        help="serve Prometheus metrics at http://METRICS_ADDRESS:METRICS_PORT/metrics")
+    parser.add_argument("--metrics_address",
+                        default="127.0.0.1",
+                        help="address for the --metrics_port HTTP server to listen on (default 127.0.0.1)")
+    parser.add_argument("--metrics_textfile",
+                        metavar="PATH",
+                        help="write Prometheus metrics to PATH every 10 seconds (e.g. for node_exporter's textfile collector)")
+    parser.add_argument("--request_timeout_s",
+                        type=float,
+                        default=5.0,
+                        help="seconds to wait for a response before counting a request as lost (default 5)")
+    parser.add_argument("--max_pending_requests",
+                        type=int,
+                        default=10000,
+                        help="maximum requests waiting for a response before the oldest are counted as lost (default 10000)")
+    parser.add_argument("--sma_window_s",
+                        type=float,
+                        help="make each title's sma the average over this many seconds of packet time instead of the last 10 responses, so all DNS servers are compared over the same time window")
+    parser.add_argument("--frame_rate",
+                        type=float,
+                        default=0,
+                        help="redraw scroll regions this many times a second instead of scrolling each response line (default 0 - off)")
+    parser.add_argument("--instrument",
+                        action="store_true",
+                        help="count and time each pipeline stage (parse, match+stats, titles, display) - SIGUSR1 writes them as JSON to --instrument_file")
+    parser.add_argument("--instrument_file",
+                        metavar="PATH",
+                        default="DNS_times_instrument.json",
+                        help="file SIGUSR1 writes --instrument JSON to (default DNS_times_instrument.json)")
+    parser.add_argument("--status_region",
+                        action="store_true",
+                        help="show --instrument counters and each stage's share of time in a status region (implies --instrument)")
+    parser.add_argument("--profile_s",
+                        type=float,
+                        help="run cProfile for this many seconds at start and again on each SIGUSR2, writing the profile to --profile_file (implies --instrument)")
+    parser.add_argument("--profile_file",
+                        metavar="PATH",
+                        default="DNS_times.prof",
+                        help="file --profile_s writes cProfile stats to (default DNS_times.prof - view with python -m pstats)")
+    parser.add_argument("--shed_lag_s",
+                        type=float,
+                        help="shed display/output work in steps once packets are this many seconds behind the live traffic - plain lines, then sampled lines, then sampled records (stats stay exact)")
+    parser.add_argument("--top_names",
+                        type=int,
+                        metavar="K",
+                        help="keep the top K query names by count and by total latency for each DNS server and all servers (fixed memory) - shown in two scroll regions, or written to stderr at exit with --output")
+    parser.add_argument("--top_requesters",
+                        type=int,
+                        metavar="N",
+                        help="keep query rate, failure rate, lost requests and latency for each requester and list the N busiest - shown in a scroll region, or written to stderr at exit with --output")
+    parser.add_argument("--requester_ttl_s",
+                        type=float,
+                        default=600.0,
+                        help="seconds (packet time) since a requester was last seen before --top_requesters drops its stats (default 600)")
+    parser.add_argument("--max_requesters",
+                        type=int,
+                        default=1000,
+                        help="maximum requesters --top_requesters keeps stats for per source - the least recently seen are dropped beyond this (default 1000)")
+    parser.add_argument("--race_window_s",
+                        type=float,
+                        help="group requests for the same DNS ID, name and type sent to several DNS servers within this many seconds into hedged query races and show each server's win rate, win margin and own vs race latency - in a scroll region, or written to stderr at exit with --output")
     args = parser.parse_args()
 
-    print("\n-- waiting for tcpdump DNS packets stream --")
+    commands = files = []
+    if args.source or args.source_file:
+        from DNS_times_sources import parse_source_arg, sources_gen
+        if args.pcap:
+            parser.error("--pcap can't be used with --source/--source_file")
+        try:
+            commands = [parse_source_arg(arg) for arg in args.source]
+            files = [parse_source_arg(arg) for arg in args.source_file]
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.output_file and not args.output:
+        parser.error("--output_file requires --output")
+    if args.status_region and args.output:
+        parser.error("--status_region can't be used with --output")
+
+    load_shedder = None
+    if args.shed_lag_s:
+        from DNS_times_shed import LoadShedder
+        # report level changes on stderr when it isn't under the display
+        load_shedder = LoadShedder(args.shed_lag_s,
+                                   sys.stderr if args.output else None,
+                                   bool(args.output))
+
+    top_names = None
+    if args.top_names:
+        from DNS_times_names import TopNames
+        top_names = TopNames(args.top_names)
+
+    requester_stats = None
+    if args.top_requesters:
+        from DNS_times_requesters import RequesterStats
+        requester_stats = RequesterStats(args.top_requesters,
+                                         args.requester_ttl_s,
+                                         args.max_requesters)
+
+    race_tracker = None
+    if args.race_window_s:
+        from DNS_times_races import RaceTracker
+        race_tracker = RaceTracker(args.race_window_s, args.request_timeout_s)
+
+    instrumentation = None
+    if args.instrument or args.status_region or args.profile_s:
+        import signal
+        from DNS_times_instrument import Instrumentation
+        instrumentation = Instrumentation(
+          status_interval_s=1.0 if args.status_region else None,
+          profile_s=args.profile_s or 0,
+          profile_path=args.profile_file,
+          load_shedder=load_shedder)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1,
+                          lambda signum, frame:
+                            instrumentation.WriteJSON(args.instrument_file))
+        if args.profile_s:
+            if hasattr(signal, "SIGUSR2"):
+                signal.signal(signal.SIGUSR2,
+                              lambda signum, frame:
+                                instrumentation.StartProfile())
+            instrumentation.StartProfile()
+
+    record_writer = None
+    scroll_region_class = None
+    if args.output:
+        # headless - the terminal display is never imported
+        from DNS_times_output import RecordWriter
+        if args.output_file:
+            output_file = open(args.output_file, "ab")
+        else:
+            output_file = sys.stdout.buffer
+        record_writer = RecordWriter(output_file, args.output)
+    elif args.frame_rate > 0:
+        # ingest at full speed and redraw at a fixed frame rate
+        from TerminalScrollRegionsDisplay.ScrollRegion import \
+                                                    BufferedScrollRegion
+        scroll_region_class = BufferedScrollRegion
+        BufferedScrollRegion.StartRendering(args.frame_rate)
+
+    if commands or files:
+        # read all sources at once, tagging each packet with its source
+        packets_gen = sources_gen(commands, files, args.tcpdump_ttt,
+                                  instrumentation)
+    elif args.pcap:
+        from DNS_times_pcap import pcap_gen
+        packets_gen = pcap_gen(sys.stdin.buffer, instrumentation)
+    else:
+        packets_gen = parse_gen(read_lines_gen(sys.stdin.fileno()),
+                                args.tcpdump_ttt, instrumentation)
+
+    metrics_exporter = None
+    if args.metrics_port or args.metrics_textfile:
+        from DNS_times_metrics import MetricsExporter
+        metrics_exporter = MetricsExporter()
+        if args.metrics_port:
+            metrics_exporter.StartServer(args.metrics_port,
+                                         args.metrics_address)
+        if args.metrics_textfile:
+            metrics_exporter.StartTextfile(args.metrics_textfile)
+
+    if record_writer is None:
+        print("\n-- waiting for tcpdump DNS packets stream --")
     # get tcpdump output stream from stdin
-    process(parse_gen(sys.stdin), args.print_requester, args.print_dns_failures)
+    try:
+        process(packets_gen,
+                args.print_requester, args.print_dns_failures,
+                args.request_timeout_s, args.max_pending_requests,
+                scroll_region_class, bool(commands or files),
+                record_writer, metrics_exporter, args.sma_window_s,
+                instrumentation, load_shedder, top_names, requester_stats,
+                race_tracker)
+    finally:
+        if race_tracker is not None and record_writer is not None:
+            # headless summary
+            race_tracker.WriteSummary()
+        if requester_stats is not None and record_writer is not None:
+            # headless summary
+            requester_stats.WriteSummary()
+        if top_names is not None and record_writer is not None:
+            # headless summary
+            top_names.WriteSummary()
+        if load_shedder is not None:
+            load_shedder.WriteSummary()
+        if instrumentation is not None:
+            # write any unfinished profile window
+            instrumentation.Close()
+        if metrics_exporter is not None:
+            metrics_exporter.Close()
+        if record_writer is not None:
+            # write out records buffered since the last flush
+            record_writer.Close()
+        elif args.frame_rate > 0:
+            # draw anything buffered since the last frame
+            BufferedScrollRegion.StopRendering()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,516 @@
+# requires Python 3.6+
+
+"""
+Reads tcpdump -w pcap/pcapng files and streams (e.g. tcpdump -U -w -) and
+decodes Ethernet/IP/IPv6/UDP/TCP/DNS headers straight from the captured
+bytes with struct, yielding the same DNS_packet records as parse_gen() in
+DNS_times_parser.py.
+
+Addresses are not resolved to names (like tcpdump -n).
+"""
+
+import time
+import socket
+from struct import Struct
+from DNS_times_parser import DNS_packet
+
+## ----------------------------------------------------------------------------
+#  capture file formats
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_IDB = 1
+PCAPNG_EPB = 6
+PCAPNG_OPB = 2
+
+# link types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# IPv6 extension headers skipped to find the UDP/TCP header
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+DNS_PORT = 53
+
+# DNS types by number (as tcpdump names them)
+DNS_TYPES = {1: "A", 2: "NS", 5: "CNAME", 6: "SOA", 12: "PTR", 15: "MX",
+             16: "TXT", 28: "AAAA", 33: "SRV", 35: "NAPTR", 39: "DNAME",
+             41: "OPT", 43: "DS", 46: "RRSIG", 47: "NSEC", 48: "DNSKEY",
+             64: "SVCB", 65: "HTTPS", 255: "ANY", 257: "CAA"}
+# question types as shown in requests (e.g. "A?")
+DNS_QUESTION_TYPES = {qtype: f"{name}?" for qtype, name in DNS_TYPES.items()}
+DNS_RCODE_NXDOMAIN = 3
+
+# bytes read from the capture at a time by _pcap_gen()
+READ_SIZE = 65536
+
+u16_be = Struct("!H")
+u32_be = Struct("!I")
+# (ID, flags, question count, answer count)
+dns_header = Struct("!HHHH4x")
+# (type, data length) of a resource record after its name
+answer_header = Struct("!H6xH")
+# (version/IHL, total length, flags/fragment offset, protocol, source,
+# destination)
+ipv4_header = Struct("!BxH2xHxB2x4s4s")
+# (payload length, next header, source, destination)
+ipv6_header = Struct("!4xHBx16s16s")
+tcp_udp_ports = Struct("!HH")
+
+
+def dns_type_name(qtype):
+    """
+    returns tcpdump style name for DNS type number qtype
+    """
+    return DNS_TYPES.get(qtype) or f"TYPE{qtype}"
+
+
+def read_dns_name(buf, offset, end):
+    """
+    returns (name with trailing ".", offset after name) for DNS name at
+    offset in buf (following compression pointers)
+    """
+    labels = []
+    next_offset = None
+    jumps = 0
+    while offset < end:
+        length = buf[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length >= 0xc0:
+            # compression pointer
+            if offset + 1 >= end or jumps > 16:
+                break
+            if next_offset is None:
+                next_offset = offset + 2
+            offset = ((length & 0x3f) << 8) | buf[offset + 1]
+            jumps += 1
+            continue
+        offset += 1
+        labels.append(bytes(buf[offset:offset + length]).decode("ascii",
+                                                                 "replace"))
+        offset += length
+    return ".".join(labels) + ".", next_offset if next_offset else offset
+
+
+def skip_dns_name(buf, offset, end):
+    """
+    returns offset after DNS name at offset in buf (without decoding it)
+    """
+    while offset < end:
+        length = buf[offset]
+        if length == 0:
+            return offset + 1
+        if length >= 0xc0:
+            return offset + 2
+        offset += length + 1
+    return end
+
+
+## ----------------------------------------------------------------------------
+#  packet decoding
+
+class PacketDecoder:
+    """
+    Decodes captured link layer frames to DNS_packet records
+    """
+
+    def __init__(self):
+        # caches of address bytes -> address string
+        self.__ipv4_addresses = {}
+        self.__ipv6_addresses = {}
+        # cache of uncompressed DNS name wire bytes -> name
+        self.__names = {}
+
+    def __Address(self, cache, family, address):
+        s = cache.get(address)
+        if s is None:
+            if len(cache) > 65536:
+                cache.clear()
+            s = cache[address] = socket.inet_ntop(family, address)
+        return s
+
+    def __Name(self, buf, offset, end):
+        """
+        Internal function returning (name, offset after name) for DNS name at
+        offset in buf (bytes - uncompressed names are decoded once and
+        cached)
+        """
+        # (a cached name's wire bytes run to the first zero byte - the root
+        # label - so a hit skips walking its labels)
+        name_end = buf.find(0, offset, end) + 1
+        if name_end:
+            name = self.__names.get(buf[offset:name_end])
+            if name is not None:
+                return name, name_end
+        next_offset = skip_dns_name(buf, offset, end)
+        if buf[next_offset - 1] != 0:
+            # compressed - depends on the rest of this message
+            return read_dns_name(buf, offset, end)
+        raw = buf[offset:next_offset]
+        name = self.__names.get(raw)
+        if name is None:
+            if len(self.__names) > 65536:
+                self.__names.clear()
+            name = self.__names[raw] = read_dns_name(raw, 0, len(raw))[0]
+        return name, next_offset
+
+    def Decode(self, linktype, frame, t):
+        """
+        returns DNS_packet decoded from frame (a memoryview) captured at
+        time t, or None if frame isn't a DNS packet
+        """
+        n = len(frame)
+        # -- link layer --
+        if linktype == LINKTYPE_ETHERNET:
+            if n < 14:
+                return None
+            offset = 12
+            ethertype = u16_be.unpack_from(frame, offset)[0]
+            while ethertype in ETHERTYPE_VLAN and offset + 6 <= n:
+                offset += 4
+                ethertype = u16_be.unpack_from(frame, offset)[0]
+            offset += 2
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if n < 16:
+                return None
+            ethertype = u16_be.unpack_from(frame, 14)[0]
+            offset = 16
+        elif linktype == LINKTYPE_LINUX_SLL2:
+            if n < 20:
+                return None
+            ethertype = u16_be.unpack_from(frame, 0)[0]
+            offset = 20
+        elif linktype == LINKTYPE_NULL:
+            if n < 5:
+                return None
+            ethertype = ETHERTYPE_IPV6 if frame[4] >> 4 == 6 else ETHERTYPE_IPV4
+            offset = 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            if n < 1:
+                return None
+            ethertype = ETHERTYPE_IPV6 if frame[0] >> 4 == 6 else ETHERTYPE_IPV4
+            offset = 0
+        else:
+            return None
+
+        # -- network layer --
+        # (addresses are only converted to strings once the ports show a DNS
+        # packet)
+        if ethertype == ETHERTYPE_IPV4:
+            if n < offset + 20:
+                return None
+            version_ihl, total_length, fragment, ip_proto, src, dst = \
+              ipv4_header.unpack_from(frame, offset)
+            if fragment & 0x1fff:
+                # non-first fragment (no transport header)
+                return None
+            ip_end = min(n, offset + total_length)
+            addresses = self.__ipv4_addresses
+            family = socket.AF_INET
+            proto = "IP"
+            offset += (version_ihl & 0x0f) * 4
+        elif ethertype == ETHERTYPE_IPV6:
+            if n < offset + 40:
+                return None
+            payload_length, ip_proto, src, dst = \
+              ipv6_header.unpack_from(frame, offset)
+            ip_end = min(n, offset + 40 + payload_length)
+            addresses = self.__ipv6_addresses
+            family = socket.AF_INET6
+            proto = "IP6"
+            offset += 40
+            while ip_proto in IPV6_EXTENSION_HEADERS and offset + 8 <= ip_end:
+                ip_proto = frame[offset]
+                offset += (frame[offset + 1] + 1) * 8
+            if ip_proto == IPV6_FRAGMENT_HEADER and offset + 8 <= ip_end:
+                if u16_be.unpack_from(frame, offset + 2)[0] & 0xfff8:
+                    # non-first fragment (no transport header)
+                    return None
+                ip_proto = frame[offset]
+                offset += 8
+        else:
+            return None
+
+        # -- transport layer --
+        if ip_proto == IPPROTO_UDP:
+            if ip_end < offset + 8:
+                return None
+            src_port, dst_port = tcp_udp_ports.unpack_from(frame, offset)
+            offset += 8
+        elif ip_proto == IPPROTO_TCP:
+            if ip_end < offset + 20:
+                return None
+            src_port, dst_port = tcp_udp_ports.unpack_from(frame, offset)
+            offset += (frame[offset + 12] >> 4) * 4
+            # DNS over TCP has a 2 byte length prefix (only messages that
+            # start in this segment are decoded)
+            if ip_end < offset + 2:
+                return None
+            offset += 2
+        else:
+            return None
+
+        if src_port != DNS_PORT and dst_port != DNS_PORT:
+            return None
+
+        src_address = addresses.get(src)
+        if src_address is None:
+            src_address = self.__Address(addresses, family, src)
+        dst_address = addresses.get(dst)
+        if dst_address is None:
+            dst_address = self.__Address(addresses, family, dst)
+
+        # -- DNS --
+        # (copied out of the frame - names are looked up by their bytes)
+        dns = frame[offset:ip_end].tobytes()
+        end = len(dns)
+        if end < 12:
+            return None
+        reqid, flags, qdcount, ancount = dns_header.unpack_from(dns, 0)
+        offset = 12
+
+        qname = "."
+        qtype = 0
+        if qdcount:
+            qname, offset = self.__Name(dns, offset, end)
+            if end < offset + 4:
+                return None
+            qtype = u16_be.unpack_from(dns, offset)[0]
+            offset += 4
+
+        if dst_port == DNS_PORT:
+            return DNS_packet(t, str(reqid), True, proto,
+                              src_address, dst_address,
+                              DNS_QUESTION_TYPES.get(qtype) or
+                              f"{dns_type_name(qtype)}?",
+                              qname, str(src_port), str(dst_port))
+
+        # same special cases as parse_gen()
+        if flags & 0x000f == DNS_RCODE_NXDOMAIN:
+            rtype, rdata = "-", "NXDomain"
+        elif ancount == 0:
+            rtype, rdata = "-", "NoRecord"
+        else:
+            # first answer record
+            for _ in range(qdcount - 1):
+                offset = skip_dns_name(dns, offset, end) + 4
+            offset = skip_dns_name(dns, offset, end)
+            if end < offset + 10:
+                return None
+            atype, rdlength = answer_header.unpack_from(dns, offset)
+            offset += 10
+            rtype = dns_type_name(atype)
+            if atype == 1 and rdlength == 4 and offset + 4 <= end:
+                rdata = self.__Address(self.__ipv4_addresses, socket.AF_INET,
+                                       dns[offset:offset + 4])
+            elif atype == 28 and rdlength == 16 and offset + 16 <= end:
+                rdata = self.__Address(self.__ipv6_addresses, socket.AF_INET6,
+                                       dns[offset:offset + 16])
+            elif atype in (2, 5, 12, 39):
+                rdata = read_dns_name(dns, offset, end)[0]
+            elif atype == 65:
+                rtype, rdata = "TYPE65_ENCODED_DATA", "-"
+            else:
+                rdata = "-"
+            if ancount > 1 and rdata != "-":
+                # tcpdump separates answers with ", "
+                rdata += ","
+
+        return DNS_packet(t, str(reqid), False, proto,
+                          src_address, dst_address, rtype, rdata,
+                          str(src_port), str(dst_port))
+
+
+## ----------------------------------------------------------------------------
+#  capture file readers
+
+def read_exact(f, n):
+    """
+    returns n bytes read from f (fewer only at end of stream)
+    """
+    data = f.read(n)
+    if data is None or len(data) == n or not data:
+        return data or b""
+    chunks = [data]
+    remaining = n - len(data)
+    while remaining:
+        data = f.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b"".join(chunks)
+
+
+def pcap_gen(f, instrumentation = None):
+    """
+    parses pcap or pcapng capture read from binary stream f into DNS_packet
+    named tuples (see parse_gen())
+
+    instrumentation - DNS_times_instrument.Instrumentation to count capture
+                      records (as lines) and packets and time decoding with
+
+    DNS_packet time is seconds since the epoch plus the local time zone
+    offset (like parse_gen() for tcpdump -tt) so time % 86400 is the local
+    time of day.
+    """
+    magic = read_exact(f, 4)
+    if len(magic) < 4:
+        return
+    if u32_be.unpack(magic)[0] == PCAPNG_SHB:
+        yield from _pcapng_gen(f, magic, instrumentation)
+    else:
+        yield from _pcap_gen(f, magic, instrumentation)
+
+
+def _local_time_offset(t):
+    """
+    returns local time zone offset in seconds at epoch time t
+    """
+    return float(time.localtime(t).tm_gmtoff)
+
+
+def _pcap_gen(f, magic, instrumentation):
+    """
+    pcap_gen() for classic pcap (magic is its first 4 bytes)
+    """
+    for byte_order in ("<", ">"):
+        m = Struct(byte_order + "I").unpack(magic)[0]
+        if m in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            break
+    else:
+        raise ValueError("not a pcap or pcapng capture")
+    ts_scale = 1e-6 if m == PCAP_MAGIC_US else 1e-9
+
+    header = read_exact(f, 20)
+    if len(header) < 20:
+        return
+    linktype = Struct(byte_order + "16xI").unpack(header)[0] & 0x0fffffff
+
+    # records are decoded in place from READ_SIZE chunks (read1() returns
+    # what's available so a live stream isn't held up for a whole chunk)
+    unpack_record_header = Struct(byte_order + "IIII").unpack_from
+    decode = PacketDecoder().Decode
+    if instrumentation is not None:
+        decode = instrumentation.TimedParse(decode)
+    read = getattr(f, "read1", f.read)
+    tz_offset = None
+    buf = b""
+    offset = 0
+    while True:
+        data = read(READ_SIZE)
+        if not data:
+            return
+        buf = buf[offset:] + data if offset < len(buf) else data
+        offset = 0
+        end = len(buf)
+        view = memoryview(buf)
+        while offset + 16 <= end:
+            ts_sec, ts_frac, caplen, _ = unpack_record_header(buf, offset)
+            frame_end = offset + 16 + caplen
+            if frame_end > end:
+                break
+            if tz_offset is None:
+                tz_offset = _local_time_offset(ts_sec)
+            p = decode(linktype, view[offset + 16:frame_end],
+                       ts_sec + ts_frac * ts_scale + tz_offset)
+            offset = frame_end
+            if p is not None:
+                yield p
+
+
+def _pcapng_gen(f, magic, instrumentation):
+    """
+    pcap_gen() for pcapng (magic is its first 4 bytes)
+    """
+    decode = PacketDecoder().Decode
+    if instrumentation is not None:
+        decode = instrumentation.TimedParse(decode)
+    tz_offset = None
+    byte_order = "<"
+    # per interface (linktype, timestamp units in seconds)
+    interfaces = []
+    block_type = PCAPNG_SHB
+    while True:
+        if block_type == PCAPNG_SHB:
+            # section header - byte order may change between sections
+            header = read_exact(f, 8)
+            if len(header) < 8:
+                return
+            if Struct("<I").unpack_from(header, 4)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                byte_order = "<"
+            else:
+                byte_order = ">"
+            u32 = Struct(byte_order + "I")
+            block_length = u32.unpack_from(header, 0)[0]
+            read_exact(f, block_length - 12)
+            interfaces = []
+        else:
+            header = read_exact(f, 4)
+            if len(header) < 4:
+                return
+            block_length = u32.unpack(header)[0]
+            body = memoryview(read_exact(f, block_length - 8))
+            if len(body) < block_length - 8:
+                return
+            if block_type == PCAPNG_IDB:
+                linktype = Struct(byte_order + "H").unpack_from(body, 0)[0]
+                interfaces.append((linktype,
+                                   _pcapng_ts_units(body, byte_order)))
+            elif block_type in (PCAPNG_EPB, PCAPNG_OPB):
+                if block_type == PCAPNG_EPB:
+                    interface_id, ts_high, ts_low, caplen = \
+                      Struct(byte_order + "IIII").unpack_from(body, 0)
+                else:
+                    interface_id, ts_high, ts_low, caplen = \
+                      Struct(byte_order + "H2xIII").unpack_from(body, 0)
+                if interface_id < len(interfaces):
+                    linktype, ts_units = interfaces[interface_id]
+                    t = ((ts_high << 32) | ts_low) * ts_units
+                    if tz_offset is None:
+                        tz_offset = _local_time_offset(t)
+                    p = decode(linktype, body[20:20 + caplen],
+                               t + tz_offset)
+                    if p is not None:
+                        yield p
+
+        header = read_exact(f, 4)
+        if len(header) < 4:
+            return
+        block_type = u32.unpack(header)[0]
+
+
+def _pcapng_ts_units(idb_body, byte_order):
+    """
+    returns timestamp units in seconds from an interface description block's
+    if_tsresol option (default microseconds)
+    """
+    offset = 8
+    u16 = Struct(byte_order + "HH")
+    while offset + 4 <= len(idb_body) - 4:
+        code, length = u16.unpack_from(idb_body, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            tsresol = idb_body[offset + 4]
+            if tsresol & 0x80:
+                return 2.0 ** -(tsresol & 0x7f)
+            return 10.0 ** -tsresol
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
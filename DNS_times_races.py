@@ -0,0 +1,270 @@
+# requires Python 3.6+
+
+"""
+Hedged (duplicate) query race analysis for DNS_times_parser.py's
+process() - stub resolvers often send the same query to several upstream
+DNS servers (and over both IP and IP6) at once and use whichever answer
+arrives first.
+
+Requests with the same DNS ID, name and type sent within window_s of each
+other (from the same source) are grouped as one race between the DNS
+servers (server and protocol) they were sent to. Once every leg has had
+time to answer, the race is scored: the first response wins (by how many ms
+it beat the runner up), and each DNS server's own latency is compared with
+the race latency (from the first request to the first response) of the
+races it was in - which shows whether an upstream is worth the extra query
+load. The client address isn't part of the group key since a dual stack
+stub sends from different IP and IP6 addresses - window_s keeps unrelated
+queries that happen to share an ID and name apart.
+
+Groups are kept in arrival order and scored when they expire, so memory is
+bounded by max_groups and expiry is O(1) amortized. A later query reusing
+the ID, name and type starts a new group, and the old one still waits out
+its own timeout (its legs may still be answered). Like process()'s request
+caches, each source has its own groups (expired by its own packet times)
+since each source's packet times come from its own clock.
+"""
+
+import sys
+from collections import OrderedDict
+from MovingAverageClasses.Percentiles import LogHistogram
+
+
+def new_race_stats():
+    """
+    returns a new per DNS server race statistics dict
+    """
+    return {"races": 0,          # races the DNS server was sent a leg of
+            "wins": 0,           # races it answered first
+            "unanswered": 0,     # races it didn't answer
+            "margins": 0,        # wins with a runner up
+            "margin_sum_ms": 0.0,
+            # its own latency (from its own request) and the race latency
+            # (first request to first response of any leg) of its races
+            "own_ms": LogHistogram(),
+            "race_ms": LogHistogram()}
+
+
+class RaceTracker:
+    """
+    Groups fanned out requests into races and keeps per DNS server win
+    rates, win margins and own vs race latency
+    """
+
+    def __init__(self,
+                 window_s = 0.5,
+                 timeout_s = 5.0,
+                 max_groups = 10000,
+                 rows = 8,
+                 region_interval_s = 1.0):
+        """
+                 window_s - seconds (packet time) after a group's first
+                            request that more requests join it
+                timeout_s - seconds after window_s a group waits for its
+                            responses before it's scored
+               max_groups - maximum number of groups waiting to be scored per
+                            source (the oldest are scored early beyond this)
+                     rows - number of DNS servers listed in the scroll
+                            region (those in the most races)
+        region_interval_s - seconds of packet time between redraws of the
+                            scroll region (see ShowRegion())
+        """
+        self.window_s = window_s
+        self.lifetime_s = window_s + timeout_s
+        self.max_groups = max_groups
+        self.rows = rows
+        self.region_interval_s = region_interval_s
+        # ([first request time, {DNS server name: [request time, response
+        # time or None]}] by ((source, reqid, name, type), first request
+        # time) - oldest first, and lists of the same groups - oldest first -
+        # by (source, reqid, name, type)) by source tag
+        self.__groups = {}
+        # race statistics dicts by DNS server name
+        self.server_stats = {}
+        self.races = 0
+        self.unanswered_races = 0
+        self.__region = None
+        # next scroll region redraw time by source tag
+        self.__next_region_times = {}
+
+    def __SourceGroups(self, source):
+        """
+        Internal function returning source's groups and their lists by key
+        (created if needed)
+        """
+        source_groups = self.__groups.get(source)
+        if source_groups is None:
+            source_groups = self.__groups[source] = (OrderedDict(), {})
+        return source_groups
+
+    def __ScoreOldest(self, groups, key_groups):
+        """
+        Internal function to remove and score the oldest of a source's groups
+        """
+        (key, _), group = groups.popitem(last=False)
+        same_key_groups = key_groups[key]
+        # (groups with the same key are expired in the order they started)
+        del same_key_groups[0]
+        if not same_key_groups:
+            del key_groups[key]
+        self.__Score(group)
+
+    def AddRequest(self, key, dns_server_name, time):
+        """
+        add a request sent to dns_server_name at (packet) time to the group
+        of key (source, reqid, query address, type) - starting a new group
+        if there isn't one open for more requests
+        """
+        groups, key_groups = self.__SourceGroups(key[0])
+        same_key_groups = key_groups.get(key)
+        if same_key_groups is None:
+            same_key_groups = key_groups[key] = []
+        if (not same_key_groups or
+            time - same_key_groups[-1][0] > self.window_s):
+            # (a later query reusing the ID starts a new group - the old one
+            # is scored when it expires)
+            group = groups[(key, time)] = [time, {}]
+            same_key_groups.append(group)
+        else:
+            group = same_key_groups[-1]
+        # (a retry to the same DNS server keeps its first request time)
+        group[1].setdefault(dns_server_name, [time, None])
+
+    def AddResponse(self, key, dns_server_name, time):
+        """
+        note the (packet) time of a response from dns_server_name to the
+        latest group of key still waiting on it
+        """
+        source_groups = self.__groups.get(key[0])
+        if source_groups is None:
+            return
+        for group in reversed(source_groups[1].get(key, ())):
+            leg = group[1].get(dns_server_name)
+            if leg is not None and leg[1] is None:
+                leg[1] = time
+                return
+
+    def Expire(self, source, now):
+        """
+        score source's groups whose responses have had time to arrive as of
+        source's packet time now (plus any oldest groups beyond max_groups)
+        """
+        groups, key_groups = self.__SourceGroups(source)
+        cutoff = now - self.lifetime_s
+        while groups:
+            oldest = next(iter(groups.values()))
+            if oldest[0] >= cutoff and len(groups) <= self.max_groups:
+                break
+            self.__ScoreOldest(groups, key_groups)
+
+        if (self.__region is not None and
+            now >= self.__next_region_times.get(source, float("-inf"))):
+            self.__next_region_times[source] = now + self.region_interval_s
+            self.__UpdateRegion()
+
+    def __Score(self, group):
+        """
+        Internal function to add a finished group's race (if more than one
+        DNS server was sent a leg) to the stats
+        """
+        start, legs = group
+        if len(legs) < 2:
+            return
+        self.races += 1
+        # responses by arrival time
+        answered = sorted((response_time, dns_server_name)
+                          for dns_server_name, (request_time, response_time)
+                          in legs.items() if response_time is not None)
+        if not answered:
+            self.unanswered_races += 1
+        race_ms = (answered[0][0] - start) * 1000 if answered else None
+
+        for dns_server_name, (request_time, response_time) in legs.items():
+            stats = self.server_stats.get(dns_server_name)
+            if stats is None:
+                stats = self.server_stats[dns_server_name] = new_race_stats()
+            stats["races"] += 1
+            if response_time is None:
+                stats["unanswered"] += 1
+            else:
+                stats["own_ms"].AddValue((response_time - request_time) *
+                                         1000)
+            if race_ms is not None:
+                stats["race_ms"].AddValue(race_ms)
+
+        if answered:
+            stats = self.server_stats[answered[0][1]]
+            stats["wins"] += 1
+            if len(answered) > 1:
+                stats["margins"] += 1
+                stats["margin_sum_ms"] += ((answered[1][0] - answered[0][0]) *
+                                           1000)
+
+    def GetSummary(self):
+        """
+        returns [(DNS server name, races, win %, mean win margin ms,
+        unanswered %, own p50 ms, own p95 ms, race p50 ms, race p95 ms), ...]
+        by DNS server (most races first)
+        """
+        summary = []
+        for dns_server_name, stats in self.server_stats.items():
+            races = stats["races"]
+            summary.append((
+              dns_server_name,
+              races,
+              100 * stats["wins"] / races,
+              stats["margin_sum_ms"] / (stats["margins"] or 1),
+              100 * stats["unanswered"] / races,
+              *stats["own_ms"].GetPercentiles((50, 95)),
+              *stats["race_ms"].GetPercentiles((50, 95))))
+        summary.sort(key=lambda row: row[1], reverse=True)
+        return summary
+
+    def ShowRegion(self, scroll_region_class):
+        """
+        show the DNS servers' race stats in a scroll region of
+        scroll_region_class (redrawn every region_interval_s of packet time)
+        """
+        # (a title, a blank line and rows DNS servers)
+        self.__region = scroll_region_class(
+          "hedged query races - races  wins  margin  unanswered  "
+          "own p50/p95  race p50/p95", self.rows + 2)
+
+    def __FormatSummary(self, rows = None):
+        """
+        Internal function returning lines of the DNS servers' race stats
+        """
+        return [f"{races:>10,} {win_pct:>5.1f}% {margin_ms:>7.1f}ms "
+                f"{unanswered_pct:>5.1f}%  "
+                f"{own_p50:>6.1f}/{own_p95:<6.1f}ms "
+                f"{race_p50:>6.1f}/{race_p95:<6.1f}ms  {dns_server_name}"
+                for (dns_server_name, races, win_pct, margin_ms,
+                     unanswered_pct, own_p50, own_p95, race_p50, race_p95)
+                in self.GetSummary()[:rows]]
+
+    def __UpdateRegion(self):
+        """
+        Internal function to redraw the scroll region (by adding a full
+        region of lines - the blank first line leaves room for
+        BufferedScrollRegion's "skipped lines" line)
+        """
+        lines = [""] + self.__FormatSummary(self.rows)
+        lines += [""] * (self.rows + 1 - len(lines))
+        for line in lines:
+            self.__region.AddLine(line, 0)
+
+    def WriteSummary(self, f = sys.stderr):
+        """
+        score all groups still waiting and write the DNS servers' race stats
+        to f
+        """
+        for groups, key_groups in self.__groups.values():
+            while groups:
+                self.__ScoreOldest(groups, key_groups)
+        f.write(f"\n-- hedged query races ({self.races:,} races, "
+                f"{self.unanswered_races:,} unanswered) --\n")
+        f.write(f"{'races':>10} {'wins':>6} {'margin':>9} {'unans':>6}  "
+                f"{'own p50/p95':>15} {'race p50/p95':>15}\n")
+        for line in self.__FormatSummary():
+            f.write(f"{line}\n")
+        f.flush()
@@ -0,0 +1,256 @@
+# requires Python 3.6+
+
+"""
+Per requester (client) stats for DNS_times_parser.py's process() - query
+volume and rate, failures, lost requests and latency for each requesting
+address.
+
+Requesters are kept in least recently seen order, so ones that haven't made
+a request for ttl_s (of packet time), or the least recently seen beyond
+max_requesters, are dropped in O(1) amortized - memory stays bounded as
+devices come and go. Like process()'s request caches, each source has its
+own table (and expiry, rates and redraws use its own packet times) since
+each source's packet times come from its own clock. The busiest requesters
+(by requests answered) are kept in a small sorted top n list that is
+updated as counts change instead of sorting all requesters for each view.
+"""
+
+import sys
+import math
+from collections import OrderedDict
+
+# seconds of packet time each requester's query rate is averaged over
+# (exponentially decayed)
+RATE_WINDOW_S = 60.0
+
+
+def new_requester_stats(time):
+    """
+    returns a new statistics dict for a requester first seen at time
+    """
+    return {"requests": 0,      # requests answered
+            "failures": 0,      # NXDomain and NoRecord responses
+            "lost": 0,          # requests that got no response in time
+            "latency_sum_ms": 0.0,
+            # exponentially decayed count of requests made (rate is this /
+            # RATE_WINDOW_S) as of rate_time
+            "decayed_count": 0.0,
+            "rate_time": time,
+            "last_seen": time}
+
+
+def decayed_count(stats, now):
+    """
+    returns a requester's decayed count of requests as of time now
+    """
+    return (stats["decayed_count"] *
+            math.exp((stats["rate_time"] - now) / RATE_WINDOW_S))
+
+
+class RequesterStats:
+    """
+    Bounded, time-expiring table of per requester stats with an
+    incrementally maintained top n list of the busiest requesters
+    """
+
+    def __init__(self,
+                 n = 10,
+                 ttl_s = 600.0,
+                 max_requesters = 1000,
+                 region_interval_s = 1.0):
+        """
+                        n - number of busiest requesters listed
+                    ttl_s - seconds (in packet time) since a requester was
+                            last seen before its stats are dropped
+           max_requesters - maximum number of requesters kept per source
+                            (the least recently seen are dropped beyond
+                            this)
+        region_interval_s - seconds of packet time between redraws of the
+                            scroll region (see ShowRegion())
+        """
+        self.n = n
+        self.ttl_s = ttl_s
+        self.max_requesters = max_requesters
+        self.region_interval_s = region_interval_s
+        # statistics dicts by requester, least recently seen first - by
+        # source tag
+        self.__requesters = {}
+        # latest packet time and next scroll region redraw time by source
+        # tag
+        self.__times = {}
+        self.__next_region_times = {}
+        # [(requests, requester), ...] of the busiest requesters (busiest
+        # first) and the source tag of each requester in it
+        self.__top = []
+        self.__top_sources = {}
+        self.__region = None
+        self.dropped = 0
+
+    def __len__(self):
+        return sum(len(requesters)
+                   for requesters in self.__requesters.values())
+
+    def __Seen(self, source, requester, time):
+        """
+        Internal function returning requester's statistics dict (created if
+        needed) moved to the most recently seen end of source's table -
+        expiring source's requesters not seen for ttl_s (or beyond
+        max_requesters) as of time
+        """
+        requesters = self.__requesters.get(source)
+        if requesters is None:
+            requesters = self.__requesters[source] = OrderedDict()
+        if time > self.__times.get(source, float("-inf")):
+            self.__times[source] = time
+        stats = requesters.get(requester)
+        if stats is None:
+            stats = requesters[requester] = new_requester_stats(time)
+        else:
+            requesters.move_to_end(requester)
+        if time > stats["last_seen"]:
+            stats["last_seen"] = time
+
+        cutoff = time - self.ttl_s
+        while True:
+            oldest_requester, oldest = next(iter(requesters.items()))
+            if (oldest["last_seen"] >= cutoff and
+                len(requesters) <= self.max_requesters):
+                break
+            del requesters[oldest_requester]
+            self.dropped += 1
+            if oldest_requester in self.__top_sources:
+                self.__RebuildTop()
+        return stats
+
+    def AddRequest(self, source, requester, time):
+        """
+        count a request made by requester at (source's packet) time in its
+        query rate
+        """
+        stats = self.__Seen(source, requester, time)
+        stats["decayed_count"] = decayed_count(stats, time) + 1
+        stats["rate_time"] = time
+
+    def AddResponse(self, source, requester, dt_ms, failed, time):
+        """
+        count a response to requester that took dt_ms (failed for NXDomain
+        or NoRecord) at (source's packet) time
+        """
+        stats = self.__Seen(source, requester, time)
+        stats["requests"] += 1
+        stats["latency_sum_ms"] += dt_ms
+        if failed:
+            stats["failures"] += 1
+        self.__UpdateTop(source, requester, stats["requests"])
+
+        if (self.__region is not None and
+            time >= self.__next_region_times.get(source, float("-inf"))):
+            self.__next_region_times[source] = time + self.region_interval_s
+            self.__UpdateRegion()
+
+    def AddLost(self, source, requester, time):
+        """
+        count a request made by requester that got no response (expired at
+        source's packet time)
+        """
+        stats = self.__requesters.get(source, {}).get(requester)
+        if stats is not None:
+            stats["lost"] += 1
+
+    def __UpdateTop(self, source, requester, requests):
+        """
+        Internal function to move requester up the top list now that it has
+        had requests answered (or add it if that's more than the least busy
+        listed)
+        """
+        top = self.__top
+        if requester in self.__top_sources:
+            i = top.index((requests - 1, requester))
+        elif len(top) < self.n:
+            top.append((requests, requester))
+            self.__top_sources[requester] = source
+            i = len(top) - 1
+        elif requests > top[-1][0]:
+            del self.__top_sources[top[-1][1]]
+            self.__top_sources[requester] = source
+            i = len(top) - 1
+        else:
+            return
+        # bubble up past less busy requesters
+        while i > 0 and top[i - 1][0] < requests:
+            top[i] = top[i - 1]
+            i -= 1
+        top[i] = (requests, requester)
+
+    def __RebuildTop(self):
+        """
+        Internal function to rebuild the top list from all requesters (only
+        needed when a listed requester is dropped)
+        """
+        top = sorted(((stats["requests"], requester, source)
+                      for source, requesters in self.__requesters.items()
+                      for requester, stats in requesters.items()
+                      if stats["requests"]),
+                     reverse=True)[:self.n]
+        self.__top = [(requests, requester)
+                      for requests, requester, _ in top]
+        self.__top_sources = {requester: source
+                              for _, requester, source in top}
+
+    def GetTop(self):
+        """
+        returns [(requester, requests, requests/s, failure %, lost, mean
+        latency ms), ...] of the busiest requesters (busiest first) - rates
+        as of the latest packet time of each requester's source
+        """
+        top = []
+        for requests, requester in self.__top:
+            source = self.__top_sources[requester]
+            stats = self.__requesters[source][requester]
+            rate = (decayed_count(stats, self.__times[source]) /
+                    RATE_WINDOW_S)
+            top.append((requester,
+                        requests,
+                        rate,
+                        100 * stats["failures"] / requests,
+                        stats["lost"],
+                        stats["latency_sum_ms"] / requests))
+        return top
+
+    def ShowRegion(self, scroll_region_class):
+        """
+        show the busiest requesters in a scroll region of scroll_region_class
+        (redrawn every region_interval_s of packet time)
+        """
+        # (a title, a blank line and n requesters)
+        self.__region = scroll_region_class("busiest requesters", self.n + 2)
+
+    def __FormatTop(self):
+        """
+        Internal function returning lines of the busiest requesters
+        """
+        return [f"{requests:>10,} {rate:>8.1f}/s {mean_ms:>9.1f}ms "
+                f"{failure_pct:>5.1f}% fail {lost:>6,} lost  {requester}"
+                for requester, requests, rate, failure_pct, lost, mean_ms
+                in self.GetTop()]
+
+    def __UpdateRegion(self):
+        """
+        Internal function to redraw the scroll region (by adding a full
+        region of lines - the blank first line leaves room for
+        BufferedScrollRegion's "skipped lines" line)
+        """
+        lines = [""] + self.__FormatTop()
+        lines += [""] * (self.n + 1 - len(lines))
+        for line in lines:
+            self.__region.AddLine(line, 0)
+
+    def WriteSummary(self, f = sys.stderr):
+        """
+        write the busiest requesters to f
+        """
+        f.write(f"\n-- busiest requesters ({len(self):,} kept, "
+                f"{self.dropped:,} dropped) --\n")
+        for line in self.__FormatTop():
+            f.write(f"{line}\n")
+        f.flush()
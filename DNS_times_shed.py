@@ -0,0 +1,192 @@
+# requires Python 3.6+
+
+"""
+Adaptive load shedding for DNS_times_parser.py's process().
+
+When DNS packets arrive faster than process() can handle them it falls
+further and further behind the live traffic (until tcpdump's kernel buffer
+overflows and packets are silently dropped). A LoadShedder watches how far
+packet timestamps lag the wall clock and steps through shedding levels that
+cut the per response work that isn't needed for the stats:
+
+             0 full - every response's line is formatted and displayed (or
+                      its record written)
+      1 plain lines - display lines skip their optional formatting (time of
+                      response, request type, failure tag and requester)
+    2 sampled lines - only 1 in DISPLAY_SAMPLE_N responses is displayed (and
+                      only then are the titles of DNS servers whose stats
+                      changed redrawn - all of them, so the fastest sma
+                      highlight is never compared against stale smas)
+   3 sampled detail - per query detail is sampled too - only 1 in
+                      DISPLAY_SAMPLE_N responses is displayed and 1 in
+                      RECORD_SAMPLE_N gets an output record
+
+With no display (headless output records) there are no lines to shed, so
+records are sampled from level 1 instead - 1 in HEADLESS_RECORD_SAMPLE_N
+responses gets an output record.
+
+Every packet is still matched and counted, so per DNS server counts and
+latency stats (titles, metrics) stay exact at every level.
+"""
+
+import sys
+import time
+
+SHED_LEVELS = ("full", "plain lines", "sampled lines", "sampled detail")
+
+# 1 in N responses displayed / written as a record at each level
+DISPLAY_SAMPLE_N = (1, 1, 10, 100)
+RECORD_SAMPLE_N = (1, 1, 1, 10)
+# 1 in N responses written as a record at each level with no display
+HEADLESS_RECORD_SAMPLE_N = (1, 2, 5, 10)
+HEADLESS_SHED_LEVELS = ("full",) + tuple(f"1 in {n} records" for n
+                                         in HEADLESS_RECORD_SAMPLE_N[1:])
+
+# packets between backlog checks
+CHECK_PACKETS = 64
+
+
+class LoadShedder:
+    """
+    Picks the shedding level from how far process() is behind and counts
+    what's shed (see KeepLine() and KeepRecord())
+    """
+
+    def __init__(self, lag_s = 1.0, log_file = None, headless = False):
+        """
+           lag_s - seconds behind the live traffic that starts shedding
+                   (level N is entered when 2**(N-1) * lag_s behind and left
+                   again when half that)
+        log_file - text file to write a line to at each level change (e.g.
+                   sys.stderr when there's no terminal display)
+        headless - True if responses are written as records with no display
+                   (records are sampled from level 1)
+        """
+        self.lag_s = lag_s
+        self.log_file = log_file
+        if headless:
+            self.level_names = HEADLESS_SHED_LEVELS
+            self.__record_sample_n = HEADLESS_RECORD_SAMPLE_N
+        else:
+            self.level_names = SHED_LEVELS
+            self.__record_sample_n = RECORD_SAMPLE_N
+        self.level = 0
+        self.max_level = 0
+        self.level_changes = 0
+        # latest estimate of seconds behind the live traffic
+        self.behind_s = 0.0
+        # smallest (wall clock - packet time) seen by source tag - the
+        # offset between the source's clock and the wall clock when
+        # process() was furthest ahead
+        self.__offsets = {}
+        self.__countdown = 1
+        self.__line_count = 0
+        self.__record_count = 0
+        # responses displayed with plain lines, lines not displayed and
+        # records not written
+        self.shed = {"plain_lines": 0,
+                     "skipped_lines": 0,
+                     "skipped_records": 0}
+
+    def Check(self, source, packet_time):
+        """
+        returns the shedding level for a packet from source (tag) with
+        packet_time (the backlog is only measured every CHECK_PACKETS
+        packets)
+        """
+        self.__countdown -= 1
+        if self.__countdown > 0:
+            return self.level
+        self.__countdown = CHECK_PACKETS
+
+        offset = time.monotonic() - packet_time
+        min_offset = self.__offsets.get(source)
+        if min_offset is None or offset < min_offset:
+            min_offset = self.__offsets[source] = offset
+        self.behind_s = offset - min_offset
+
+        level = self.level
+        if (level < len(SHED_LEVELS) - 1 and
+            self.behind_s > self.lag_s * 2 ** level):
+            self.__SetLevel(level + 1)
+        elif level > 0 and self.behind_s < self.lag_s * 2 ** (level - 1) / 2:
+            self.__SetLevel(level - 1)
+        return self.level
+
+    def __SetLevel(self, level):
+        """
+        Internal function to change the shedding level
+        """
+        self.level = level
+        self.max_level = max(self.max_level, level)
+        self.level_changes += 1
+        if self.log_file is not None:
+            self.log_file.write(f"DNS_times: load shedding level {level} "
+                                f"({self.level_names[level]}) - "
+                                f"{self.behind_s:.1f}s behind\n")
+            self.log_file.flush()
+
+    def PlainLine(self):
+        """
+        returns True if display lines should skip their optional formatting
+        (and counts the line as shed)
+        """
+        if self.level < 1:
+            return False
+        self.shed["plain_lines"] += 1
+        return True
+
+    def KeepLine(self):
+        """
+        returns True if this response should be displayed (or else counts
+        its line as shed)
+        """
+        n = DISPLAY_SAMPLE_N[self.level]
+        if n == 1:
+            return True
+        self.__line_count += 1
+        if self.__line_count >= n:
+            self.__line_count = 0
+            return True
+        self.shed["skipped_lines"] += 1
+        return False
+
+    def KeepRecord(self):
+        """
+        returns True if this response's output record should be written (or
+        else counts the record as shed)
+        """
+        n = self.__record_sample_n[self.level]
+        if n == 1:
+            return True
+        self.__record_count += 1
+        if self.__record_count >= n:
+            self.__record_count = 0
+            return True
+        self.shed["skipped_records"] += 1
+        return False
+
+    def GetSnapshot(self):
+        """
+        returns a dict of the current level, how far behind process() is and
+        how much has been shed
+        """
+        return {"level": self.level,
+                "level_name": self.level_names[self.level],
+                "max_level": self.max_level,
+                "level_changes": self.level_changes,
+                "behind_s": self.behind_s,
+                **self.shed}
+
+    def WriteSummary(self, f = sys.stderr):
+        """
+        write a line of how much was shed to f (if anything was)
+        """
+        if self.max_level == 0:
+            return
+        f.write(f"DNS_times: load shedding reached level {self.max_level} "
+                f"({self.level_names[self.max_level]}) - "
+                f"{self.shed['plain_lines']:,} plain lines, "
+                f"{self.shed['skipped_lines']:,} lines not displayed, "
+                f"{self.shed['skipped_records']:,} records not written\n")
+        f.flush()
@@ -0,0 +1,172 @@
+# requires Python 3.8+ (asyncio subprocesses started outside the main thread)
+
+"""
+Reads several tcpdump text streams at once with asyncio so one monitor can
+watch many routers.
+
+Each source is a shell command (e.g. ssh r7800 'tcpdump -K -l ...') or a
+file/FIFO. Every source is read in large chunks by its own coroutine with its
+own line_parser() state, and its DNS_packets are queued as
+(source tag, DNS_packet) pairs for a single process() (run with
+source_tagged=True) in the main thread. A source that stalls only stalls its
+own coroutine - the others keep being read and queued.
+"""
+
+import os
+import stat
+import queue
+import asyncio
+import threading
+from DNS_times_parser import line_parser
+
+# bytes read from a source at a time
+read_size = 65536
+
+# maximum batches of packets queued for process() before a source's
+# coroutine waits (only that source waits - others keep reading)
+max_queued_batches = 1024
+
+
+def parse_source_arg(arg):
+    """
+    returns (tag, spec) for a "TAG=SPEC" command line source argument
+    """
+    tag, sep, spec = arg.partition("=")
+    if not sep or not tag or not spec:
+        raise ValueError(f"source '{arg}' must be given as TAG=SPEC")
+    return tag, spec
+
+
+async def queue_packets(packets, batch):
+    """
+    queue batch of (tag, DNS_packet) pairs for process() (waiting in a
+    worker thread if the queue is full so other sources aren't held up)
+    """
+    try:
+        packets.put_nowait(batch)
+    except queue.Full:
+        await asyncio.get_running_loop().run_in_executor(None,
+                                                         packets.put, batch)
+
+
+async def read_stream(tag, read, packets, tcpdump_ttt, instrumentation):
+    """
+    reads chunks of tcpdump text by awaiting read(size) until it returns b""
+    and queues the DNS_packets parsed from complete lines (a partial last
+    line is kept until the rest of it arrives)
+    """
+    parse_line = line_parser(tcpdump_ttt)
+    if instrumentation is not None:
+        parse_line = instrumentation.TimedParse(parse_line)
+    partial = b""
+    while True:
+        data = await read(read_size)
+        if not data:
+            break
+        complete, _, partial = (partial + data).rpartition(b"\n")
+        if not complete:
+            continue
+        batch = []
+        for line in complete.decode(errors="replace").split("\n"):
+            p = parse_line(line)
+            if p is not None:
+                batch.append((tag, p))
+        if batch:
+            await queue_packets(packets, batch)
+
+    if partial:
+        p = parse_line(partial.decode(errors="replace"))
+        if p is not None:
+            await queue_packets(packets, [(tag, p)])
+
+
+async def read_command(tag, command, packets, tcpdump_ttt, instrumentation):
+    """
+    runs shell command and reads tcpdump text from its stdout
+    """
+    process = await asyncio.create_subprocess_shell(
+                command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE)
+    await read_stream(tag, process.stdout.read, packets, tcpdump_ttt,
+                      instrumentation)
+    await process.wait()
+
+
+async def read_file(tag, path, packets, tcpdump_ttt, instrumentation):
+    """
+    reads tcpdump text from a file, or from a FIFO/pipe as it's written
+    """
+    loop = asyncio.get_running_loop()
+    # opening a FIFO waits for its writer, so open in a worker thread
+    f = await loop.run_in_executor(None, open, path, "rb", 0)
+    with f:
+        if stat.S_ISREG(os.fstat(f.fileno()).st_mode):
+            # regular files can't be watched by the event loop - read them
+            # in a worker thread
+            async def read(size):
+                return await loop.run_in_executor(None, f.read, size)
+        else:
+            reader = asyncio.StreamReader()
+            await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(reader), f)
+            read = reader.read
+        await read_stream(tag, read, packets, tcpdump_ttt, instrumentation)
+
+
+async def report_errors(tag, spec, reader, packets):
+    """
+    awaits a source's reader, passing any error on to process()'s thread
+    """
+    try:
+        await reader
+    except Exception as e:
+        await queue_packets(packets,
+                            ValueError(f"source {tag} ({spec}): {e}"))
+
+
+async def read_sources(commands, files, packets, tcpdump_ttt,
+                       instrumentation):
+    """
+    reads all sources concurrently until every one has ended
+    """
+    readers = [report_errors(tag, command,
+                             read_command(tag, command, packets, tcpdump_ttt,
+                                          instrumentation),
+                             packets)
+               for tag, command in commands]
+    readers += [report_errors(tag, path,
+                              read_file(tag, path, packets, tcpdump_ttt,
+                                        instrumentation),
+                              packets)
+                for tag, path in files]
+    await asyncio.gather(*readers)
+
+
+def sources_gen(commands, files, tcpdump_ttt = False, instrumentation = None):
+    """
+    generates (source tag, DNS_packet) pairs from all sources as they're
+    read by an asyncio event loop on a background thread
+
+           commands - list of (tag, shell command) pairs
+              files - list of (tag, file or FIFO path) pairs
+        tcpdump_ttt - see line_parser()
+    instrumentation - DNS_times_instrument.Instrumentation to count lines
+                      and packets and time parsing with (on the background
+                      thread)
+    """
+    packets = queue.Queue(max_queued_batches)
+
+    def run():
+        try:
+            asyncio.run(read_sources(commands, files, packets, tcpdump_ttt,
+                                     instrumentation))
+        finally:
+            # all sources ended
+            packets.put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    for batch in iter(packets.get, None):
+        if isinstance(batch, Exception):
+            raise batch
+        yield from batch
@@ -0,0 +1,185 @@
+# version 1.0.0
+# requires Python 3.6+
+# MIT License
+
+from array import array
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters - the most frequently added keys (and the sum
+    of a weight added with each) in fixed memory
+
+    At most capacity keys are monitored. A key that isn't monitored takes
+    over the slot of the monitored key with the lowest count (inheriting
+    that count as its possible overcount), so any key added more than
+    1/capacity of the time is always monitored and counts are never
+    underestimated. Monitored keys are kept in sets by count (a "stream
+    summary"), so adding a key is O(1).
+    """
+
+    def __init__(self, legend = "", capacity = 100):
+        """
+          legend - a string used to identify this instance's name/purpose
+        capacity - number of keys monitored
+        """
+        self.legend = legend
+        self.capacity = capacity
+        # count, possible overcount and sum of weights (added since it was
+        # monitored) by monitored key
+        self.counts = {}
+        self.errors = {}
+        self.sums = {}
+        # set of monitored keys by count
+        self.buckets = {}
+        # lowest count of a monitored key
+        self.min_count = 0
+        self.total_count = 0
+
+    def Add(self, key, weight = 0.0):
+        """
+        count key and add weight to its sum
+        """
+        counts = self.counts
+        buckets = self.buckets
+        count = counts.get(key)
+        if count is None:
+            if len(counts) < self.capacity:
+                count = 0
+                self.errors[key] = 0
+                # (the new key's count of 1 is the lowest possible)
+                self.min_count = 1
+            else:
+                # replace a key with the lowest count
+                count = self.min_count
+                bucket = buckets[count]
+                evicted = bucket.pop()
+                if not bucket:
+                    del buckets[count]
+                    self.min_count = count + 1
+                del counts[evicted], self.errors[evicted], self.sums[evicted]
+                self.errors[key] = count
+            self.sums[key] = weight
+        else:
+            bucket = buckets[count]
+            bucket.remove(key)
+            if not bucket:
+                del buckets[count]
+                if count == self.min_count:
+                    self.min_count = count + 1
+            self.sums[key] += weight
+        count += 1
+        counts[key] = count
+        bucket = buckets.get(count)
+        if bucket is None:
+            buckets[count] = {key}
+        else:
+            bucket.add(key)
+        self.total_count += 1
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with
+        """
+        return self.legend
+
+    def GetTop(self, n = 10):
+        """
+        returns [(key, count, possible overcount, mean weight), ...] of the
+        n keys with the highest counts (highest first) - mean weight is over
+        the count - possible overcount adds since the key was monitored
+        """
+        top = sorted(self.counts.items(), key=lambda item: item[1],
+                     reverse=True)[:n]
+        return [(key, count, self.errors[key],
+                 self.sums[key] / ((count - self.errors[key]) or 1))
+                for key, count in top]
+
+## ----------------------------------------------------------------------------
+
+class CountMinTopK:
+    """
+    Count-Min sketch of the total weight added for each key plus the k keys
+    with the highest totals - in fixed memory whatever the number of keys
+
+    Totals are kept in depth rows of width counters (conservative update -
+    only the counters at the key's current minimum are raised), so a key's
+    total is never underestimated and only overestimated by collisions.
+    Keys whose total passes the lowest of the current top k are kept as
+    candidates, pruned back to k once there are 2 * k. Adding a key is
+    O(depth) (amortized).
+    """
+
+    def __init__(self, legend = "", k = 10, width = 1024, depth = 4):
+        """
+        legend - a string used to identify this instance's name/purpose
+             k - number of top keys kept
+         width - counters in each sketch row
+         depth - number of sketch rows (hash functions)
+        """
+        self.legend = legend
+        self.k = k
+        self.width = width
+        self.rows = [array('d', [0.0]) * width for i in range(depth)]
+        # estimated total by candidate key
+        self.candidates = {}
+        # lowest total of the top k at the last prune
+        self.threshold = 0.0
+
+    def Add(self, key, weight = 1.0):
+        """
+        add weight to key's total
+        """
+        h = hash(key)
+        # row n's counter is (h1 + n * h2) % width (h2 is odd so a key's
+        # counters are spread across columns)
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        width = self.width
+        rows = self.rows
+        total = float("inf")
+        i = h1
+        for row in rows:
+            value = row[i % width]
+            if value < total:
+                total = value
+            i += h2
+        total += weight
+        i = h1
+        for row in rows:
+            if row[i % width] < total:
+                row[i % width] = total
+            i += h2
+
+        candidates = self.candidates
+        if key in candidates or total > self.threshold:
+            candidates[key] = total
+            if len(candidates) >= 2 * self.k:
+                top = sorted(candidates.items(), key=lambda item: item[1],
+                             reverse=True)[:self.k]
+                self.candidates = dict(top)
+                self.threshold = top[-1][1]
+
+    def GetEstimate(self, key):
+        """
+        returns estimated total weight added for key (never less than the
+        true total)
+        """
+        h = hash(key)
+        h1 = h & 0xffffffff
+        h2 = (h >> 32) | 1
+        return min(row[(h1 + n * h2) % self.width]
+                   for n, row in enumerate(self.rows))
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with
+        """
+        return self.legend
+
+    def GetTop(self, n = None):
+        """
+        returns [(key, estimated total), ...] of the n (default k) keys with
+        the highest totals (highest first)
+        """
+        return sorted(self.candidates.items(), key=lambda item: item[1],
+                      reverse=True)[:n or self.k]
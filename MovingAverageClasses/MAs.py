@@ -1,10 +1,77 @@
-# version 2.3.0
+# version 2.5.0
 # requires Python 3.6+
 # pdanford - April 2021
 # MIT License
 
+from array import array
+from itertools import accumulate
 from collections import deque
 
+class HistoryRing:
+    """
+    Fixed capacity history of float values in a circular array('d')
+
+    Each value is written twice (at i and i + capacity) so the latest
+    capacity values are always contiguous in the array and GetView() can
+    return them in order as a zero-copy memoryview (e.g. for
+    numpy.frombuffer()). Appending is O(1) and memory is fixed at
+    2 * capacity doubles (16 bytes per value).
+    """
+
+    def __init__(self, capacity):
+        """
+        capacity - number of latest values kept
+        """
+        if capacity < 1:
+            raise ValueError("HistoryRing: capacity must be at least 1")
+        self.capacity = capacity
+        self.values = array('d', [0.0]) * (2 * capacity)
+        self.next_index = 0
+        self.count = 0
+
+    def append(self, value):
+        """
+        add value (dropping the oldest once capacity values are kept)
+        """
+        i = self.next_index
+        self.values[i] = value
+        self.values[i + self.capacity] = value
+        i += 1
+        self.next_index = 0 if i == self.capacity else i
+        self.count += 1
+
+    def extend(self, values):
+        """
+        append each of values
+        """
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __iter__(self):
+        return iter(self.GetView())
+
+    def GetView(self):
+        """
+        returns a memoryview of the kept values, oldest first (the values
+        it shows change with later append() calls)
+        """
+        if self.count < self.capacity:
+            start = 0
+        else:
+            start = self.next_index
+        return memoryview(self.values)[start:start + len(self)]
+
+    def tolist(self):
+        """
+        returns the kept values as a list, oldest first
+        """
+        return self.GetView().tolist()
+
+## ----------------------------------------------------------------------------
+
 class MA:
     """
     base class for specific moving averages (e.g. SMA, EMA)
@@ -13,7 +80,7 @@ class MA:
     CalculateNextMA() function
     """
 
-    def __init__(self, legend, ma_period, keep_history):
+    def __init__(self, legend, ma_period, keep_history, history_capacity=None):
         """
         legend - a string used to uniquely identify a moving average instance's
         name/purpose (note: MA type and period is appended in GetLegend()
@@ -22,10 +89,15 @@ class MA:
         keep_history - if True, all calculated MA values are kept and can be
         retrieved with GetMAHistory(). Set to False to save memory for
         long-running use where a complete history is not needed.
+
+        history_capacity - if given (with keep_history True), only the latest
+        history_capacity MA values and slopes are kept, in fixed size
+        HistoryRing arrays, so history can be kept for long-running use
         """
         self.legend = legend
         self.ma_period = ma_period
         self.keep_history = keep_history
+        self.history_capacity = history_capacity if keep_history else None
 
         # slope_delta_x specifies the change on the new_val's x-axis since the
         # last CalculateNextMA() call. The default is "1 unit", so slope can be
@@ -40,9 +112,13 @@ class MA:
         self.slope = 0
         self.prev_slope = 0
         self.slope_duration = 0
-        self.MA_slope_history = []
         self.MA_type = ''
-        self.MA_history = []
+        if self.history_capacity is not None:
+            self.MA_slope_history = HistoryRing(history_capacity)
+            self.MA_history = HistoryRing(history_capacity)
+        else:
+            self.MA_slope_history = []
+            self.MA_history = []
 
     def __CalculateMASlope__(self):
         """
@@ -69,6 +145,51 @@ class MA:
         if self.keep_history:
             self.MA_slope_history.append(self.slope)
 
+    def __CalculateMASlopes__(self, mas, slope_delta_x):
+        """
+        internal function that does __CalculateMASlope__() for each of mas
+        (MAs calculated by a derived class's CalculateNextMAs() - self.ma
+        must still be the MA before mas when this is called) and returns
+        (slopes, slope durations)
+        """
+        if self.first_pass_init:
+            # so slope starts at 0
+            prev_ma = mas[0]
+            self.first_pass_init = False
+        else:
+            prev_ma = self.ma
+
+        prev_mas = [prev_ma]
+        prev_mas += mas[:-1]
+        slopes = [(y2 - y1)/slope_delta_x for y1, y2 in zip(prev_mas, mas)]
+
+        slope_durations = []
+        prev_slope = self.slope
+        slope_duration = self.slope_duration
+        for slope in slopes:
+            if slope * prev_slope < 0:
+                # sign changed
+                slope_duration = 1
+            else:
+                slope_duration += 1
+            slope_durations.append(slope_duration)
+            prev_slope = slope
+
+        # leave state as if each MA had been added by CalculateNextMA()
+        self.slope_delta_x = slope_delta_x
+        self.prev_ma = prev_mas[-1]
+        self.ma = mas[-1]
+        self.prev_slope = slopes[-2] if len(slopes) > 1 else self.slope
+        self.slope = slopes[-1]
+        self.slope_duration = slope_duration
+
+        # -- update running history --
+        if self.keep_history:
+            self.MA_history.extend(mas)
+            self.MA_slope_history.extend(slopes)
+
+        return slopes, slope_durations
+
     ## --------------------------------
     #  MA details
     def GetMAType(self):
@@ -120,16 +241,40 @@ class MA:
     #  Historical values
     def GetMAHistory(self):
         """
-        returns all MAs calculated since start as a list
+        returns all MAs calculated since start as a list (only the latest
+        history_capacity if it was given)
         """
+        if self.history_capacity is not None:
+            return self.MA_history.tolist()
         return self.MA_history
 
     def GetMASlopeHistory(self):
         """
-        returns all MA slopes calculated since start as a list
+        returns all MA slopes calculated since start as a list (only the
+        latest history_capacity if it was given)
         """
+        if self.history_capacity is not None:
+            return self.MA_slope_history.tolist()
         return self.MA_slope_history
 
+    def GetMAHistoryView(self):
+        """
+        returns a memoryview of the MA history, oldest first (zero copy if
+        history_capacity was given, else a copy of the list)
+        """
+        if self.history_capacity is not None:
+            return self.MA_history.GetView()
+        return memoryview(array('d', self.MA_history))
+
+    def GetMASlopeHistoryView(self):
+        """
+        returns a memoryview of the MA slope history, oldest first (zero copy
+        if history_capacity was given, else a copy of the list)
+        """
+        if self.history_capacity is not None:
+            return self.MA_slope_history.GetView()
+        return memoryview(array('d', self.MA_slope_history))
+
 ## ----------------------------------------------------------------------------
 
 class SMA(MA):
@@ -147,15 +292,16 @@ class SMA(MA):
     collecting enough values to return the proper period SMA).
     """
 
-    def __init__(self, legend, ma_period, keep_history=False):
+    def __init__(self, legend, ma_period, keep_history=False,
+                 history_capacity=None):
         """
         also see MA.__init__()
         """
-        super().__init__(legend, ma_period, keep_history)
+        super().__init__(legend, ma_period, keep_history, history_capacity)
         self.MA_type = 'SMA'
         self.sample_window = deque(maxlen = ma_period)
 
-    def CalculateNextMA(self, new_val, slope_delta_x=1):
+    def CalculateNextMA(self, new_val, slope_delta_x=1, time=None):
         """
         Compute Simple Moving Average iteratively
 
@@ -165,6 +311,9 @@ class SMA(MA):
         correlate with the actual delta x so slope calculation yields the real
         slope.
 
+        time is not used (the period is a count of values) - it's accepted so
+        an SMA can be called the same way as a TimeWindowSMA.
+
         Initialization is a bit non-traditional:  
         The SMA is initialized progressively using a sample window that grows
         with each new value added until the window is the size the SMA instance
@@ -211,6 +360,48 @@ class SMA(MA):
 
         return self.ma
 
+    def CalculateNextMAs(self, values, slope_delta_x=1):
+        """
+        Compute Simple Moving Averages for many values in one call
+
+        Returns (MAs, slopes, slope durations) lists with the same values as
+        calling CalculateNextMA() for each of values and GetMA(),
+        GetMASlope() and GetMASlopeDuration() after each call, and leaves
+        this SMA in the same state. Each MA is updated with the same float
+        operations in the same order as CalculateNextMA() (so results match
+        exactly, including the sign of near zero slopes) - just in one local
+        loop instead of one call per value.
+        """
+        values = list(values)
+        if not values:
+            return [], [], []
+
+        # the current sample window followed by values (the value leaving
+        # the window when samples[n] is added is samples[n - period])
+        samples = list(self.sample_window)
+        first = len(samples)
+        samples += values
+        period = self.ma_period
+        ma = self.ma
+        mas = []
+        append = mas.append
+
+        # -- progressively establish new sma (see CalculateNextMA()) --
+        for n in range(first, min(period, len(samples))):
+            ma *= n
+            ma += samples[n]
+            ma /= n + 1
+            append(ma)
+
+        # -- update established SMA --
+        for n in range(max(first, period), len(samples)):
+            ma += (samples[n] / period)
+            ma -= (samples[n - period] / period)
+            append(ma)
+
+        self.sample_window.extend(values)
+        return (mas,) + super().__CalculateMASlopes__(mas, slope_delta_x)
+
 ## ----------------------------------------------------------------------------
 
 class EMA(MA):
@@ -225,15 +416,16 @@ class EMA(MA):
     converge in 4 or 5 iterations. This is to provide a reasonable MA
     approximation during initialization instead of returning 0s.
     """
-    def __init__(self, legend, ma_period, keep_history=False, slope_delta_x=1):
+    def __init__(self, legend, ma_period, keep_history=False, slope_delta_x=1,
+                 history_capacity=None):
         """
         also see MA.__init__()
         """
-        super().__init__(legend, ma_period, keep_history)
+        super().__init__(legend, ma_period, keep_history, history_capacity)
         self.MA_type = 'EMA'
         self.alpha = 2/(ma_period + 1)
 
-    def CalculateNextMA(self, new_val, slope_delta_x=1):
+    def CalculateNextMA(self, new_val, slope_delta_x=1, time=None):
         """
         Compute Exponential iteratively
 
@@ -242,6 +434,9 @@ class EMA(MA):
         thought of as a "relative" slope, but can be specified exactly here to
         correlate with the actual delta x so slope calculation yields the real
         slope.
+
+        time is not used - it's accepted so an EMA can be called the same way
+        as a TimeWindowSMA.
         """
         # update for next __CalculateMASlope__()
         self.prev_ma = self.ma
@@ -266,3 +461,168 @@ class EMA(MA):
 
         return self.ma
 
+    def CalculateNextMAs(self, values, slope_delta_x=1):
+        """
+        Compute Exponential Moving Averages for many values in one call
+
+        Returns (MAs, slopes, slope durations) lists with the same values as
+        calling CalculateNextMA() for each of values and GetMA(),
+        GetMASlope() and GetMASlopeDuration() after each call, and leaves
+        this EMA in the same state. The EMA recurrence is run by
+        itertools.accumulate() instead of one call per value.
+        """
+        values = list(values)
+        if not values:
+            return [], [], []
+
+        alpha = self.alpha
+        def next_ma(ma, new_val):
+            return alpha * new_val + (1 - alpha) * ma
+
+        if self.first_pass_init:
+            # initialize with first value added to EMA
+            mas = list(accumulate(values, next_ma))
+        else:
+            mas = list(accumulate([self.ma] + values, next_ma))[1:]
+
+        return (mas,) + super().__CalculateMASlopes__(mas, slope_delta_x)
+
+## ----------------------------------------------------------------------------
+
+class TimeWindowSMA(MA):
+    """
+    Time Window Simple Moving Average
+
+    Computes the Simple Moving Average of the values added in the last
+    window_s of time (instead of the last ma_period values) iteratively by
+    calling CalculateNextMA() with each value's time, so MAs of series with
+    different value rates cover the same span of time. The slope's delta x
+    is the time since the previous value.
+
+    Values are evicted from the window by time in O(1) amortized, and the
+    window's minimum and maximum values are tracked with monotonic deques
+    (also O(1) amortized).
+    """
+
+    def __init__(self, legend, window_s, keep_history=False,
+                 history_capacity=None):
+        """
+        window_s - length of time window (same units as the times given to
+                   CalculateNextMA())
+
+        also see MA.__init__()
+        """
+        super().__init__(legend, window_s, keep_history, history_capacity)
+        self.MA_type = 'SMA'
+        self.window_s = window_s
+        # (time, value) of values in window, oldest first, and their sum
+        self.samples = deque()
+        self.sum = 0
+        # (time, value) of values in window that could still become the
+        # window's minimum (values increasing) or maximum (values decreasing)
+        self.min_samples = deque()
+        self.max_samples = deque()
+        self.prev_time = None
+
+    def __Evict(self, now):
+        """
+        Internal function to drop values at or before now - window_s
+        """
+        cutoff = now - self.window_s
+        samples = self.samples
+        while samples and samples[0][0] <= cutoff:
+            self.sum -= samples.popleft()[1]
+        if not samples:
+            # (don't carry float rounding into the next window)
+            self.sum = 0
+        while self.min_samples and self.min_samples[0][0] <= cutoff:
+            self.min_samples.popleft()
+        while self.max_samples and self.max_samples[0][0] <= cutoff:
+            self.max_samples.popleft()
+
+    def CalculateNextMA(self, new_val, slope_delta_x=1, time=None):
+        """
+        Compute Time Window Simple Moving Average iteratively
+
+        time - time new_val was observed (times should be nondecreasing) -
+               the time since the previous value is the slope's delta x
+
+        If time isn't given, new_val is taken to be observed slope_delta_x
+        after the previous value (so the arguments mean the same as for SMA
+        and EMA, and a series added without times is timed in slope_delta_x
+        units).
+        """
+        # update for next __CalculateMASlope__()
+        self.prev_ma = self.ma
+        if time is None:
+            self.slope_delta_x = slope_delta_x
+            time = (slope_delta_x if self.prev_time is None else
+                    self.prev_time + slope_delta_x)
+        elif self.prev_time is not None and time > self.prev_time:
+            self.slope_delta_x = time - self.prev_time
+        self.prev_time = time
+
+        self.samples.append((time, new_val))
+        self.sum += new_val
+        min_samples = self.min_samples
+        while min_samples and min_samples[-1][1] >= new_val:
+            min_samples.pop()
+        min_samples.append((time, new_val))
+        max_samples = self.max_samples
+        while max_samples and max_samples[-1][1] <= new_val:
+            max_samples.pop()
+        max_samples.append((time, new_val))
+
+        self.__Evict(time)
+        self.ma = self.sum / len(self.samples)
+
+        if self.first_pass_init:
+            # so slope starts at 0
+            self.prev_ma = self.ma
+            self.first_pass_init = False
+
+        # -- update slope based on this MA --
+        super().__CalculateMASlope__()
+
+        # -- update running history --
+        if self.keep_history:
+            self.MA_history.append(self.ma)
+
+        return self.ma
+
+    def Expire(self, now):
+        """
+        drop values that are no longer in the window ending at time now
+        (without a new value) and returns True if the MA changed - the MA is
+        0 while the window is empty (slope and history aren't updated)
+        """
+        if not self.samples or self.samples[0][0] > now - self.window_s:
+            return False
+        self.__Evict(now)
+        self.ma = self.sum / len(self.samples) if self.samples else 0
+        return True
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with (plus window
+        length)
+        """
+        return f"{self.legend}({self.MA_type}{self.window_s:g}s)"
+
+    def GetCount(self):
+        """
+        returns number of values in the window
+        """
+        return len(self.samples)
+
+    def GetMin(self):
+        """
+        returns minimum value in the window (None if window is empty)
+        """
+        return self.min_samples[0][1] if self.min_samples else None
+
+    def GetMax(self):
+        """
+        returns maximum value in the window (None if window is empty)
+        """
+        return self.max_samples[0][1] if self.max_samples else None
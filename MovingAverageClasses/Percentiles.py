@@ -0,0 +1,219 @@
+# version 1.0.0
+# requires Python 3.6+
+# MIT License
+
+import math
+
+class LogHistogram:
+    """
+    Mergeable streaming percentile sketch for positive values
+
+    Values are counted in logarithmic buckets (HDR histogram / DDSketch
+    style) so any percentile is returned within relative_accuracy of the
+    true value. Adding a value is O(1) and memory is bounded by the number
+    of buckets between min_value and max_value, no matter how many values
+    are added (only buckets in use are stored).
+    """
+
+    def __init__(self,
+                 legend = "",
+                 relative_accuracy = 0.02,
+                 min_value = 0.001,
+                 max_value = 1e7):
+        """
+                    legend - a string used to identify this instance's
+                             name/purpose
+         relative_accuracy - maximum relative error of returned percentiles
+                 min_value - values at or below this are counted as
+                             min_value
+                 max_value - values at or above this are counted as
+                             max_value
+        """
+        self.legend = legend
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.inv_log_gamma = 1 / math.log(self.gamma)
+        self.min_index = self.__Index(min_value)
+        self.max_index = self.__Index(max_value)
+        self.count = 0
+        # bucket index -> count of values in bucket
+        self.buckets = {}
+
+    def __Index(self, value):
+        """
+        Internal function returning bucket index for value
+        """
+        return math.ceil(math.log(value) * self.inv_log_gamma)
+
+    def AddValue(self, value):
+        """
+        count value in its bucket
+        """
+        if value > 0:
+            i = math.ceil(math.log(value) * self.inv_log_gamma)
+            if i < self.min_index:
+                i = self.min_index
+            elif i > self.max_index:
+                i = self.max_index
+        else:
+            i = self.min_index
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+
+    def Merge(self, other):
+        """
+        add all values counted by other LogHistogram (which must have been
+        created with the same relative_accuracy) to this one
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("LogHistogram: can't merge histograms with "
+                             "different relative_accuracy")
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        self.count += other.count
+
+    def Clear(self):
+        """
+        forget all values added
+        """
+        self.buckets.clear()
+        self.count = 0
+
+    def GetCount(self):
+        """
+        returns number of values added
+        """
+        return self.count
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with
+        """
+        return self.legend
+
+    def GetPercentiles(self, percentiles):
+        """
+        returns list of values at each percentile (0 to 100) in percentiles
+        (0s if no values have been added)
+        """
+        return percentiles_from_buckets(self.buckets, self.count,
+                                        self.gamma, percentiles)
+
+    def GetPercentile(self, percentile):
+        """
+        returns value at percentile (0 to 100)
+        """
+        return self.GetPercentiles((percentile,))[0]
+
+## ----------------------------------------------------------------------------
+
+class WindowedPercentiles:
+    """
+    Streaming percentiles over a sliding time window
+
+    The window is split into a ring of slots, each with its own
+    LogHistogram, so old values drop out a slot at a time. Memory is fixed
+    at slots LogHistograms and adding a value is O(1).
+    """
+
+    def __init__(self,
+                 legend = "",
+                 window_s = 60,
+                 slots = 6,
+                 relative_accuracy = 0.02):
+        """
+                    legend - a string used to identify this instance's
+                             name/purpose (window length is appended in
+                             GetLegend() for clarity)
+                  window_s - length of sliding time window (same units as the
+                             times given to AddValue())
+                     slots - number of slots window_s is split into
+         relative_accuracy - see LogHistogram
+        """
+        self.legend = legend
+        self.window_s = window_s
+        self.slots = slots
+        self.slot_s = window_s / slots
+        self.histograms = [LogHistogram("", relative_accuracy)
+                           for i in range(slots)]
+        # slot number (time // slot_s) each histogram currently holds
+        self.histogram_slots = [None] * slots
+        self.latest_slot = None
+
+    def AddValue(self, value, time):
+        """
+        count value observed at time (times should be nondecreasing)
+        """
+        slot = int(time // self.slot_s)
+        i = slot % self.slots
+        if self.histogram_slots[i] != slot:
+            # reuse histogram of a slot that has left the window
+            self.histograms[i].Clear()
+            self.histogram_slots[i] = slot
+        self.histograms[i].AddValue(value)
+        if self.latest_slot is None or slot > self.latest_slot:
+            self.latest_slot = slot
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with (plus window
+        length)
+        """
+        return f"{self.legend}({self.window_s:g}s)"
+
+    def GetPercentiles(self, percentiles, now = None):
+        """
+        returns list of values at each percentile (0 to 100) in percentiles
+        over the window ending at time now (defaults to time of latest value
+        added)
+        """
+        if now is None:
+            if self.latest_slot is None:
+                return [0] * len(percentiles)
+            newest_slot = self.latest_slot
+        else:
+            newest_slot = int(now // self.slot_s)
+
+        buckets = {}
+        count = 0
+        for h, slot in zip(self.histograms, self.histogram_slots):
+            if slot is not None and newest_slot - self.slots < slot <= newest_slot:
+                for i, n in h.buckets.items():
+                    buckets[i] = buckets.get(i, 0) + n
+                count += h.count
+        return percentiles_from_buckets(buckets, count,
+                                        self.histograms[0].gamma, percentiles)
+
+    def GetPercentile(self, percentile, now = None):
+        """
+        returns value at percentile (0 to 100) over the window ending at time
+        now (defaults to time of latest value added)
+        """
+        return self.GetPercentiles((percentile,), now)[0]
+
+## ----------------------------------------------------------------------------
+
+def percentiles_from_buckets(buckets, count, gamma, percentiles):
+    """
+    returns list of values at each percentile in percentiles for LogHistogram
+    style buckets holding count values
+    """
+    if count == 0:
+        return [0] * len(percentiles)
+
+    # rank (1 based) of value at each percentile in sorted order
+    ranks = sorted((max(1, math.ceil(p / 100 * count)), n)
+                   for n, p in enumerate(percentiles))
+    values = [0] * len(percentiles)
+    r = 0
+    seen = 0
+    for i in sorted(buckets):
+        seen += buckets[i]
+        while r < len(ranks) and ranks[r][0] <= seen:
+            # representative value of bucket i (within relative accuracy of
+            # any value in the bucket)
+            values[ranks[r][1]] = 2 * gamma ** i / (gamma + 1)
+            r += 1
+        if r == len(ranks):
+            break
+    return values
@@ -0,0 +1,178 @@
+# version 1.0.0
+# requires Python 3.6+
+# MIT License
+
+from array import array
+
+class RollupRing:
+    """
+    Per time bucket count, sum, min, max and failure count of values in a
+    fixed ring of buckets
+
+    All bucket fields are kept in preallocated arrays so memory is fixed at
+    buckets entries however long values are added. A bucket is reused as
+    soon as time moves past the oldest bucket in the ring.
+    """
+
+    def __init__(self, legend = "", bucket_s = 1, buckets = 120):
+        """
+          legend - a string used to identify this instance's name/purpose
+        bucket_s - length of time each bucket covers (same units as the
+                   times given to AddValue())
+         buckets - number of buckets in ring (history kept is
+                   bucket_s * buckets)
+        """
+        self.legend = legend
+        self.bucket_s = bucket_s
+        self.buckets = buckets
+        self.span_s = bucket_s * buckets
+        # bucket number (time // bucket_s) each ring entry currently holds
+        # (-1 for never used)
+        self.bucket_numbers = array('q', [-1]) * buckets
+        self.counts = array('q', [0]) * buckets
+        self.failures = array('q', [0]) * buckets
+        self.sums = array('d', [0.0]) * buckets
+        self.mins = array('d', [0.0]) * buckets
+        self.maxs = array('d', [0.0]) * buckets
+        self.latest_bucket_number = -1
+
+    def __Reuse(self, i, bucket_number):
+        """
+        Internal function to reset ring entry i for bucket_number (returns
+        False if i holds a newer bucket - bucket_number is too old to keep)
+        """
+        if self.bucket_numbers[i] > bucket_number:
+            return False
+        self.bucket_numbers[i] = bucket_number
+        self.counts[i] = 0
+        self.failures[i] = 0
+        self.sums[i] = 0.0
+        if bucket_number > self.latest_bucket_number:
+            self.latest_bucket_number = bucket_number
+        return True
+
+    def AddValue(self, value, time):
+        """
+        count value observed at time
+        """
+        bucket_number = int(time // self.bucket_s)
+        i = bucket_number % self.buckets
+        if (self.bucket_numbers[i] != bucket_number and
+            not self.__Reuse(i, bucket_number)):
+            return
+        count = self.counts[i]
+        if count == 0 or value < self.mins[i]:
+            self.mins[i] = value
+        if count == 0 or value > self.maxs[i]:
+            self.maxs[i] = value
+        self.counts[i] = count + 1
+        self.sums[i] += value
+
+    def AddFailure(self, time):
+        """
+        count a failure at time
+        """
+        bucket_number = int(time // self.bucket_s)
+        i = bucket_number % self.buckets
+        if (self.bucket_numbers[i] == bucket_number or
+            self.__Reuse(i, bucket_number)):
+            self.failures[i] += 1
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with
+        """
+        return self.legend
+
+    def GetSummary(self, span_s, now = None):
+        """
+        returns (count, sum, min, max, failures) of the buckets in the span_s
+        long span of time ending at time now (defaults to time of latest
+        bucket) - min and max are None if no values were added
+        """
+        if now is None:
+            newest = self.latest_bucket_number
+        else:
+            newest = int(now // self.bucket_s)
+        oldest = newest - min(self.buckets, max(1, round(span_s /
+                                                          self.bucket_s)))
+        count = failures = 0
+        total = 0.0
+        lowest = highest = None
+        for i, bucket_number in enumerate(self.bucket_numbers):
+            if oldest < bucket_number <= newest:
+                failures += self.failures[i]
+                n = self.counts[i]
+                if n:
+                    count += n
+                    total += self.sums[i]
+                    if lowest is None or self.mins[i] < lowest:
+                        lowest = self.mins[i]
+                    if highest is None or self.maxs[i] > highest:
+                        highest = self.maxs[i]
+        return count, total, lowest, highest, failures
+
+## ----------------------------------------------------------------------------
+
+class Rollups:
+    """
+    RollupRings at several time resolutions (1s, 1m and 1h buckets by
+    default) fed the same values, so summaries of recent seconds and of the
+    last hours are both available with fixed memory
+    """
+
+    def __init__(self,
+                 legend = "",
+                 resolutions = ((1, 120), (60, 120), (3600, 48))):
+        """
+             legend - a string used to identify this instance's name/purpose
+        resolutions - (bucket_s, buckets) of each RollupRing, finest first
+        """
+        self.legend = legend
+        self.rings = [RollupRing(f"{bucket_s:g}s", bucket_s, buckets)
+                      for bucket_s, buckets in resolutions]
+
+    def AddValue(self, value, time):
+        """
+        count value observed at time in all rings
+        """
+        for ring in self.rings:
+            ring.AddValue(value, time)
+
+    def AddFailure(self, time):
+        """
+        count a failure at time in all rings
+        """
+        for ring in self.rings:
+            ring.AddFailure(time)
+
+    def GetLegend(self):
+        """
+        returns legend string this instance was created with
+        """
+        return self.legend
+
+    def GetRing(self, span_s):
+        """
+        returns the finest resolution RollupRing holding at least span_s of
+        history (or the one holding the most)
+        """
+        for ring in self.rings:
+            if ring.span_s >= span_s:
+                return ring
+        return self.rings[-1]
+
+    def GetSummary(self, span_s, now = None):
+        """
+        returns (count, sum, min, max, failures) over the span_s long span
+        of time ending at time now (see RollupRing.GetSummary())
+        """
+        return self.GetRing(span_s).GetSummary(span_s, now)
+
+    def GetMean(self, span_s, now = None):
+        """
+        returns mean value over the span_s long span of time ending at time
+        now (0 if no values were added)
+        """
+        count, total = self.GetSummary(span_s, now)[:2]
+        return total / count if count else 0
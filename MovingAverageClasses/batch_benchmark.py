@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# requires Python 3.6+
+
+"""
+Benchmarks SMA/EMA CalculateNextMAs() (one call for many values) against
+calling CalculateNextMA() once per value, and checks both produce exactly
+the same MAs, slopes and slope durations - for random floats and for
+repeated and low cardinality values (where float rounding differences would
+flip the sign of near zero slopes and so change slope durations).
+
+Usage:
+    ./batch_benchmark.py [--values 1000000] [--period 10] [--batch 10000]
+"""
+
+import time
+import random
+import argparse
+from MAs import SMA, EMA
+
+
+def scalar_run(ma, values):
+    """
+    returns (MAs, slopes, slope durations) from one CalculateNextMA() call
+    per value
+    """
+    mas, slopes, slope_durations = [], [], []
+    for value in values:
+        mas.append(ma.CalculateNextMA(value))
+        slopes.append(ma.GetMASlope())
+        slope_durations.append(ma.GetMASlopeDuration())
+    return mas, slopes, slope_durations
+
+
+def batch_run(ma, values, batch):
+    """
+    returns (MAs, slopes, slope durations) from CalculateNextMAs() calls of
+    batch values each
+    """
+    mas, slopes, slope_durations = [], [], []
+    for start in range(0, len(values), batch):
+        results = ma.CalculateNextMAs(values[start:start + batch])
+        mas += results[0]
+        slopes += results[1]
+        slope_durations += results[2]
+    return mas, slopes, slope_durations
+
+
+def check_same_output(scalar, batched):
+    """
+    raises ValueError if scalar and batched results differ at all
+    """
+    for name, a, b in zip(("MA", "slope", "slope duration"), scalar, batched):
+        for n, (x, y) in enumerate(zip(a, b)):
+            if x != y:
+                raise ValueError(f"{name} mismatch at value {n}: {x} vs {y}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--values",
+                        type=int,
+                        default=1000000,
+                        help="number of values to add to each MA")
+    parser.add_argument("--period",
+                        type=int,
+                        default=10,
+                        help="MA period")
+    parser.add_argument("--batch",
+                        type=int,
+                        default=10000,
+                        help="values per CalculateNextMAs() call")
+    args = parser.parse_args()
+
+    random.seed(0)
+    inputs = (
+      ("random floats",
+       [random.lognormvariate(3, 0.5) for _ in range(args.values)]),
+      ("repeated value", [66.0] * args.values),
+      ("low cardinality",
+       [random.choice([0.1, 0.7, 0.3]) for _ in range(args.values)]))
+
+    for input_name, values in inputs:
+        print(f"-- {input_name} --")
+        for ma_class in (SMA, EMA):
+            start = time.perf_counter()
+            scalar = scalar_run(ma_class("scalar", args.period), values)
+            scalar_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batched = batch_run(ma_class("batch", args.period), values,
+                                args.batch)
+            batch_s = time.perf_counter() - start
+
+            check_same_output(scalar, batched)
+            name = ma_class.__name__
+            print(f"{name}.CalculateNextMA  {args.values / scalar_s:>12,.0f} values/s")
+            print(f"{name}.CalculateNextMAs {args.values / batch_s:>12,.0f} values/s"
+                  f"  ({scalar_s / batch_s:.1f}x, same output)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# requires Python 3.6+
+
+"""
+Compares memory used and CalculateNextMA() time of SMA history kept in
+lists (keep_history=True) against fixed capacity HistoryRing arrays
+(keep_history=True, history_capacity=N).
+
+Usage:
+    ./history_benchmark.py [--values 1000000] [--history_capacity 100000]
+"""
+
+import time
+import argparse
+import tracemalloc
+from MAs import SMA
+
+
+def add_values(values, **sma_args):
+    """
+    returns an SMA created with sma_args after adding values to it
+    """
+    sma = SMA("bench", 10, **sma_args)
+    for x in range(values):
+        sma.CalculateNextMA(x % 1000)
+    return sma
+
+
+def measure(values, **sma_args):
+    """
+    returns (bytes kept, seconds taken) to add values to an SMA created with
+    sma_args (timed separately since tracemalloc slows allocation)
+    """
+    tracemalloc.start()
+    sma = add_values(values, **sma_args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sma
+
+    start = time.perf_counter()
+    add_values(values, **sma_args)
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--values",
+                        type=int,
+                        default=1000000,
+                        help="number of values to add to each SMA")
+    parser.add_argument("--history_capacity",
+                        type=int,
+                        default=100000,
+                        help="history capacity of the HistoryRing SMA")
+    args = parser.parse_args()
+
+    print(f"{args.values:,} values added to each SMA")
+    for name, sma_args in (
+      ("no history", {}),
+      ("list history", {"keep_history": True}),
+      (f"ring history ({args.history_capacity:,})",
+       {"keep_history": True, "history_capacity": args.history_capacity})):
+        size, seconds = measure(args.values, **sma_args)
+        print(f"{name:<28}{size / 2**20:>10.1f} MiB"
+              f"{args.values / seconds:>14,.0f} values/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
+import sys
+import signal
+import threading
 from time import sleep
 from shutil import get_terminal_size
 from collections import deque
 
-# version 1.1.4
+# version 1.3.0
 # requires Python 3.6+ 
 # pdanford - January 2021
 # MIT License
@@ -20,6 +23,11 @@ class ScrollRegion:
     Each region location is based on the number of rows in the region and 
     how many regions have already been created.
 
+    All escape sequences and text for an update (e.g. an AddLine() including
+    any reprint of all regions it triggers) are collected in an output buffer
+    and written to the terminal at once. BeginUpdate()/EndUpdate() can be used
+    to collect several updates into a single write.
+
     Note: requires VT100 escape compatibility
     """
 
@@ -27,8 +35,14 @@ class ScrollRegion:
     # where 1st instance scroll region is located in terminal window
     __scroll_region_start_row = 1
 
+    # current terminal window size - kept up to date by a SIGWINCH handler
+    # (see WatchTerminalSize()) or else read for each update
+    __terminal_columns, __terminal_rows = get_terminal_size()
+    __watching_terminal_size = False
+
     # used to detect terminal window size changes
-    __prev_terminal_columns, __prev_terminal_rows = get_terminal_size()
+    __prev_terminal_columns, __prev_terminal_rows = \
+      __terminal_columns, __terminal_rows
 
     # a list of all ScrollRegion instances
     __scroll_regions_list = []
@@ -42,6 +56,11 @@ class ScrollRegion:
     # enough for all scroll region(s) rows
     __more_below_message =\
       f"{ANSI_yellow_bg} ↓↓ more below ↓↓ {ANSI_color_reset}{ANSI_clear_rest_of_line}"
+
+    # output collected for the next single write to the terminal, and how
+    # many BeginUpdate() calls are waiting for their EndUpdate()
+    __output_buffer = []
+    __update_depth = 0
     ## ---------------------------
 
 
@@ -87,19 +106,25 @@ class ScrollRegion:
         # update class global for next new ScrollRegion instantiated
         ScrollRegion.__scroll_region_start_row = self.__scroll_region_end_row + 1
 
+        ScrollRegion.BeginUpdate()
+
         # prep terminal window on first use for clean display of ScrollRegion(s)
         if len(ScrollRegion.__scroll_regions_list) == 0:
+            ScrollRegion.WatchTerminalSize()
+
             # clear terminal window and scroll-back buffer, otherwise it will
             # interfere with display when terminal window is resized or
             # scrolled back:
-            print(f"{ANSI_clear_screen}", end="")
-            print(f"{ANSI_erase_scrollback_buffer}", end="")
+            ScrollRegion.__Write(f"{ANSI_clear_screen}")
+            ScrollRegion.__Write(f"{ANSI_erase_scrollback_buffer}")
 
         ScrollRegion.__scroll_regions_list.append(self)
 
-        self.ClearScrollRegion("-")
+        self.__ClearScrollRegion("-")
+
+        self.__SetTitle(title)
 
-        self.SetTitle(title)
+        ScrollRegion.EndUpdate()
 
 
     def __del__(self):
@@ -108,28 +133,121 @@ class ScrollRegion:
         if self.__scroll_region_start_row <= 2:
             # reset term to default scrolling region
             ANSI_set_scroll_region ="\x1b[r"
-            print(f"{ANSI_set_scroll_region}", end="")
-
             # position cursor to window bottom
-            columns, rows = get_terminal_size()
+            columns, rows = ScrollRegion.__GetTerminalSize()
             ANSI_postion_to_row = f"\x1b[{rows};1H"
-            print(f"{ANSI_postion_to_row}", end="")
-            print("\n-- done --")
+            ScrollRegion.__Write(f"{ANSI_set_scroll_region}"
+                                 f"{ANSI_postion_to_row}"
+                                 "\n-- done --\n")
+            ScrollRegion.__update_depth = 0
+            ScrollRegion.__Flush()
+
+
+    ## --------------------------------
+    #  Output buffering
+    @staticmethod
+    def BeginUpdate():
+        """
+        Hold all output until the matching EndUpdate() call so it is written
+        to the terminal at once (calls can be nested)
+        """
+        ScrollRegion.__update_depth += 1
+
+
+    @staticmethod
+    def EndUpdate():
+        """
+        Write output held since the matching BeginUpdate() call (once the
+        outermost BeginUpdate() call is matched)
+        """
+        ScrollRegion.__update_depth -= 1
+        ScrollRegion.__Flush()
+
+
+    @staticmethod
+    def __Write(text):
+        """
+        Internal function to add text to the output buffer
+        """
+        ScrollRegion.__output_buffer.append(text)
+
+
+    @staticmethod
+    def __Flush():
+        """
+        Internal function to write the output buffer to the terminal in a
+        single write (unless output is being held by BeginUpdate())
+        """
+        if ScrollRegion.__update_depth > 0 or not ScrollRegion.__output_buffer:
+            return
+        output = "".join(ScrollRegion.__output_buffer)
+        ScrollRegion.__output_buffer.clear()
+        sys.stdout.write(output)
+        sys.stdout.flush()
 
 
+    ## --------------------------------
+    #  Terminal size
+    @staticmethod
+    def WatchTerminalSize():
+        """
+        Keep the terminal window size cached by a SIGWINCH handler instead of
+        reading it for every update. This is done automatically when the
+        first ScrollRegion is created, but must be called from the main
+        thread (so call it before creating ScrollRegions from other threads).
+        Without SIGWINCH (or outside the main thread) the size is read for
+        every update.
+        """
+        if ScrollRegion.__watching_terminal_size:
+            return
+        if (not hasattr(signal, "SIGWINCH") or
+            threading.current_thread() is not threading.main_thread()):
+            return
+
+        def terminal_resized(signum, frame):
+            ScrollRegion.__terminal_columns, ScrollRegion.__terminal_rows = \
+              get_terminal_size()
+
+        signal.signal(signal.SIGWINCH, terminal_resized)
+        ScrollRegion.__watching_terminal_size = True
+        # pick up any change before the handler was installed
+        terminal_resized(signal.SIGWINCH, None)
+
+
+    @staticmethod
+    def __GetTerminalSize():
+        """
+        Internal function returning (columns, rows) of the terminal window
+        """
+        if not ScrollRegion.__watching_terminal_size:
+            ScrollRegion.__terminal_columns, ScrollRegion.__terminal_rows = \
+              get_terminal_size()
+        return ScrollRegion.__terminal_columns, ScrollRegion.__terminal_rows
+
+
+    ## --------------------------------
     def ClearScrollRegion(self, blanking_string = ""):
         """
         Clears the entire scroll region and line cache (including title
         area) with blanking_string.
         """
+        self.__ClearScrollRegion(blanking_string)
+        ScrollRegion.__Flush()
+
+
+    def __ClearScrollRegion(self, blanking_string):
+        """
+        Internal function for ClearScrollRegion() that leaves output in the
+        output buffer
+        """
         # remove any title so entire scroll region is cleared
-        self.SetTitle("")
+        self.__SetTitle("")
 
         # flush line cache with blanking_string
         self.__line_cache.clear()
         for i in range(self.__scroll_region_height):
             self.__line_cache.append(blanking_string)
-            self.__Print(blanking_string, 0)
+            self.__Print(blanking_string)
 
         # clear class global "more below" flag (to be reset during next
         # __Print() if needed
@@ -142,6 +260,15 @@ class ScrollRegion:
         against each other. So use a " " if no title is wanted but still a line
         between regions is desired.
         """
+        self.__SetTitle(title)
+        ScrollRegion.__Flush()
+
+
+    def __SetTitle(self, title):
+        """
+        Internal function for SetTitle() that leaves output in the output
+        buffer
+        """
         if self.__title == "":
             if title != "":
                 # don't include title in scrolling region
@@ -158,23 +285,21 @@ class ScrollRegion:
             # make sure that this scroll region start is actually on screen
             # and print title at top of scroll region if so
             title_row = self.__scroll_region_start_row - 1
-            terminal_columns, terminal_rows = get_terminal_size()
+            terminal_columns, terminal_rows = ScrollRegion.__GetTerminalSize()
             if (title_row <= terminal_rows and
                 title_row > 0):
-                # position to title row
+                # position to title row and print title
                 ANSI_postion_to_row = f"\x1b[{title_row};1H"
-                print(f"{ANSI_postion_to_row}", end="")
-                # print title
-                print(f"{self.__title}", end="")
-                print(f"{ANSI_clear_rest_of_line}\r", end="")
+                ScrollRegion.__Write(f"{ANSI_postion_to_row}"
+                                     f"{self.__title}"
+                                     f"{ANSI_clear_rest_of_line}\r")
 
                 ## ---------------------------------
 
                 if ScrollRegion.__more_below_flag:
                     # display "more below" message at last row of terminal window
-                    terminal_columns, terminal_rows = get_terminal_size()
                     ANSI_postion_to_row = f"\x1b[{terminal_rows};1H"
-                    print(f"{ANSI_postion_to_row}{ScrollRegion.__more_below_message}", end="")
+                    ScrollRegion.__Write(f"{ANSI_postion_to_row}{ScrollRegion.__more_below_message}")
 
 
     def AddLine(self, line, scroll_delay_s = 0.125):
@@ -188,7 +313,7 @@ class ScrollRegion:
         self.__line_cache.append(line)
 
         # Print newly added line to this scroll region end row
-        self.__Print(line, scroll_delay_s)
+        self.__Print(line)
 
         reprint_trigger = self.__CheckScreenRefreshTrigger()
         if reprint_trigger == "REPRINT_ALL_SCROLL_REGIONS":
@@ -197,7 +322,7 @@ class ScrollRegion:
             ScrollRegion.__more_below_flag = False
 
             # erase terminal's scrollback buffer
-            print(f"{ANSI_erase_scrollback_buffer}", end="")
+            ScrollRegion.__Write(f"{ANSI_erase_scrollback_buffer}")
 
             # reprint all regions' cache
             # (do in reverse so __more_below_flag is updated for higher
@@ -209,21 +334,27 @@ class ScrollRegion:
 
             if ScrollRegion.__more_below_flag:
                 # display "more below" message at last row of terminal window
-                terminal_columns, terminal_rows = get_terminal_size()
+                terminal_columns, terminal_rows = ScrollRegion.__GetTerminalSize()
                 ANSI_postion_to_row = f"\x1b[{terminal_rows};1H"
-                print(f"{ANSI_postion_to_row}{ScrollRegion.__more_below_message}", end="")
+                ScrollRegion.__Write(f"{ANSI_postion_to_row}{ScrollRegion.__more_below_message}")
+
+        # write this line (and any reprint) to the terminal at once
+        ScrollRegion.__Flush()
+
+        # scroll delay each line for readability
+        if scroll_delay_s > 0:
+            sleep(scroll_delay_s)
 
 
-    def __Print(self, line, scroll_delay_s):
+    def __Print(self, line):
         """
         Internal function to print line string  at the last line of this
         instance's scroll region in the terminal window and scroll up one line.
 
                   line - string to print at bottom of this scroll region
-        scroll_delay_s - scroll delay each line print for readability
         """
         # make sure that this scroll region start is actually on screen
-        terminal_columns, terminal_rows = get_terminal_size()
+        terminal_columns, terminal_rows = ScrollRegion.__GetTerminalSize()
 
         if ScrollRegion.__more_below_flag:
             # since this or some other ScrollRegion flagged it was truncated,
@@ -248,21 +379,20 @@ class ScrollRegion:
         else:
             print_row_num = self.__scroll_region_end_row
 
-        # set scrolling region for this ScrollRegion instance
+        # set scrolling region for this ScrollRegion instance and position to
+        # end of scroll region before printing line data
         ANSI_set_scroll_region = f"\x1b[{self.__scroll_region_start_row};{print_row_num}r"
-        print(f"{ANSI_set_scroll_region}", end="")
-        # position to end of scroll region before printing line data
         ANSI_postion_to_row = f"\x1b[{print_row_num};1H"
-        print(f"{ANSI_postion_to_row}", end="")
+        ScrollRegion.__Write(f"{ANSI_set_scroll_region}{ANSI_postion_to_row}")
 
         # ** fix for background color wrapping edge case **
         # this takes care of a highlighted line that wraps causing highlight
         # running all the way across the next line
-        line += f"{ANSI_clear_rest_of_line}"
+        line = f"{line}{ANSI_clear_rest_of_line}"
 
         if print_row_num - self.__scroll_region_start_row >= 1:
             # prepend a newline to cause previous lines to scroll up in region
-            print(f"\n{line}\r", end="")
+            ScrollRegion.__Write(f"\n{line}\r")
 
             # ** fix for macOS terminal edge case **
             if (self.__title == "" and
@@ -271,14 +401,11 @@ class ScrollRegion:
                 # terminal will still fill the scroll-back buffer, so this
                 # keeps it clear to avoid confusion if the window scroll-bar
                 # is accidentally used - iterm2 doesn't have this issue
-                print(f"{ANSI_erase_scrollback_buffer}", end="")
+                ScrollRegion.__Write(f"{ANSI_erase_scrollback_buffer}")
         else:
             # don't do the prepend \n for scroll regions of 1 row because some
             # terminals will scroll any title line too in certain edge cases
-            print(f"{line}{ANSI_clear_rest_of_line}\r", end="")
-
-        # scroll delay each line for readability
-        sleep(scroll_delay_s)
+            ScrollRegion.__Write(f"{line}{ANSI_clear_rest_of_line}\r")
 
         return
 
@@ -289,11 +416,11 @@ class ScrollRegion:
         instance's entire line cache and title (if any).
         """
         # reprint title (if any)
-        self.SetTitle(self.__title)
+        self.__SetTitle(self.__title)
 
         # reprint entire line cache to refresh whole scroll region
         for line in self.__line_cache:
-            self.__Print(line, 0)
+            self.__Print(line)
 
 
     def __CheckScreenRefreshTrigger(self):
@@ -316,7 +443,7 @@ class ScrollRegion:
                                        reprinted entirely to fix coordinates
         """
         # get current terminal window dimensions
-        terminal_columns, terminal_rows = get_terminal_size()
+        terminal_columns, terminal_rows = ScrollRegion.__GetTerminalSize()
 
         # assume a scroll region reprint trigger did not happen
         return_flag = ""
@@ -350,3 +477,149 @@ class ScrollRegion:
 
         return return_flag
 
+
+
+## ----------------------------------------------------------------------------
+
+class BufferedScrollRegion:
+    """
+    Drop-in stand-in for ScrollRegion whose AddLine() and SetTitle() only
+    buffer - they never touch the terminal or sleep - so the caller runs at
+    full speed. A render thread started with StartRendering() redraws all
+    BufferedScrollRegion instances at a fixed frame rate using real
+    ScrollRegion instances (created in the same order as the
+    BufferedScrollRegion instances).
+
+    When more lines are added between frames than fit in the region, only
+    the latest are shown preceded by a "skipped K lines" line.
+    """
+
+    ## ----- class variables -----
+    # guards all BufferedScrollRegion instance buffers
+    __lock = threading.Lock()
+
+    # a list of all BufferedScrollRegion instances
+    __buffered_regions_list = []
+
+    # render thread started by StartRendering()
+    __render_thread = None
+    __stop_rendering = threading.Event()
+    ## ---------------------------
+
+
+    def __init__(self,
+                 title = "",
+                 scroll_region_height = 8):
+        """
+        see ScrollRegion.__init__()
+        """
+        ## ----- instance variables -----
+        self.__scroll_region_height = scroll_region_height
+        # ScrollRegion instance this region is rendered to (created at first
+        # render in the render thread)
+        self.__scroll_region = None
+        self.__title = title
+        self.__title_changed = True
+
+        # latest lines added since last frame (only as many as can be shown
+        # below any title) and total number of lines added since last frame
+        self.__pending_lines = deque(maxlen = scroll_region_height
+                                              - (title != ""))
+        self.__pending_count = 0
+        ## ------------------------------
+
+        with BufferedScrollRegion.__lock:
+            BufferedScrollRegion.__buffered_regions_list.append(self)
+
+
+    def SetTitle(self, title):
+        """
+        Buffers scroll region title for the next frame (see
+        ScrollRegion.SetTitle())
+        """
+        with BufferedScrollRegion.__lock:
+            if title != self.__title:
+                self.__title = title
+                self.__title_changed = True
+
+
+    def AddLine(self, line, scroll_delay_s = 0):
+        """
+        Buffers line string for the next frame (scroll_delay_s is ignored -
+        it's here to match ScrollRegion.AddLine())
+        """
+        with BufferedScrollRegion.__lock:
+            self.__pending_lines.append(line)
+            self.__pending_count += 1
+
+
+    @classmethod
+    def Render(cls):
+        """
+        Draw a frame: print lines and titles buffered since the last frame
+        to all regions (normally called by the render thread)
+        """
+        # take buffered frame data under lock, then draw outside the lock so
+        # a slow terminal never blocks AddLine()/SetTitle() callers
+        frame = []
+        with cls.__lock:
+            for r in cls.__buffered_regions_list:
+                lines = list(r.__pending_lines)
+                skipped = r.__pending_count - len(lines)
+                frame.append((r, lines, skipped, r.__title, r.__title_changed))
+                r.__pending_lines.clear()
+                r.__pending_count = 0
+                r.__title_changed = False
+
+        # write the whole frame to the terminal at once
+        ScrollRegion.BeginUpdate()
+        for r, lines, skipped, title, title_changed in frame:
+            if r.__scroll_region is None:
+                r.__scroll_region = ScrollRegion(title,
+                                                 r.__scroll_region_height)
+                title_changed = False
+            if skipped > 0:
+                # keep room for the skipped lines indicator (which includes
+                # the line it displaces)
+                r.__scroll_region.AddLine(
+                  f"{ANSI_yellow_bg} … skipped {skipped + 1} lines … {ANSI_color_reset}",
+                  0)
+                lines = lines[1:]
+            for line in lines:
+                r.__scroll_region.AddLine(line, 0)
+            if title_changed:
+                r.__scroll_region.SetTitle(title)
+        ScrollRegion.EndUpdate()
+
+
+    @classmethod
+    def StartRendering(cls, frame_rate = 10):
+        """
+        Start a daemon thread that calls Render() frame_rate times a second
+        """
+        def render_loop():
+            frame_period_s = 1 / frame_rate
+            while not cls.__stop_rendering.wait(frame_period_s):
+                cls.Render()
+
+        # ScrollRegions are created in the render thread, so install the
+        # terminal size watcher from this (main) thread first
+        ScrollRegion.WatchTerminalSize()
+
+        cls.__stop_rendering.clear()
+        cls.__render_thread = threading.Thread(target = render_loop,
+                                               daemon = True)
+        cls.__render_thread.start()
+
+
+    @classmethod
+    def StopRendering(cls):
+        """
+        Stop the render thread and draw a final frame so nothing buffered is
+        left undisplayed
+        """
+        if cls.__render_thread is not None:
+            cls.__stop_rendering.set()
+            cls.__render_thread.join()
+            cls.__render_thread = None
+        cls.Render()